@@ -0,0 +1,484 @@
+"""
+CSS, JS y fuentes servidos por la propia app, sin CDN.
+
+`flask --app app construir-activos` arma los paquetes de PAQUETES a partir de
+static/ y de las copias de Bootstrap y Bootstrap Icons en static/vendor/ (con
+--descargar las baja de jsDelivr la primera vez; después la construcción no
+necesita red):
+
+- del CSS de Bootstrap y de los íconos quedan solo las reglas cuyas clases
+  aparecen en las plantillas, el JS o el código Python (las clases que agrega
+  el JS de Bootstrap salen de su propio código);
+- el CSS y el JS propios se minifican;
+- cada archivo se guarda con un hash del contenido en el nombre, junto con
+  sus versiones .gz y, si está instalado el módulo brotli, .br;
+- manifest.json relaciona cada paquete con su archivo actual.
+
+La ruta /activos/<archivo> sirve la versión comprimida que acepte el cliente
+con `Cache-Control: immutable` por un año: un archivo nunca cambia, y cada
+build nuevo cambia el nombre. Mientras no haya un build, activos() devuelve
+los archivos sueltos (Bootstrap desde el CDN) para que la app funcione igual
+en desarrollo; en producción verificar() lo trata como un error de deploy,
+salvo que ACTIVOS_CDN lo permita.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import urllib.request
+
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # opcional: sin él solo se generan las variantes .gz
+    brotli = None
+
+# Valores por defecto, sobreescribibles por app.config o variables de entorno
+DEFAULT_CONFIG = {
+    'ACTIVOS_DIR': '',                   # vacío = <static>/dist
+    'ACTIVOS_MAX_AGE': 365 * 24 * 3600,  # segundos de caché de los archivos con hash
+    'ACTIVOS_CDN': 0,                    # 1 = en producción, sin build, usar el CDN en vez de fallar
+}
+
+BOOTSTRAP = '5.3.0'
+ICONOS = '1.10.0'
+# Copias locales en static/vendor/ y su origen
+DESCARGAS = {
+    'vendor/bootstrap.min.css': f'https://cdn.jsdelivr.net/npm/bootstrap@{BOOTSTRAP}/dist/css/bootstrap.min.css',
+    'vendor/bootstrap.bundle.min.js': f'https://cdn.jsdelivr.net/npm/bootstrap@{BOOTSTRAP}/dist/js/bootstrap.bundle.min.js',
+    'vendor/bootstrap-icons.css': f'https://cdn.jsdelivr.net/npm/bootstrap-icons@{ICONOS}/font/bootstrap-icons.css',
+    'vendor/fonts/bootstrap-icons.woff2':
+        f'https://cdn.jsdelivr.net/npm/bootstrap-icons@{ICONOS}/font/fonts/bootstrap-icons.woff2',
+    'vendor/fonts/bootstrap-icons.woff':
+        f'https://cdn.jsdelivr.net/npm/bootstrap-icons@{ICONOS}/font/fonts/bootstrap-icons.woff',
+}
+# Paquete -> archivos de static/ que lo forman, en orden
+PAQUETES = {
+    'app.css': ('vendor/bootstrap.min.css', 'vendor/bootstrap-icons.css', 'css/style.css'),
+    'app.js': ('vendor/bootstrap.bundle.min.js', 'js/main.js'),
+    'bootstrap.js': ('vendor/bootstrap.bundle.min.js',),
+}
+# CSS de terceros del que se quitan las reglas sin uso
+PURGAR = ('vendor/bootstrap.min.css', 'vendor/bootstrap-icons.css')
+COMPRIMIBLES = ('.css', '.js', '.svg', '.json')
+MANIFIESTO = 'manifest.json'
+
+_CADENA = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+_CSS_COMENTARIOS = re.compile(rf'({_CADENA})|/\*.*?\*/', re.S)
+_CSS_PARTES = re.compile(rf'({_CADENA})|([^"\']+)', re.S)
+_CSS_URL = re.compile(r'url\(\s*(["\']?)([^)"\']+)\1\s*\)')
+_CLASE = re.compile(r'\.(-?[A-Za-z_][\w-]*)')
+_PALABRA = re.compile(r'[A-Za-z_][\w-]*')
+# Prefijos de clases armadas en plantillas o JS: bg-{{ ... }}, alert-${tipo}
+_PREFIJO = re.compile(r'([A-Za-z][\w-]*-)(?:\{\{|\$\{)')
+
+
+def _config_value(app, key):
+    """Variable de entorno, si existe; si no, app.config"""
+    return os.environ.get(key, app.config.get(key, DEFAULT_CONFIG[key]))
+
+
+def directorio(app=None):
+    app = app or current_app
+    return _config_value(app, 'ACTIVOS_DIR') or os.path.join(app.static_folder, 'dist')
+
+
+# Minificación ---------------------------------------------------------------
+
+def minificar_css(css):
+    """Quitar comentarios y espacios innecesarios, sin tocar las cadenas"""
+    css = _CSS_COMENTARIOS.sub(lambda m: m.group(1) or '', css)
+    partes = []
+    for cadena, resto in _CSS_PARTES.findall(css):
+        if cadena:
+            partes.append(cadena)
+            continue
+        resto = re.sub(r'\s+', ' ', resto)
+        resto = re.sub(r'\s*([{};,])\s*', r'\1', resto)
+        partes.append(resto.replace(';}', '}'))
+    return ''.join(partes).strip()
+
+
+def _fin_cadena(texto, i):
+    """Posición siguiente al cierre de la cadena que empieza en i"""
+    comilla = texto[i]
+    i += 1
+    while i < len(texto):
+        if texto[i] == '\\':
+            i += 2
+            continue
+        if texto[i] == comilla or (texto[i] == '\n' and comilla != '`'):
+            return i + 1
+        if comilla == '`' and texto.startswith('${', i):
+            i = _fin_expresion(texto, i + 2)
+            continue
+        i += 1
+    return i
+
+
+def _fin_expresion(texto, i):
+    """Posición siguiente a la llave que cierra un ${...} de una plantilla"""
+    profundidad = 1
+    while i < len(texto):
+        c = texto[i]
+        if c in '"\'`':
+            i = _fin_cadena(texto, i)
+            continue
+        if c == '{':
+            profundidad += 1
+        elif c == '}':
+            profundidad -= 1
+            if profundidad == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def _fin_regex(texto, i):
+    i += 1
+    en_clase = False
+    while i < len(texto) and texto[i] != '\n':
+        c = texto[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '[':
+            en_clase = True
+        elif c == ']':
+            en_clase = False
+        elif c == '/' and not en_clase:
+            i += 1
+            while i < len(texto) and (texto[i].isalnum() or texto[i] == '_'):
+                i += 1
+            return i
+        i += 1
+    return i
+
+
+_ANTES_DE_REGEX = set('(,=:[!&|?{};+-*%<>~^')
+_PALABRAS_ANTES_DE_REGEX = ('return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'void', 'delete', 'new')
+
+
+def minificar_js(js):
+    """Quitar comentarios, sangría y líneas vacías.
+
+    Es deliberadamente conservador: respeta cadenas, plantillas y expresiones
+    regulares y conserva los saltos de línea, así la inserción automática de
+    punto y coma sigue funcionando igual.
+    """
+    salida = []
+    i, n = 0, len(js)
+    while i < n:
+        c = js[i]
+        if c in '"\'`':
+            fin = _fin_cadena(js, i)
+            salida.append(js[i:fin])
+            i = fin
+        elif js.startswith('//', i):
+            while i < n and js[i] != '\n':
+                i += 1
+        elif js.startswith('/*', i):
+            fin = js.find('*/', i + 2)
+            i = n if fin < 0 else fin + 2
+            salida.append(' ')
+        elif c == '/':
+            previo = ''.join(salida).rstrip()
+            if not previo or previo[-1] in _ANTES_DE_REGEX or previo.endswith(_PALABRAS_ANTES_DE_REGEX):
+                fin = _fin_regex(js, i)
+                salida.append(js[i:fin])
+                i = fin
+            else:
+                salida.append(c)
+                i += 1
+        elif c in ' \t\r\n':
+            inicio = i
+            while i < n and js[i] in ' \t\r\n':
+                i += 1
+            salida.append('\n' if '\n' in js[inicio:i] else ' ')
+        else:
+            salida.append(c)
+            i += 1
+    lineas = (linea.strip() for linea in ''.join(salida).split('\n'))
+    return '\n'.join(linea for linea in lineas if linea)
+
+
+# Reglas sin uso -------------------------------------------------------------
+
+def clases_usadas(rutas):
+    """Palabras y prefijos dinámicos que aparecen en los archivos indicados"""
+    palabras, prefijos = set(), set()
+    for ruta in rutas:
+        with open(ruta, encoding='utf-8', errors='replace') as archivo:
+            texto = archivo.read()
+        palabras.update(_PALABRA.findall(texto))
+        prefijos.update(_PREFIJO.findall(texto))
+    return palabras, prefijos
+
+
+def _clase_usada(clase, palabras, prefijos):
+    return clase in palabras or any(
+        clase.startswith(prefijo) and clase[len(prefijo):] in palabras for prefijo in prefijos)
+
+
+def _selector_usado(selector, palabras, prefijos):
+    # Lo que está dentro de :not() o de [atributo] no exige que la clase exista
+    selector = re.sub(r'\[[^\]]*\]', '', selector)
+    selector = re.sub(r':not\([^()]*\)', '', selector)
+    return all(_clase_usada(clase, palabras, prefijos) for clase in _CLASE.findall(selector))
+
+
+def _reglas(css):
+    """(preludio, cuerpo) de cada regla de primer nivel; cuerpo None en sentencias como @charset"""
+    i, inicio, n = 0, 0, len(css)
+    while i < n:
+        c = css[i]
+        if c in '"\'':
+            i = _fin_cadena(css, i)
+            continue
+        if c == ';':
+            yield css[inicio:i].strip(), None
+            inicio = i + 1
+        elif c == '{':
+            profundidad, j = 1, i + 1
+            while j < n and profundidad:
+                if css[j] in '"\'':
+                    j = _fin_cadena(css, j)
+                    continue
+                profundidad += {'{': 1, '}': -1}.get(css[j], 0)
+                j += 1
+            yield css[inicio:i].strip(), css[i + 1:j - 1]
+            inicio = i = j
+            continue
+        i += 1
+
+
+def _separar(selectores):
+    """Selectores separados por comas, sin cortar dentro de paréntesis"""
+    partes, profundidad, actual = [], 0, ''
+    for c in selectores:
+        if c == ',' and profundidad == 0:
+            partes.append(actual)
+            actual = ''
+            continue
+        profundidad += {'(': 1, ')': -1}.get(c, 0)
+        actual += c
+    return partes + [actual]
+
+
+def purgar_css(css, palabras, prefijos):
+    """CSS minificado sin las reglas cuyos selectores usan clases que no aparecen"""
+    salida = []
+    for preludio, cuerpo in _reglas(css):
+        if cuerpo is None:
+            # @charset solo vale al principio del archivo y el paquete ya es UTF-8
+            if preludio and not preludio.startswith('@charset'):
+                salida.append(preludio + ';')
+        elif preludio.startswith(('@media', '@supports', '@layer', '@container')):
+            interior = purgar_css(cuerpo, palabras, prefijos)
+            if interior:
+                salida.append(f'{preludio}{{{interior}}}')
+        elif preludio.startswith('@'):
+            salida.append(f'{preludio}{{{cuerpo}}}')
+        else:
+            usados = [s for s in _separar(preludio) if _selector_usado(s, palabras, prefijos)]
+            if usados:
+                salida.append(f"{','.join(usados)}{{{cuerpo}}}")
+    return ''.join(salida)
+
+
+# Construcción ---------------------------------------------------------------
+
+def descargar(static_dir, timeout=30):
+    """Bajar los archivos de DESCARGAS que falten; devuelve los descargados"""
+    bajados = []
+    for destino, url in DESCARGAS.items():
+        ruta = os.path.join(static_dir, destino)
+        if os.path.exists(ruta):
+            continue
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with urllib.request.urlopen(url, timeout=timeout) as respuesta:
+            datos = respuesta.read()
+        temporal = f'{ruta}.{os.getpid()}.tmp'
+        with open(temporal, 'wb') as archivo:
+            archivo.write(datos)
+        os.replace(temporal, ruta)
+        bajados.append(destino)
+    return bajados
+
+
+def _con_hash(nombre, datos):
+    base, extension = os.path.splitext(nombre)
+    return f'{base}.{hashlib.sha256(datos).hexdigest()[:12]}{extension}'
+
+
+def _escribir(destino, nombre, datos):
+    """Guardar un archivo (y sus variantes comprimidas) si todavía no existe"""
+    ruta = os.path.join(destino, nombre)
+    escritos = [nombre]
+    if not os.path.exists(ruta):
+        with open(ruta, 'wb') as archivo:
+            archivo.write(datos)
+    if nombre.endswith(COMPRIMIBLES):
+        variantes = [('.gz', lambda: gzip.compress(datos, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variantes.append(('.br', lambda: brotli.compress(datos, quality=11)))
+        for sufijo, comprimir in variantes:
+            if not os.path.exists(ruta + sufijo):
+                with open(ruta + sufijo, 'wb') as archivo:
+                    archivo.write(comprimir())
+            escritos.append(nombre + sufijo)
+    return escritos
+
+
+def _css(static_dir, fuente, destino, palabras, prefijos, escritos):
+    """CSS de un archivo, purgado si es de terceros y con sus url() copiadas con hash"""
+    with open(os.path.join(static_dir, fuente), encoding='utf-8') as archivo:
+        css = minificar_css(archivo.read())
+    if fuente in PURGAR:
+        css = purgar_css(css, palabras, prefijos)
+    else:
+        css = re.sub(r'@charset\s*("[^"]*"|\'[^\']*\')\s*;', '', css)
+
+    def copiar(coincide):
+        url = coincide.group(2)
+        if url.startswith(('data:', 'http:', 'https:', '/', '#')):
+            return coincide.group(0)
+        ruta = os.path.normpath(os.path.join(static_dir, os.path.dirname(fuente), url.split('?')[0].split('#')[0]))
+        with open(ruta, 'rb') as archivo:
+            datos = archivo.read()
+        nombre = _con_hash(os.path.basename(ruta), datos)
+        escritos.update(_escribir(destino, nombre, datos))
+        return f'url("{nombre}")'
+
+    return _CSS_URL.sub(copiar, css)
+
+
+def construir(static_dir, fuentes_clases, destino=None, limpiar=False):
+    """Armar los paquetes en `destino` (por defecto static/dist) y escribir el manifiesto.
+
+    `fuentes_clases` son los archivos (plantillas, JS, módulos) donde se buscan
+    las clases usadas. Devuelve {paquete: {archivo, bytes, gzip, brotli, original}}.
+    """
+    destino = destino or os.path.join(static_dir, 'dist')
+    os.makedirs(destino, exist_ok=True)
+    faltan = [fuente for fuentes in PAQUETES.values() for fuente in fuentes
+              if not os.path.exists(os.path.join(static_dir, fuente))]
+    if faltan:
+        raise FileNotFoundError(f'Faltan {", ".join(sorted(set(faltan)))} (usar --descargar)')
+
+    vendor_js = [os.path.join(static_dir, fuente) for fuente in DESCARGAS if fuente.endswith('.js')]
+    palabras, prefijos = clases_usadas(list(fuentes_clases) + vendor_js)
+
+    manifiesto, resumen, escritos = {}, {}, set()
+    for paquete, fuentes in PAQUETES.items():
+        original, partes = 0, []
+        for fuente in fuentes:
+            ruta = os.path.join(static_dir, fuente)
+            original += os.path.getsize(ruta)
+            if paquete.endswith('.css'):
+                partes.append(_css(static_dir, fuente, destino, palabras, prefijos, escritos))
+            else:
+                with open(ruta, encoding='utf-8') as archivo:
+                    js = archivo.read()
+                partes.append(js if fuente.endswith('.min.js') else minificar_js(js))
+        # El ; separa scripts que no terminan en punto y coma
+        datos = ('\n' if paquete.endswith('.css') else '\n;\n').join(partes).encode('utf-8')
+        nombre = _con_hash(paquete, datos)
+        escritos.update(_escribir(destino, nombre, datos))
+        manifiesto[paquete] = nombre
+        resumen[paquete] = {
+            'archivo': nombre,
+            'original': original,
+            'bytes': len(datos),
+            'gzip': os.path.getsize(os.path.join(destino, nombre + '.gz')),
+            'brotli': os.path.getsize(os.path.join(destino, nombre + '.br')) if brotli is not None else None,
+        }
+
+    temporal = os.path.join(destino, f'{MANIFIESTO}.{os.getpid()}.tmp')
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(manifiesto, archivo, indent=2, sort_keys=True)
+    os.replace(temporal, os.path.join(destino, MANIFIESTO))
+
+    if limpiar:
+        # Sin limpiar, las páginas ya abiertas siguen encontrando los archivos del build anterior
+        for nombre in os.listdir(destino):
+            if nombre != MANIFIESTO and nombre not in escritos:
+                os.remove(os.path.join(destino, nombre))
+    return resumen
+
+
+# Integración con Flask -------------------------------------------------------
+
+def manifiesto(app=None):
+    """Paquete -> archivo con hash del último build, o {} si no hay build (una lectura por proceso)"""
+    app = app or current_app
+    carpeta = directorio(app)
+    cargado = app.extensions.get('activos')
+    if cargado is None or cargado[0] != carpeta:
+        try:
+            with open(os.path.join(carpeta, MANIFIESTO), encoding='utf-8') as archivo:
+                datos = json.load(archivo)
+        except FileNotFoundError:
+            datos = {}
+        cargado = (carpeta, datos)
+        app.extensions['activos'] = cargado
+    return cargado[1]
+
+
+def verificar(app):
+    """Fallar si la app no corre en debug ni en tests y no hay build de los activos.
+
+    Sin manifest.json las páginas cargan Bootstrap desde el CDN sin que nadie
+    lo note; gunicorn.conf.py llama a esta función al arrancar cada worker y
+    asgi.py al arrancar el proceso.
+    """
+    if app.debug or app.testing or int(_config_value(app, 'ACTIVOS_CDN')) or manifiesto(app):
+        return
+    raise RuntimeError(f'No hay {MANIFIESTO} en {directorio(app)}: correr '
+                       '`flask --app app construir-activos --descargar` en el build (o definir ACTIVOS_CDN=1)')
+
+
+def reset(app=None):
+    """Volver a leer el manifiesto en el próximo uso (tras un build con la app corriendo)"""
+    (app or current_app).extensions.pop('activos', None)
+
+
+def activos(paquete):
+    """URLs a incluir en la página para un paquete de PAQUETES"""
+    nombre = manifiesto().get(paquete)
+    if nombre is not None:
+        return [url_for('activos', nombre=nombre)]
+    cdn = {fuente: url for fuente, url in DESCARGAS.items() if not fuente.startswith('vendor/fonts/')}
+    return [cdn.get(fuente) or url_for('static', filename=fuente) for fuente in PAQUETES[paquete]]
+
+
+def servir(nombre):
+    """Archivo del build, en la mejor codificación que acepte el cliente"""
+    carpeta = directorio()
+    enviar, codificacion = nombre, None
+    if nombre.endswith(COMPRIMIBLES):
+        for sufijo, encoding in (('.br', 'br'), ('.gz', 'gzip')):
+            if request.accept_encodings[encoding] and os.path.isfile(os.path.join(carpeta, nombre + sufijo)):
+                enviar, codificacion = nombre + sufijo, encoding
+                break
+    max_age = int(_config_value(current_app, 'ACTIVOS_MAX_AGE'))
+    response = send_from_directory(carpeta, enviar, mimetype=mimetypes.guess_type(nombre)[0],
+                                   max_age=max_age, conditional=True)
+    if codificacion is not None:
+        response.headers['Content-Encoding'] = codificacion
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """Registrar la configuración, la ruta /activos/ y la función activos() de las plantillas"""
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+    app.add_url_rule('/activos/<path:nombre>', 'activos', servir)
+    app.add_template_global(activos, 'activos')
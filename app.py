@@ -1,126 +1,239 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, g, Response, stream_with_context, stream_template
 import sqlite3
 from datetime import datetime
+import glob
+import hmac
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 
+import click
+
+import activos
+import busqueda
+import claves
+import compresion
+import condicional
+import consola
+import consultas_lentas
+import cuentas
+import db
+import exportar
+import fragmentos
+import importar
+import informes
+import listados
+import metricas
+import migrations
+import shards
+import solapamientos
+import tareas
+import usage
+import vencimientos
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'tu_clave_secreta_aqui')
 
 # Configuración de la base de datos
-DATABASE = 'alquileres.db'
+DATABASE = os.environ.get('DATABASE', 'alquileres.db')
+app.config['DATABASE'] = DATABASE
+db.init_app(app)
+claves.init_app(app)
+metricas.init_app(app)
+consultas_lentas.init_app(app)
+shards.init_app(app)
+fragmentos.init_app(app, lambda: get_db_connection())  # definida más abajo
+activos.init_app(app)
+compresion.init_app(app)
+
+# Filas por página de los listados (se puede cambiar con ?por_pagina=N)
+app.config['LISTADO_POR_PAGINA'] = int(os.environ.get('LISTADO_POR_PAGINA', listados.DEFAULT_PAGE_SIZE))
+# Enviar los listados a medida que se renderizan las filas (stream_template)
+app.config['LISTADO_STREAMING'] = bool(int(os.environ.get('LISTADO_STREAMING', 0)))
+
+# Segundos que un usuario puede quedar en la caché de cuentas sin releerse
+cuentas.configurar(ttl=int(os.environ.get('CUENTAS_CACHE_TTL', cuentas.DEFAULT_TTL)))
+
+# Cada cuántos segundos se vencen contratos dentro de la app (0 = solo por CLI/cron)
+app.config['TAREAS_INTERVALO'] = int(os.environ.get('TAREAS_INTERVALO', 0))
 
 def init_db():
-    """Inicializar la base de datos"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    # Tabla de paquetes
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS paquetes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT NOT NULL,
-            max_propiedades INTEGER NOT NULL,
-            max_inquilinos INTEGER NOT NULL,
-            max_contratos INTEGER NOT NULL,
-            precio DECIMAL(10,2) NOT NULL,
-            descripcion TEXT,
-            activo BOOLEAN DEFAULT 1
-        )
-    ''')
-    
-    # Tabla de usuarios
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            nombre TEXT NOT NULL,
-            apellido TEXT NOT NULL,
-            paquete_id INTEGER,
-            fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            ultimo_acceso TIMESTAMP,
-            activo BOOLEAN DEFAULT 1,
-            es_admin BOOLEAN DEFAULT 0,
-            FOREIGN KEY (paquete_id) REFERENCES paquetes (id)
-        )
-    ''')
-    
-    # Tabla de propiedades (agregar user_id)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS propiedades (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            direccion TEXT NOT NULL,
-            tipo TEXT NOT NULL,
-            habitaciones INTEGER,
-            baños INTEGER,
-            precio DECIMAL(10,2),
-            estado TEXT DEFAULT 'disponible',
-            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES usuarios (id)
-        )
-    ''')
-    
-    # Tabla de inquilinos (agregar user_id)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS inquilinos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            nombre TEXT NOT NULL,
-            apellido TEXT NOT NULL,
-            email TEXT,
-            telefono TEXT,
-            dni TEXT,
-            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES usuarios (id)
-        )
-    ''')
-    
-    # Tabla de contratos (agregar user_id)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS contratos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            propiedad_id INTEGER,
-            inquilino_id INTEGER,
-            fecha_inicio DATE,
-            fecha_fin DATE,
-            precio_mensual DECIMAL(10,2),
-            estado TEXT DEFAULT 'activo',
-            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES usuarios (id),
-            FOREIGN KEY (propiedad_id) REFERENCES propiedades (id),
-            FOREIGN KEY (inquilino_id) REFERENCES inquilinos (id)
-        )
-    ''')
-    
-    # Insertar paquetes por defecto
-    cursor.execute('''
-        INSERT OR IGNORE INTO paquetes (id, nombre, max_propiedades, max_inquilinos, max_contratos, precio, descripcion)
-        VALUES 
-        (1, 'Básico', 5, 10, 15, 0.00, 'Ideal para comenzar. Hasta 5 propiedades, 10 inquilinos y 15 contratos.'),
-        (2, 'Profesional', 20, 50, 100, 29.99, 'Para profesionales. Hasta 20 propiedades, 50 inquilinos y 100 contratos.'),
-        (3, 'Empresarial', 100, 250, 500, 99.99, 'Para empresas. Hasta 100 propiedades, 250 inquilinos y 500 contratos.')
-    ''')
-    
-    # Crear usuario admin por defecto
-    admin_password = generate_password_hash('admin123')
-    cursor.execute('''
-        INSERT OR IGNORE INTO usuarios (id, username, email, password_hash, nombre, apellido, paquete_id, es_admin)
-        VALUES (1, 'admin', 'admin@alquileres.com', ?, 'Administrador', 'Sistema', 3, 1)
-    ''', (admin_password,))
-    
-    conn.commit()
-    conn.close()
+    """Inicializar la base de datos aplicando las migraciones pendientes.
+
+    También deja cargada la tabla paquetes en la caché de cuentas.
+    """
+    version = migrations.migrate(app.config['DATABASE'])
+    cuentas.reset()
+    with app.app_context():
+        cuentas.cargar_paquetes(get_catalogo())
+    return version
+
+@app.cli.command('migrar')
+def migrar_command():
+    """Aplicar las migraciones pendientes del esquema"""
+    version = init_db()
+    print(f'Esquema en la versión {version}')
+
+@app.cli.command('verificar-uso')
+@click.option('--reparar', is_flag=True, help='Recalcular tenant_usage si hay diferencias.')
+def verificar_uso_command(reparar):
+    """Comparar los contadores de tenant_usage con los datos reales"""
+    with app.app_context():
+        total = 0
+        for _, conn in bases_de_datos():
+            diferencias = usage.verify(conn)
+            total += len(diferencias)
+            for user_id, contador, guardado, real in diferencias:
+                print(f'Usuario {user_id}: {contador} guardado={guardado} real={real}')
+            if diferencias and reparar:
+                conn.execute('BEGIN IMMEDIATE')
+                usage.rebuild(conn)
+                conn.commit()
+        if not total:
+            print('Los contadores de uso coinciden con los datos.')
+        elif reparar:
+            print(f'Contadores recalculados ({total} diferencias corregidas).')
+
+@app.cli.command('verificar-informes')
+@click.option('--reparar', is_flag=True, help='Recalcular renta_mensual si hay diferencias.')
+def verificar_informes_command(reparar):
+    """Comparar el resumen mensual de rentas (renta_mensual) con los contratos"""
+    with app.app_context():
+        total = 0
+        for _, conn in bases_de_datos():
+            diferencias = informes.verify(conn)
+            total += len(diferencias)
+            for user_id, mes, propiedad_id, guardado, real in diferencias:
+                print(f'Usuario {user_id}, {mes}, propiedad {propiedad_id}: guardado={guardado} real={real}')
+            if diferencias and reparar:
+                conn.execute('BEGIN IMMEDIATE')
+                informes.rebuild(conn)
+                conn.commit()
+        if not total:
+            print('El resumen mensual coincide con los contratos.')
+        elif reparar:
+            print(f'Resumen mensual recalculado ({total} diferencias corregidas).')
+
+@app.cli.command('auditar-contratos')
+def auditar_contratos_command():
+    """Listar los contratos superpuestos sobre una misma propiedad"""
+    with app.app_context():
+        total = 0
+        for _, conn in bases_de_datos():
+            for anterior, siguiente in solapamientos.auditar(conn):
+                total += 1
+                print(f"Propiedad {anterior['propiedad_id']} (usuario {anterior['user_id']}): "
+                      f"contrato #{anterior['id']} ({anterior['fecha_inicio']} a {anterior['fecha_fin']}) "
+                      f"se superpone con #{siguiente['id']} ({siguiente['fecha_inicio']} a {siguiente['fecha_fin']})")
+        print(f'{total} superposiciones encontradas.' if total else 'No hay contratos superpuestos.')
+
+@app.cli.command('vencer-contratos')
+@click.option('--lote', default=tareas.TAMANO_LOTE, show_default=True, help='Contratos por transacción.')
+def vencer_contratos_command(lote):
+    """Vencer los contratos activos con fecha de fin pasada y liberar sus propiedades"""
+    with app.app_context():
+        carpeta = shards.directorio(app)
+        bases = (conn for _, conn in shards.conexiones(carpeta)) if carpeta else None
+        # Los fragmentos de los workers se renuevan solos: los triggers suben la marca de tenant_usage
+        stats = tareas.ejecutar_vencimientos(get_catalogo(), tamano_lote=lote, bases=bases)
+    print(f"{stats['contratos']} contratos vencidos, {stats['propiedades']} propiedades liberadas "
+          f"({stats['lotes']} lotes, lock máximo {stats['lock_max_ms']} ms)")
+
+@app.cli.command('sincronizar-uso')
+def sincronizar_uso_command():
+    """Copiar al catálogo el uso de cada shard, para ordenar la consola de usuarios"""
+    carpeta = shards.directorio(app)
+    if not carpeta:
+        print('Sin SHARDS_DIR la consola lee tenant_usage directamente; no hay nada que copiar.')
+        return
+    with app.app_context():
+        copiados = consola.sincronizar(get_catalogo(), shards.conexiones(carpeta))
+    print(f'Uso de {copiados} usuarios copiado al catálogo.')
+
+@app.cli.command('dividir-shards')
+@click.option('--destino', help='Directorio de los shards (por defecto SHARDS_DIR).')
+@click.option('--limpiar', is_flag=True, help='Borrar de la base principal los datos copiados.')
+def dividir_shards_command(destino, limpiar):
+    """Repartir los datos de la base principal en una base por usuario"""
+    destino = destino or shards.directorio(app)
+    if not destino:
+        raise click.UsageError('Indica --destino o define SHARDS_DIR.')
+    totales = shards.dividir(app.config['DATABASE'], destino, limpiar=limpiar)
+    print(f"{totales['shards']} shards creados en {destino}: {totales['propiedades']} propiedades, "
+          f"{totales['inquilinos']} inquilinos, {totales['contratos']} contratos.")
+    if totales['salteados']:
+        print(f"Usuarios salteados porque su shard ya tenía datos: {totales['salteados']}")
+
+@app.cli.command('construir-activos')
+@click.option('--descargar', is_flag=True, help='Bajar antes Bootstrap y Bootstrap Icons a static/vendor/.')
+@click.option('--limpiar', is_flag=True, help='Borrar los archivos de builds anteriores.')
+def construir_activos_command(descargar, limpiar):
+    """Armar los paquetes CSS/JS con hash y comprimidos en static/dist"""
+    if descargar:
+        for destino in activos.descargar(app.static_folder):
+            print(f'Descargado {destino}')
+    fuentes = glob.glob(os.path.join(app.root_path, app.template_folder, '*.html'))
+    fuentes += glob.glob(os.path.join(app.static_folder, 'js', '*.js'))
+    fuentes += glob.glob(os.path.join(app.root_path, '*.py'))
+    try:
+        resumen = activos.construir(app.static_folder, fuentes, destino=activos.directorio(app), limpiar=limpiar)
+    except FileNotFoundError as e:
+        raise click.ClickException(str(e))
+    for paquete, datos in resumen.items():
+        brotli = f", brotli {datos['brotli']:,}" if datos['brotli'] is not None else ''
+        print(f"{paquete} -> {datos['archivo']}: {datos['original']:,} -> {datos['bytes']:,} bytes "
+              f"(gzip {datos['gzip']:,}{brotli})")
+
+def iniciar_tareas():
+    """Arrancar el thread de tareas periódicas del proceso, si está configurado"""
+    intervalo = app.config['TAREAS_INTERVALO']
+    if intervalo <= 0:
+        return None
+    carpeta = shards.directorio(app)
+    bases = (lambda: (conn for _, conn in shards.conexiones(carpeta))) if carpeta else None
+    programador = tareas.Programador(db.get_pool(app), intervalo, bases=bases)
+    programador.start()
+    return programador
 
 def get_db_connection():
-    """Obtener conexión a la base de datos"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Obtener la conexión a los datos (propiedades, inquilinos, contratos) del request actual.
+
+    La conexión sale del pool del proceso y se devuelve automáticamente al
+    terminar el request, por lo que no debe cerrarse manualmente. En modo
+    shards es la base del usuario de la sesión.
+    """
+    router = shards.get_router(app)
+    if router is not None and 'user_id' in session:
+        return db.get_db(router.pool(session['user_id']))
+    return db.get_db()
+
+def get_catalogo():
+    """Conexión a la base principal: usuarios, paquetes y tareas.
+
+    Sin shards es la misma conexión que get_db_connection().
+    """
+    return db.get_db()
+
+def bases_de_datos():
+    """(user_id, conexión) de cada base con datos de usuarios.
+
+    Sin shards hay una sola, la principal (user_id None); con shards, una por
+    usuario, abiertas de a una.
+    """
+    carpeta = shards.directorio(app)
+    if carpeta:
+        yield from shards.conexiones(carpeta)
+    else:
+        yield None, get_catalogo()
+
+def usuario_actual():
+    """Usuario de la sesión con los datos de su paquete (o None).
+
+    Se resuelve una vez por request desde la caché de cuentas; solo consulta
+    la base si el usuario no está en la caché.
+    """
+    if 'usuario' not in g:
+        g.usuario = cuentas.get_usuario(get_catalogo, session['user_id']) if 'user_id' in session else None
+    return g.usuario
 
 def login_required(f):
     """Decorador para requerir login"""
@@ -129,6 +242,11 @@ def login_required(f):
         if 'user_id' not in session:
             flash('Debes iniciar sesión para acceder a esta página.', 'warning')
             return redirect(url_for('login'))
+        usuario = usuario_actual()
+        if not usuario or not usuario['activo']:
+            session.clear()
+            flash('Tu cuenta no está activa.', 'warning')
+            return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
 
@@ -140,47 +258,32 @@ def admin_required(f):
             flash('Debes iniciar sesión para acceder a esta página.', 'warning')
             return redirect(url_for('login'))
         
-        conn = get_db_connection()
-        user = conn.execute('SELECT es_admin FROM usuarios WHERE id = ?', (session['user_id'],)).fetchone()
-        conn.close()
+        user = usuario_actual()
         
-        if not user or not user['es_admin']:
+        if not user or not user['activo'] or not user['es_admin']:
             flash('No tienes permisos para acceder a esta página.', 'danger')
             return redirect(url_for('index'))
         return f(*args, **kwargs)
     return decorated_function
 
+@metricas.medido('check_limits')
 def check_limits(user_id, tipo):
-    """Verificar límites del paquete del usuario"""
-    conn = get_db_connection()
-    
-    # Obtener información del usuario y su paquete
-    user_info = conn.execute('''
-        SELECT u.id, p.max_propiedades, p.max_inquilinos, p.max_contratos
-        FROM usuarios u
-        JOIN paquetes p ON u.paquete_id = p.id
-        WHERE u.id = ?
-    ''', (user_id,)).fetchone()
+    """Verificar límites del paquete del usuario.
+
+    El límite sale de la caché de cuentas y el uso de tenant_usage. Para que
+    el control y el alta no puedan intercalarse con otro request, quien
+    inserta debe abrir la transacción (BEGIN IMMEDIATE) antes de llamar a
+    esta función.
+    """
+    if tipo not in ('propiedades', 'inquilinos', 'contratos'):
+        return False, "Tipo no válido"
     
+    user_info = cuentas.get_usuario(get_catalogo, user_id)
     if not user_info:
-        conn.close()
         return False, "Usuario no encontrado"
     
-    # Contar elementos actuales
-    if tipo == 'propiedades':
-        current_count = conn.execute('SELECT COUNT(*) FROM propiedades WHERE user_id = ?', (user_id,)).fetchone()[0]
-        max_count = user_info['max_propiedades']
-    elif tipo == 'inquilinos':
-        current_count = conn.execute('SELECT COUNT(*) FROM inquilinos WHERE user_id = ?', (user_id,)).fetchone()[0]
-        max_count = user_info['max_inquilinos']
-    elif tipo == 'contratos':
-        current_count = conn.execute('SELECT COUNT(*) FROM contratos WHERE user_id = ?', (user_id,)).fetchone()[0]
-        max_count = user_info['max_contratos']
-    else:
-        conn.close()
-        return False, "Tipo no válido"
-    
-    conn.close()
+    current_count = usage.get_usage(get_db_connection(), user_id)[tipo]
+    max_count = user_info[f'max_{tipo}']
     
     if current_count >= max_count:
         return False, f"Has alcanzado el límite de {tipo} para tu paquete ({max_count})"
@@ -194,21 +297,30 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        conn = get_db_connection()
+        conn = get_catalogo()
         user = conn.execute('SELECT * FROM usuarios WHERE username = ? AND activo = 1', (username,)).fetchone()
-        conn.close()
         
-        if user and check_password_hash(user['password_hash'], password):
+        try:
+            # El hash se verifica en el pool de procesos de claves
+            valida, nuevo_hash = claves.get_hasher().verificar(user['password_hash'], password) if user else (False, None)
+        except claves.ColaLlena:
+            flash('El servidor está ocupado. Intenta nuevamente en unos segundos.', 'warning')
+            return render_template('login.html'), 503
+        
+        if valida:
             session['user_id'] = user['id']
             session['username'] = user['username']
             session['nombre'] = user['nombre']
             session['es_admin'] = user['es_admin']
+            cuentas.invalidar_usuario(user['id'])
             
-            # Actualizar último acceso
-            conn = get_db_connection()
-            conn.execute('UPDATE usuarios SET ultimo_acceso = CURRENT_TIMESTAMP WHERE id = ?', (user['id'],))
+            # Actualizar último acceso (y el hash, si se generó con otros parámetros)
+            if nuevo_hash:
+                conn.execute('UPDATE usuarios SET ultimo_acceso = CURRENT_TIMESTAMP, password_hash = ? WHERE id = ?',
+                             (nuevo_hash, user['id']))
+            else:
+                conn.execute('UPDATE usuarios SET ultimo_acceso = CURRENT_TIMESTAMP WHERE id = ?', (user['id'],))
             conn.commit()
-            conn.close()
             
             flash(f'¡Bienvenido, {user["nombre"]}!', 'success')
             return redirect(url_for('index'))
@@ -240,101 +352,146 @@ def register():
             flash('Las contraseñas no coinciden.', 'danger')
             return render_template('register.html')
         
-        conn = get_db_connection()
+        conn = get_catalogo()
         
         # Verificar si el usuario ya existe
         existing_user = conn.execute('SELECT id FROM usuarios WHERE username = ? OR email = ?', (username, email)).fetchone()
         if existing_user:
             flash('El usuario o email ya existe.', 'danger')
-            conn.close()
             return render_template('register.html')
         
         # Crear nuevo usuario
-        password_hash = generate_password_hash(password)
+        try:
+            password_hash = claves.get_hasher().generar(password)
+        except claves.ColaLlena:
+            flash('El servidor está ocupado. Intenta nuevamente en unos segundos.', 'warning')
+            return render_template('register.html', paquetes=cuentas.get_paquetes(get_catalogo)), 503
         conn.execute('''
             INSERT INTO usuarios (username, email, password_hash, nombre, apellido, paquete_id)
             VALUES (?, ?, ?, ?, ?, ?)
         ''', (username, email, password_hash, nombre, apellido, paquete_id))
         conn.commit()
-        conn.close()
         
         flash('Usuario registrado correctamente. Puedes iniciar sesión.', 'success')
         return redirect(url_for('login'))
     
-    # Obtener paquetes disponibles
-    conn = get_db_connection()
-    paquetes = conn.execute('SELECT * FROM paquetes WHERE activo = 1').fetchall()
-    conn.close()
+    # Paquetes disponibles (desde la caché de cuentas)
+    paquetes = cuentas.get_paquetes(get_catalogo)
     
     return render_template('register.html', paquetes=paquetes)
 
 @app.route('/')
 @login_required
 def index():
-    """Página principal con dashboard"""
-    conn = get_db_connection()
-    
-    # Estadísticas básicas del usuario
-    total_propiedades = conn.execute('SELECT COUNT(*) FROM propiedades WHERE user_id = ?', (session['user_id'],)).fetchone()[0]
-    propiedades_disponibles = conn.execute('SELECT COUNT(*) FROM propiedades WHERE user_id = ? AND estado = "disponible"', (session['user_id'],)).fetchone()[0]
-    total_inquilinos = conn.execute('SELECT COUNT(*) FROM inquilinos WHERE user_id = ?', (session['user_id'],)).fetchone()[0]
-    contratos_activos = conn.execute('SELECT COUNT(*) FROM contratos WHERE user_id = ? AND estado = "activo"', (session['user_id'],)).fetchone()[0]
-    
-    # Propiedades recientes
-    propiedades_recientes = conn.execute('''
-        SELECT * FROM propiedades 
-        WHERE user_id = ?
-        ORDER BY fecha_creacion DESC 
-        LIMIT 5
-    ''', (session['user_id'],)).fetchall()
-    
-    # Contratos recientes
-    contratos_recientes = conn.execute('''
-        SELECT c.*, p.direccion, i.nombre, i.apellido 
-        FROM contratos c
-        JOIN propiedades p ON c.propiedad_id = p.id
-        JOIN inquilinos i ON c.inquilino_id = i.id
-        WHERE c.user_id = ?
-        ORDER BY c.fecha_creacion DESC 
-        LIMIT 5
-    ''', (session['user_id'],)).fetchall()
-    
-    # Información del paquete del usuario
-    user_info = conn.execute('''
-        SELECT u.*, p.nombre as paquete_nombre, p.max_propiedades, p.max_inquilinos, p.max_contratos, p.precio as paquete_precio
-        FROM usuarios u
-        JOIN paquetes p ON u.paquete_id = p.id
-        WHERE u.id = ?
-    ''', (session['user_id'],)).fetchone()
-    
-    conn.close()
-    
-    return render_template('index.html', 
-                         total_propiedades=total_propiedades,
-                         propiedades_disponibles=propiedades_disponibles,
-                         total_inquilinos=total_inquilinos,
-                         contratos_activos=contratos_activos,
-                         propiedades_recientes=propiedades_recientes,
-                         contratos_recientes=contratos_recientes,
-                         user_info=user_info)
+    """Página principal con dashboard.
+
+    Cada bloque sale de la caché de fragmentos; las consultas solo se hacen
+    para los bloques que hay que volver a renderizar.
+    """
+    user_id = session['user_id']
+    # Información del paquete del usuario (caché de cuentas)
+    user_info = usuario_actual()
+    uso = {}
+
+    def contadores():
+        # Estadísticas básicas del usuario (contadores de tenant_usage)
+        if not uso:
+            datos = usage.get_usage(get_db_connection(), user_id)
+            uso.update(total_propiedades=datos['propiedades'],
+                       propiedades_disponibles=datos['propiedades_disponibles'],
+                       total_inquilinos=datos['inquilinos'],
+                       contratos_activos=datos['contratos_activos'])
+        return uso
+
+    def propiedades_recientes():
+        rows = get_db_connection().execute(listados.PROPIEDADES_RECIENTES_SQL, (user_id, 5)).fetchall()
+        return render_template('_dashboard_propiedades.html', propiedades_recientes=rows)
+
+    def contratos_recientes():
+        rows = get_db_connection().execute(listados.CONTRATOS_RECIENTES_SQL, (user_id, 5)).fetchall()
+        return render_template('_dashboard_contratos.html', contratos_recientes=rows)
+
+    def por_vencer():
+        # Contratos activos que vencen en los próximos 30 días
+        return render_template('_por_vencer.html',
+                               contratos_por_vencer=vencimientos.por_vencer(get_db_connection(), user_id))
+
+    def informe():
+        # Ingresos y ocupación por mes (resumen de renta_mensual)
+        datos = informes.mensual(get_db_connection(), user_id, *informes.periodo({}))
+        return render_template('_dashboard_informe.html', informe=datos)
+
+    bloques = {
+        'estadisticas': fragmentos.obtener(
+            'dashboard_estadisticas', lambda: render_template('_dashboard_estadisticas.html', **contadores())),
+        'propiedades': fragmentos.obtener('dashboard_propiedades', propiedades_recientes),
+        'contratos': fragmentos.obtener('dashboard_contratos', contratos_recientes),
+        'por_vencer': fragmentos.obtener('dashboard_por_vencer', por_vencer),
+        'informe': fragmentos.obtener('dashboard_informe', informe),
+        'paquete': fragmentos.obtener(
+            'dashboard_paquete',
+            lambda: render_template('_dashboard_paquete.html', user_info=user_info, **contadores()),
+            user_info['paquete_id']),
+    }
+    return render_template('index.html', bloques=bloques)
+
+def _streaming():
+    # Flask guarda la cookie de sesión antes de enviar el body: con mensajes
+    # flash pendientes la página se arma entera para que se consuman
+    return app.config['LISTADO_STREAMING'] and '_flashes' not in session
+
+def _paginar(*args, **kwargs):
+    """Página de un listado; en streaming, con las filas leídas del cursor mientras se renderizan"""
+    if _streaming():
+        return listados.paginar_cursor(*args, **kwargs)
+    return listados.paginar(*args, **kwargs)
+
+def _plantilla(nombre, **contexto):
+    """HTML de una plantilla, o un iterador de trozos si el listado va en streaming"""
+    if _streaming():
+        return stream_template(nombre, **contexto)
+    return render_template(nombre, **contexto)
+
+def _listado(plantilla, tabla, **contexto):
+    """Página de un listado con su tabla (trozos de fragmentos.trozos)"""
+    if _streaming():
+        return app.response_class(listados.en_bloques(stream_template(plantilla, tabla=tabla, **contexto)))
+    return render_template(plantilla, tabla=tabla, **contexto)
 
 # Rutas para propiedades
 @app.route('/propiedades')
 @login_required
+@condicional.validar(get_db_connection)
 def propiedades():
-    """Lista de propiedades"""
-    conn = get_db_connection()
-    propiedades = conn.execute('SELECT * FROM propiedades WHERE user_id = ? ORDER BY fecha_creacion DESC', (session['user_id'],)).fetchall()
-    conn.close()
-    return render_template('propiedades.html', propiedades=propiedades)
+    """Lista de propiedades (paginada; la tabla sale de la caché de fragmentos)"""
+    filtros = listados.filtros_propiedades(request.args)
+    por_pagina = listados.page_size(request.args, app.config['LISTADO_POR_PAGINA'])
+    despues, antes = request.args.get('despues'), request.args.get('antes')
+
+    def tabla():
+        conn = get_db_connection()
+        sql, params = listados.consulta_propiedades(session['user_id'], filtros)
+        propiedades = _paginar(conn, sql, params, por_pagina, despues=despues, antes=antes)
+        resumen = listados.resumen_propiedades(conn, session['user_id'])
+        return _plantilla('_tabla_propiedades.html', propiedades=propiedades, filtros=filtros, resumen=resumen)
+
+    tabla = fragmentos.trozos('tabla_propiedades', tabla, sorted(filtros.items()), por_pagina, despues, antes)
+    return _listado('propiedades.html', tabla, filtros=filtros, por_pagina=por_pagina)
 
 @app.route('/propiedades/nueva', methods=['GET', 'POST'])
 @login_required
 def nueva_propiedad():
     """Crear nueva propiedad"""
+    conn = get_db_connection()
+    if request.method == 'POST':
+        # El control del límite y el alta van en la misma transacción, así dos
+        # envíos simultáneos no pueden superar el máximo del paquete
+        conn.execute('BEGIN IMMEDIATE')
+    
     # Verificar límites del paquete
     can_add, message = check_limits(session['user_id'], 'propiedades')
     if not can_add:
+        conn.rollback()
         flash(message, 'warning')
         return redirect(url_for('propiedades'))
     
@@ -351,18 +508,18 @@ def nueva_propiedad():
                 flash('Por favor completa todos los campos requeridos.', 'danger')
                 return render_template('nueva_propiedad.html')
             
-            conn = get_db_connection()
             conn.execute('''
                 INSERT INTO propiedades (user_id, direccion, tipo, habitaciones, baños, precio)
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (session['user_id'], direccion, tipo, habitaciones, baños, precio))
             conn.commit()
-            conn.close()
             
             flash('Propiedad creada exitosamente', 'success')
             return redirect(url_for('propiedades'))
-        except Exception as e:
-            print(f"Error al crear propiedad: {e}")
+        except Exception:
+            conn.rollback()
+            app.logger.exception('Error al crear propiedad')
+            metricas.registrar_error()
             flash('Error al crear la propiedad. Por favor intenta nuevamente.', 'danger')
             return render_template('nueva_propiedad.html')
     
@@ -388,13 +545,11 @@ def editar_propiedad(id):
             WHERE id = ? AND user_id = ?
         ''', (direccion, tipo, habitaciones, baños, precio, estado, id, session['user_id']))
         conn.commit()
-        conn.close()
         
         flash('Propiedad actualizada exitosamente', 'success')
         return redirect(url_for('propiedades'))
     
     propiedad = conn.execute('SELECT * FROM propiedades WHERE id = ? AND user_id = ?', (id, session['user_id'])).fetchone()
-    conn.close()
     
     if propiedad is None:
         flash('Propiedad no encontrada', 'error')
@@ -409,7 +564,6 @@ def eliminar_propiedad(id):
     conn = get_db_connection()
     conn.execute('DELETE FROM propiedades WHERE id = ? AND user_id = ?', (id, session['user_id']))
     conn.commit()
-    conn.close()
     
     flash('Propiedad eliminada exitosamente', 'success')
     return redirect(url_for('propiedades'))
@@ -417,20 +571,37 @@ def eliminar_propiedad(id):
 # Rutas para inquilinos
 @app.route('/inquilinos')
 @login_required
+@condicional.validar(get_db_connection)
 def inquilinos():
-    """Lista de inquilinos"""
-    conn = get_db_connection()
-    inquilinos = conn.execute('SELECT * FROM inquilinos WHERE user_id = ? ORDER BY fecha_creacion DESC', (session['user_id'],)).fetchall()
-    conn.close()
-    return render_template('inquilinos.html', inquilinos=inquilinos)
+    """Lista de inquilinos (paginada; la tabla sale de la caché de fragmentos)"""
+    filtros = listados.filtros_inquilinos(request.args)
+    por_pagina = listados.page_size(request.args, app.config['LISTADO_POR_PAGINA'])
+    despues, antes = request.args.get('despues'), request.args.get('antes')
+
+    def tabla():
+        conn = get_db_connection()
+        sql, params = listados.consulta_inquilinos(session['user_id'], filtros)
+        inquilinos = _paginar(conn, sql, params, por_pagina, despues=despues, antes=antes)
+        resumen = listados.resumen_inquilinos(conn, session['user_id'])
+        return _plantilla('_tabla_inquilinos.html', inquilinos=inquilinos, filtros=filtros, resumen=resumen)
+
+    tabla = fragmentos.trozos('tabla_inquilinos', tabla, sorted(filtros.items()), por_pagina, despues, antes)
+    return _listado('inquilinos.html', tabla, filtros=filtros, por_pagina=por_pagina)
 
 @app.route('/inquilinos/nuevo', methods=['GET', 'POST'])
 @login_required
 def nuevo_inquilino():
     """Crear nuevo inquilino"""
+    conn = get_db_connection()
+    if request.method == 'POST':
+        # El control del límite y el alta van en la misma transacción, así dos
+        # envíos simultáneos no pueden superar el máximo del paquete
+        conn.execute('BEGIN IMMEDIATE')
+    
     # Verificar límites del paquete
     can_add, message = check_limits(session['user_id'], 'inquilinos')
     if not can_add:
+        conn.rollback()
         flash(message, 'warning')
         return redirect(url_for('inquilinos'))
     
@@ -447,18 +618,18 @@ def nuevo_inquilino():
                 flash('Por favor completa todos los campos requeridos.', 'danger')
                 return render_template('nuevo_inquilino.html')
             
-            conn = get_db_connection()
             conn.execute('''
                 INSERT INTO inquilinos (user_id, nombre, apellido, email, telefono, dni)
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (session['user_id'], nombre, apellido, email, telefono, dni))
             conn.commit()
-            conn.close()
             
             flash('Inquilino creado exitosamente', 'success')
             return redirect(url_for('inquilinos'))
-        except Exception as e:
-            print(f"Error al crear inquilino: {e}")
+        except Exception:
+            conn.rollback()
+            app.logger.exception('Error al crear inquilino')
+            metricas.registrar_error()
             flash('Error al crear el inquilino. Por favor intenta nuevamente.', 'danger')
             return render_template('nuevo_inquilino.html')
     
@@ -483,13 +654,11 @@ def editar_inquilino(id):
             WHERE id = ? AND user_id = ?
         ''', (nombre, apellido, email, telefono, dni, id, session['user_id']))
         conn.commit()
-        conn.close()
         
         flash('Inquilino actualizado exitosamente', 'success')
         return redirect(url_for('inquilinos'))
     
     inquilino = conn.execute('SELECT * FROM inquilinos WHERE id = ? AND user_id = ?', (id, session['user_id'])).fetchone()
-    conn.close()
     
     if inquilino is None:
         flash('Inquilino no encontrado', 'error')
@@ -504,7 +673,6 @@ def eliminar_inquilino(id):
     conn = get_db_connection()
     conn.execute('DELETE FROM inquilinos WHERE id = ? AND user_id = ?', (id, session['user_id']))
     conn.commit()
-    conn.close()
     
     flash('Inquilino eliminado exitosamente', 'success')
     return redirect(url_for('inquilinos'))
@@ -512,32 +680,66 @@ def eliminar_inquilino(id):
 # Rutas para contratos
 @app.route('/contratos')
 @login_required
+@condicional.validar(get_db_connection)
 def contratos():
-    """Lista de contratos"""
+    """Lista de contratos (paginada; la tabla sale de la caché de fragmentos)"""
+    filtros = listados.filtros_contratos(request.args)
+    por_pagina = listados.page_size(request.args, app.config['LISTADO_POR_PAGINA'])
+    despues, antes = request.args.get('despues'), request.args.get('antes')
+
+    def tabla():
+        conn = get_db_connection()
+        sql, params = listados.consulta_contratos(session['user_id'], filtros)
+        contratos = _paginar(conn, sql, params, por_pagina, despues=despues, antes=antes, alias='c')
+        resumen = listados.resumen_contratos(conn, session['user_id'])
+        por_vencer = vencimientos.por_vencer(conn, session['user_id'])
+        return _plantilla('_tabla_contratos.html', contratos=contratos, filtros=filtros, resumen=resumen,
+                         contratos_por_vencer=por_vencer)
+
+    tabla = fragmentos.trozos('tabla_contratos', tabla, sorted(filtros.items()), por_pagina, despues, antes)
+    return _listado('contratos.html', tabla, filtros=filtros, por_pagina=por_pagina)
+
+@app.route('/contratos/por-vencer')
+@login_required
+def contratos_por_vencer():
+    """Contratos activos que vencen en los próximos ?dias=N días (JSON)"""
     conn = get_db_connection()
-    contratos = conn.execute('''
-        SELECT c.*, p.direccion, i.nombre, i.apellido 
-        FROM contratos c
-        JOIN propiedades p ON c.propiedad_id = p.id
-        JOIN inquilinos i ON c.inquilino_id = i.id
-        WHERE c.user_id = ?
-        ORDER BY c.fecha_creacion DESC
-    ''', (session['user_id'],)).fetchall()
-    conn.close()
-    return render_template('contratos.html', contratos=contratos)
+    dias = vencimientos.dias_param(request.args.get('dias'))
+    rows = vencimientos.por_vencer(conn, session['user_id'], dias)
+    return jsonify(dias=dias, contratos=vencimientos.serializar(rows, url_for))
+
+# Informes
+@app.route('/informes/mensual')
+@login_required
+def informe_mensual():
+    """Ingreso esperado, ocupación e ingreso que vence por mes, ?desde=AAAA-MM&hasta=AAAA-MM (JSON)"""
+    conn = get_db_connection()
+    return jsonify(informes.mensual(conn, session['user_id'], *informes.periodo(request.args)))
+
+@app.route('/informes/vacancia')
+@login_required
+def informe_vacancia():
+    """Días ocupados y vacantes de cada propiedad en el período (JSON)"""
+    conn = get_db_connection()
+    return jsonify(informes.vacancia(conn, session['user_id'], *informes.periodo(request.args)))
 
 @app.route('/contratos/nuevo', methods=['GET', 'POST'])
 @login_required
 def nuevo_contrato():
     """Crear nuevo contrato"""
+    conn = get_db_connection()
+    if request.method == 'POST':
+        # El control del límite y el alta van en la misma transacción, así dos
+        # envíos simultáneos no pueden superar el máximo del paquete
+        conn.execute('BEGIN IMMEDIATE')
+    
     # Verificar límites del paquete
     can_add, message = check_limits(session['user_id'], 'contratos')
     if not can_add:
+        conn.rollback()
         flash(message, 'warning')
         return redirect(url_for('contratos'))
     
-    conn = get_db_connection()
-    
     if request.method == 'POST':
         try:
             propiedad_id = request.form['propiedad_id']
@@ -549,7 +751,13 @@ def nuevo_contrato():
             # Validar datos requeridos
             if not propiedad_id or not inquilino_id or not fecha_inicio or not fecha_fin or not precio_mensual:
                 flash('Por favor completa todos los campos requeridos.', 'danger')
-                return render_template('nuevo_contrato.html', propiedades=propiedades, inquilinos=inquilinos)
+                return _render_nuevo_contrato(conn)
+            
+            error = _validar_periodo(conn, propiedad_id, fecha_inicio, fecha_fin)
+            if error:
+                conn.rollback()
+                flash(error, 'danger')
+                return _render_nuevo_contrato(conn)
             
             conn.execute('''
                 INSERT INTO contratos (user_id, propiedad_id, inquilino_id, fecha_inicio, fecha_fin, precio_mensual)
@@ -560,20 +768,34 @@ def nuevo_contrato():
             conn.execute('UPDATE propiedades SET estado = "alquilada" WHERE id = ? AND user_id = ?', (propiedad_id, session['user_id']))
             
             conn.commit()
-            conn.close()
             
             flash('Contrato creado exitosamente', 'success')
             return redirect(url_for('contratos'))
-        except Exception as e:
-            print(f"Error al crear contrato: {e}")
+        except Exception:
+            conn.rollback()
+            app.logger.exception('Error al crear contrato')
+            metricas.registrar_error()
             flash('Error al crear el contrato. Por favor intenta nuevamente.', 'danger')
-            return render_template('nuevo_contrato.html', propiedades=propiedades, inquilinos=inquilinos)
-    
-    propiedades = conn.execute('SELECT * FROM propiedades WHERE estado = "disponible" AND user_id = ?', (session['user_id'],)).fetchall()
-    inquilinos = conn.execute('SELECT * FROM inquilinos WHERE user_id = ?', (session['user_id'],)).fetchall()
-    conn.close()
+            return _render_nuevo_contrato(conn)
     
-    return render_template('nuevo_contrato.html', propiedades=propiedades, inquilinos=inquilinos)
+    return _render_nuevo_contrato(conn)
+
+def _validar_periodo(conn, propiedad_id, fecha_inicio, fecha_fin, contrato_id=None):
+    """Mensaje de error si el período es inválido o se superpone con otro contrato de la propiedad"""
+    if fecha_fin < fecha_inicio:
+        return 'La fecha de fin no puede ser anterior a la de inicio.'
+    solapado = solapamientos.buscar_solapado(conn, propiedad_id, fecha_inicio, fecha_fin, excluir_id=contrato_id)
+    if solapado:
+        return (f"La propiedad ya tiene el contrato #{solapado['id']} entre {solapado['fecha_inicio']} "
+                f"y {solapado['fecha_fin']}, que se superpone con esas fechas.")
+    return None
+
+def _render_nuevo_contrato(conn):
+    """Formulario de nuevo contrato; los selectores se completan desde /buscar"""
+    uso = usage.get_usage(conn, session['user_id'])
+    return render_template('nuevo_contrato.html',
+                         hay_propiedades=uso['propiedades_disponibles'] > 0,
+                         hay_inquilinos=uso['inquilinos'] > 0)
 
 @app.route('/contratos/<int:id>/editar', methods=['GET', 'POST'])
 @login_required
@@ -587,13 +809,34 @@ def editar_contrato(id):
         precio_mensual = request.form['precio_mensual']
         estado = request.form['estado']
         
-        conn.execute('''
-            UPDATE contratos 
-            SET fecha_inicio = ?, fecha_fin = ?, precio_mensual = ?, estado = ?
-            WHERE id = ? AND user_id = ?
-        ''', (fecha_inicio, fecha_fin, precio_mensual, estado, id, session['user_id']))
-        conn.commit()
-        conn.close()
+        # Como en nuevo_contrato, el control de superposición y el UPDATE van
+        # en la misma transacción, así otro request no puede intercalarse
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            actual = conn.execute('SELECT propiedad_id FROM contratos WHERE id = ? AND user_id = ?',
+                                  (id, session['user_id'])).fetchone()
+            error = None
+            if actual and estado != 'cancelado':
+                error = _validar_periodo(conn, actual['propiedad_id'], fecha_inicio, fecha_fin, contrato_id=id)
+            if error:
+                conn.rollback()
+                flash(error, 'danger')
+                return redirect(url_for('editar_contrato', id=id))
+            
+            conn.execute('''
+                UPDATE contratos 
+                SET fecha_inicio = ?, fecha_fin = ?, precio_mensual = ?, estado = ?
+                WHERE id = ? AND user_id = ?
+            ''', (fecha_inicio, fecha_fin, precio_mensual, estado, id, session['user_id']))
+            conn.commit()
+        except sqlite3.IntegrityError:
+            # Los triggers de la base rechazaron el período (p. ej. por un dato heredado)
+            conn.rollback()
+            flash('Las fechas se superponen con otro contrato de la propiedad.', 'danger')
+            return redirect(url_for('editar_contrato', id=id))
+        except Exception:
+            conn.rollback()
+            raise
         
         flash('Contrato actualizado exitosamente', 'success')
         return redirect(url_for('contratos'))
@@ -606,15 +849,11 @@ def editar_contrato(id):
         WHERE c.id = ? AND c.user_id = ?
     ''', (id, session['user_id'])).fetchone()
     
-    propiedades = conn.execute('SELECT * FROM propiedades WHERE user_id = ?', (session['user_id'],)).fetchall()
-    inquilinos = conn.execute('SELECT * FROM inquilinos WHERE user_id = ?', (session['user_id'],)).fetchall()
-    conn.close()
-    
     if contrato is None:
         flash('Contrato no encontrado', 'error')
         return redirect(url_for('contratos'))
     
-    return render_template('editar_contrato.html', contrato=contrato, propiedades=propiedades, inquilinos=inquilinos)
+    return render_template('editar_contrato.html', contrato=contrato)
 
 @app.route('/contratos/<int:id>/eliminar', methods=['POST'])
 @login_required
@@ -632,11 +871,286 @@ def eliminar_contrato(id):
         conn.execute('UPDATE propiedades SET estado = "disponible" WHERE id = ? AND user_id = ?', (contrato['propiedad_id'], session['user_id']))
     
     conn.commit()
-    conn.close()
     
     flash('Contrato eliminado exitosamente', 'success')
     return redirect(url_for('contratos'))
 
+# Exportación
+@app.route('/<any(propiedades, inquilinos, contratos):recurso>/exportar')
+@login_required
+def exportar_datos(recurso):
+    """Descargar un listado completo en CSV o XLSX, con los mismos filtros del listado"""
+    formato = request.args.get('formato', 'csv')
+    if formato not in exportar.FORMATOS:
+        formato = 'csv'
+    
+    filtros = getattr(listados, f'filtros_{recurso}')(request.args)
+    sql, params = getattr(listados, f'consulta_{recurso}')(session['user_id'], filtros)
+    alias = 'c' if recurso == 'contratos' else ''
+    
+    @stream_with_context
+    def generar():
+        # La conexión se toma dentro del generador: el contexto sigue activo
+        # mientras se envía la respuesta y el teardown la devuelve al pool
+        conn = get_db_connection()
+        filas = exportar.filas(conn, sql, params, exportar.COLUMNAS[recurso], alias=alias)
+        yield from exportar.stream(formato, recurso, filas)
+    
+    nombre = f"{recurso}_{datetime.now().strftime('%Y%m%d')}.{formato}"
+    return Response(generar(), mimetype=exportar.FORMATOS[formato],
+                    headers={'Content-Disposition': f'attachment; filename="{nombre}"'})
+
+# Importación
+@app.route('/<any(propiedades, inquilinos):recurso>/importar', methods=['GET', 'POST'])
+@login_required
+def importar_datos(recurso):
+    """Alta masiva desde un CSV, en una sola transacción"""
+    if request.method == 'GET':
+        return render_template('importar.html', recurso=recurso)
+
+    archivo = request.files.get('archivo')
+    if not archivo or not archivo.filename:
+        flash('Selecciona un archivo CSV para importar.', 'danger')
+        return render_template('importar.html', recurso=recurso)
+
+    conn = get_db_connection()
+    try:
+        filas = importar.leer_csv(archivo.stream, recurso)
+        resultado = importar.importar(conn, session['user_id'], recurso, filas, usuario_actual()[f'max_{recurso}'])
+    except importar.ErrorImportacion as e:
+        flash(str(e), 'danger')
+        return render_template('importar.html', recurso=recurso)
+
+    if resultado.importadas:
+        flash(f'Se importaron {resultado.importadas} {recurso} '
+              f'({resultado.filas_por_segundo} filas por segundo)', 'success')
+    if resultado.errores:
+        flash(f'{resultado.procesadas - resultado.importadas} filas no se importaron. Revisa el detalle.', 'warning')
+    return render_template('importar.html', recurso=recurso, resultado=resultado)
+
+# API JSON (con ETag: ver condicional.py)
+def _api_pagina(sql, params, filtros, alias=''):
+    """Página de resultados de la API; ?por_pagina=N, ?despues=... y ?antes=... como en los listados"""
+    pagina = listados.paginar(get_db_connection(), sql, params,
+                              listados.page_size(request.args, app.config['LISTADO_POR_PAGINA']),
+                              despues=request.args.get('despues'), antes=request.args.get('antes'), alias=alias)
+    return jsonify(datos=listados.serializar(pagina), filtros=filtros, por_pagina=pagina.por_pagina,
+                   siguiente=pagina.siguiente, anterior=pagina.anterior)
+
+def _api_detalle(sql, params, columna, id, mensaje):
+    row = get_db_connection().execute(f'{sql} AND {columna} = ?', list(params) + [id]).fetchone()
+    if row is None:
+        return jsonify(error=mensaje), 404
+    return jsonify(listados.serializar([row])[0])
+
+@app.route('/api/propiedades')
+@login_required
+@condicional.validar(get_db_connection)
+def api_propiedades():
+    """Propiedades del usuario (JSON paginado; filtros ?estado y ?tipo)"""
+    filtros = listados.filtros_propiedades(request.args)
+    return _api_pagina(*listados.consulta_propiedades(session['user_id'], filtros), filtros)
+
+@app.route('/api/propiedades/<int:id>')
+@login_required
+@condicional.validar(get_db_connection)
+def api_propiedad(id):
+    """Una propiedad del usuario (JSON)"""
+    return _api_detalle(*listados.consulta_propiedades(session['user_id'], {}), 'id', id,
+                        'Propiedad no encontrada')
+
+@app.route('/api/inquilinos')
+@login_required
+@condicional.validar(get_db_connection)
+def api_inquilinos():
+    """Inquilinos del usuario (JSON paginado)"""
+    filtros = listados.filtros_inquilinos(request.args)
+    return _api_pagina(*listados.consulta_inquilinos(session['user_id'], filtros), filtros)
+
+@app.route('/api/inquilinos/<int:id>')
+@login_required
+@condicional.validar(get_db_connection)
+def api_inquilino(id):
+    """Un inquilino del usuario (JSON)"""
+    return _api_detalle(*listados.consulta_inquilinos(session['user_id'], {}), 'id', id,
+                        'Inquilino no encontrado')
+
+@app.route('/api/contratos')
+@login_required
+@condicional.validar(get_db_connection)
+def api_contratos():
+    """Contratos del usuario con dirección, inquilino y días restantes (JSON paginado; filtros ?estado, ?desde, ?hasta)"""
+    filtros = listados.filtros_contratos(request.args)
+    return _api_pagina(*listados.consulta_contratos(session['user_id'], filtros), filtros, alias='c')
+
+@app.route('/api/contratos/<int:id>')
+@login_required
+@condicional.validar(get_db_connection)
+def api_contrato(id):
+    """Un contrato del usuario con dirección, inquilino y días restantes (JSON)"""
+    return _api_detalle(*listados.consulta_contratos(session['user_id'], {}), 'c.id', id,
+                        'Contrato no encontrado')
+
+# Búsqueda
+@app.route('/buscar')
+@login_required
+def buscar():
+    """Búsqueda de texto completo en los datos del usuario (JSON)"""
+    conn = get_db_connection()
+    texto = request.args.get('q', '').strip()
+    entidad = request.args.get('tipo')
+    if entidad not in busqueda.ENTIDADES:
+        entidad = None
+    solo_disponibles = request.args.get('disponibles') == '1'
+    try:
+        limite = max(1, min(int(request.args.get('limite', busqueda.DEFAULT_LIMIT)), busqueda.MAX_LIMIT))
+    except ValueError:
+        limite = busqueda.DEFAULT_LIMIT
+    
+    if texto:
+        rows = busqueda.buscar(conn, session['user_id'], texto, entidad, solo_disponibles, limite)
+    else:
+        # Sin texto: últimos registros, para abrir los selectores del formulario
+        rows = busqueda.recientes(conn, session['user_id'], entidad, solo_disponibles, limite)
+    
+    return jsonify(resultados=busqueda.serializar(rows, url_for))
+
+# Rutas de administración
+@app.route('/admin/db/pool')
+@admin_required
+def admin_db_pool():
+    """Contadores del pool de conexiones del proceso actual"""
+    stats = db.get_pool().stats()
+    lectura = db.get_pool_lectura()
+    if lectura is not None:
+        stats['lectura'] = lectura.stats()
+    router = shards.get_router(app)
+    if router is not None:
+        stats['shards'] = router.stats()
+    return jsonify(stats)
+
+@app.route('/admin/fragmentos')
+@admin_required
+def admin_fragmentos():
+    """Tamaño de la caché de fragmentos y aciertos por fragmento del proceso actual"""
+    return jsonify(fragmentos.stats(app))
+
+@app.route('/admin/tareas')
+@admin_required
+def admin_tareas():
+    """Últimas ejecuciones de la tarea de vencimiento de contratos"""
+    conn = get_catalogo()
+    return jsonify(ejecuciones=[dict(row) for row in tareas.ultimas(conn)])
+
+@app.route('/admin/uso')
+@admin_required
+def admin_uso():
+    """Uso de cada usuario y totales, sumando todas las bases (una por usuario en modo shards)"""
+    carpeta = shards.directorio(app)
+    por_usuario = []
+    for user_id, conn in bases_de_datos():
+        filas = [dict(row) for row in conn.execute('SELECT * FROM tenant_usage ORDER BY user_id')]
+        if carpeta:
+            for fila in filas:
+                fila['bytes'] = os.path.getsize(shards.ruta(carpeta, user_id))
+        por_usuario.extend(filas)
+    por_usuario.sort(key=lambda fila: fila['user_id'])
+    totales = {contador: sum(fila[contador] for fila in por_usuario) for contador in usage.CONTADORES}
+    return jsonify(modo='shards' if carpeta else 'unica', usuarios=len(por_usuario),
+                   totales=totales, por_usuario=por_usuario)
+
+@app.route('/admin/usuarios')
+@admin_required
+def admin_usuarios():
+    """Consola de usuarios: paquete, uso frente a los límites, último acceso y contratos activos"""
+    con_shards = bool(shards.directorio(app))
+    filtros = consola.filtros(request.args)
+    columna, descendente = consola.orden(request.args)
+    por_pagina = listados.page_size(request.args, consola.DEFAULT_PAGE_SIZE)
+    conn = get_catalogo()
+    usuarios = consola.paginar(conn, filtros, columna, descendente, por_pagina,
+                               despues=request.args.get('despues'), antes=request.args.get('antes'),
+                               con_shards=con_shards)
+    # Parámetros que conservan la paginación y los enlaces de orden
+    parametros = dict(filtros, orden=columna, dir='desc' if descendente else 'asc')
+    return render_template('admin_usuarios.html', usuarios=usuarios, filtros=filtros, parametros=parametros,
+                           orden=columna, descendente=descendente, por_pagina=por_pagina,
+                           resumen=consola.resumen(conn, con_shards), con_shards=con_shards,
+                           paquetes=cuentas.get_paquetes(get_catalogo))
+
+@app.route('/admin/usuarios/acciones', methods=['POST'])
+@admin_required
+def admin_usuarios_acciones():
+    """Cambiar el paquete, desactivar o reactivar los usuarios elegidos, en una transacción"""
+    volver = request.form.get('volver', '')
+    if not volver.startswith('/admin/usuarios'):
+        volver = url_for('admin_usuarios')
+    accion = request.form.get('accion')
+    ids = sorted(set(request.form.getlist('ids', type=int)))
+    paquete_id = request.form.get('paquete_id', type=int)
+    if accion not in consola.ACCIONES or not ids:
+        flash('Elige una acción y al menos un usuario.', 'warning')
+        return redirect(volver)
+    if len(ids) > consola.MAX_SELECCION:
+        flash(f'Se pueden modificar hasta {consola.MAX_SELECCION} usuarios por vez.', 'warning')
+        return redirect(volver)
+    if accion == 'desactivar' and session['user_id'] in ids:
+        ids.remove(session['user_id'])
+
+    conn = get_catalogo()
+    try:
+        cambiados = consola.aplicar(conn, accion, ids, paquete_id=paquete_id)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(volver)
+    # Los límites y el estado salen de la caché de cuentas y de los fragmentos
+    for user_id in ids:
+        cuentas.invalidar_usuario(user_id)
+        fragmentos.invalidar(user_id)
+    if accion == 'paquete':
+        excedidos = consola.excedidos(conn, ids, con_shards=bool(shards.directorio(app)))
+        mensaje = f'Paquete cambiado a {cambiados} usuarios.'
+        if excedidos:
+            mensaje += f' {excedidos} usan más de lo que permite el nuevo paquete.'
+    elif accion == 'desactivar':
+        mensaje = f'{cambiados} usuarios desactivados.'
+    else:
+        mensaje = f'{cambiados} usuarios reactivados.'
+    flash(mensaje, 'success')
+    return redirect(volver)
+
+@app.route('/admin/claves')
+@admin_required
+def admin_claves():
+    """Latencia y cola del hash de contraseñas del proceso actual"""
+    return jsonify(claves.get_hasher().stats())
+
+@app.route('/admin/consultas-lentas')
+@admin_required
+def admin_consultas_lentas():
+    """Formas de consulta más lentas según el log de consultas lentas"""
+    orden = request.args.get('orden', 'max_ms')
+    limite = min(max(request.args.get('limite', 20, type=int), 1), 200)
+    formas = consultas_lentas.resumen(app, limite=limite, orden=orden)
+    return render_template('admin_consultas_lentas.html', formas=formas, orden=orden, limite=limite,
+                           umbral_ms=consultas_lentas.umbral_ms(app))
+
+def _exponer_metricas():
+    return Response(metricas.exponer(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/metrics')
+def metrics():
+    """Métricas del proceso en formato de texto de Prometheus.
+
+    Solo para administradores; un scraper sin sesión puede autenticarse con
+    el header `Authorization: Bearer <METRICS_TOKEN>` si esa variable está definida.
+    """
+    token = os.environ.get('METRICS_TOKEN')
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return _exponer_metricas()
+    return admin_required(_exponer_metricas)()
+
 if __name__ == '__main__':
     init_db()
+    iniciar_tareas()
     app.run(debug=False, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
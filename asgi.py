@@ -0,0 +1,247 @@
+"""
+Modo ASGI opcional: las mismas rutas y plantillas de app.py detrás de un
+servidor ASGI (uvicorn, hypercorn), en un solo proceso.
+
+    pip install uvicorn
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+
+Con gunicorn cada conexión ocupa un thread de un worker (o el proceso
+entero con workers sync) mientras dura: un cliente lento subiendo un CSV o
+leyendo una exportación lo retiene. Aquí el servidor atiende las conexiones en el event loop y
+la app solo ocupa un thread mientras tiene trabajo:
+
+- El body del request se lee de forma asíncrona (a memoria o, si es grande, a
+  un archivo temporal) antes de llamar a la app; un upload lento no ocupa
+  ningún thread.
+- La app corre en un ThreadPoolExecutor propio (ASGI_THREADS), donde están
+  todas las consultas a SQLite. Los hashes de contraseñas ya van a su pool de
+  procesos (claves.py).
+- La respuesta se pide de a un bloque por vez y se envía desde el event loop:
+  entre bloque y bloque el thread queda libre para otro request, así una
+  exportación a un cliente lento no retiene un thread.
+
+Cada request conserva su contexto (flask.g, request) aunque sus bloques se
+generen en threads distintos del executor.
+"""
+
+import asyncio
+import contextvars
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Valores por defecto, sobreescribibles por app.config o variables de entorno
+DEFAULT_CONFIG = {
+    'ASGI_THREADS': 32,                     # threads que ejecutan la app
+    'ASGI_MAX_BODY': 16 * 1024 * 1024,      # bytes; más grande responde 413
+    'ASGI_BODY_MEMORIA': 1024 * 1024,       # bytes de body en memoria antes de pasar a disco
+}
+
+_FIN = object()
+
+
+class AdaptadorWSGI:
+    """Aplicación ASGI que ejecuta una aplicación WSGI en un executor propio"""
+
+    def __init__(self, wsgi_app, hilos=32, max_body=16 * 1024 * 1024, body_memoria=1024 * 1024,
+                 al_iniciar=None, al_terminar=None):
+        self.wsgi_app = wsgi_app
+        self.hilos = int(hilos)
+        self.max_body = int(max_body)
+        self.body_memoria = int(body_memoria)
+        self.al_iniciar = al_iniciar
+        self.al_terminar = al_terminar
+        self.executor = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        elif scope['type'] == 'websocket':
+            # Sin websockets: se rechaza el handshake (el servidor responde 403)
+            mensaje = await receive()
+            if mensaje['type'] == 'websocket.connect':
+                await send({'type': 'websocket.close', 'code': 1000})
+        else:
+            raise ValueError(f"Tipo de conexión ASGI no soportado: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        loop = asyncio.get_running_loop()
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'lifespan.startup':
+                try:
+                    if self.al_iniciar is not None:
+                        await loop.run_in_executor(self.executor, self.al_iniciar)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensaje['type'] == 'lifespan.shutdown':
+                if self.al_terminar is not None:
+                    await loop.run_in_executor(self.executor, self.al_terminar)
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _leer_body(self, receive):
+        """Body completo en un archivo (en memoria si es chico), o None si supera max_body"""
+        body = tempfile.SpooledTemporaryFile(max_size=self.body_memoria)
+        largo = 0
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'http.disconnect':
+                body.close()
+                raise ConnectionResetError('El cliente cerró la conexión')
+            parte = mensaje.get('body', b'')
+            largo += len(parte)
+            if largo > self.max_body:
+                body.close()
+                return None, largo
+            body.write(parte)
+            if not mensaje.get('more_body', False):
+                body.seek(0)
+                return body, largo
+
+    def _environ(self, scope, body, largo):
+        raiz = scope.get('root_path', '')
+        path = scope['path']
+        if raiz and path.startswith(raiz):
+            path = path[len(raiz):]
+        servidor = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': raiz.encode('utf-8').decode('latin-1'),
+            'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': servidor[0],
+            'SERVER_PORT': str(servidor[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'CONTENT_LENGTH': str(largo),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+        for nombre, valor in scope.get('headers', []):
+            nombre, valor = nombre.decode('latin-1').upper().replace('-', '_'), valor.decode('latin-1')
+            if nombre == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = valor
+                continue
+            if nombre == 'CONTENT_LENGTH':
+                continue
+            clave = f'HTTP_{nombre}'
+            if clave in environ:
+                valor = f"{environ[clave]}{'; ' if nombre == 'COOKIE' else ','}{valor}"
+            environ[clave] = valor
+        return environ
+
+    async def _http(self, scope, receive, send):
+        try:
+            body, largo = await self._leer_body(receive)
+        except ConnectionResetError:
+            return
+        if body is None:
+            await send({'type': 'http.response.start', 'status': 413,
+                        'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+            await send({'type': 'http.response.body', 'body': b'Request demasiado grande'})
+            return
+
+        loop = asyncio.get_running_loop()
+        # Un solo contexto por request: flask.g y request siguen ahí aunque
+        # cada bloque de la respuesta se genere en otro thread del executor
+        contexto = contextvars.copy_context()
+        respuesta = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and respuesta.get('enviada'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            respuesta['status'] = int(status.split(' ', 1)[0])
+            respuesta['headers'] = [(nombre.lower().encode('latin-1'), valor.encode('latin-1'))
+                                    for nombre, valor in headers]
+            return lambda datos: respuesta.setdefault('escritos', []).append(datos)
+
+        def ejecutar(funcion, *args):
+            return loop.run_in_executor(self.executor, contexto.run, funcion, *args)
+
+        async def enviar(datos):
+            if not respuesta.get('enviada'):
+                respuesta['enviada'] = True
+                await send({'type': 'http.response.start', 'status': respuesta['status'],
+                            'headers': respuesta['headers']})
+            if datos:
+                await send({'type': 'http.response.body', 'body': datos, 'more_body': True})
+
+        resultado = None
+        try:
+            environ = self._environ(scope, body, largo)
+            resultado = await ejecutar(self.wsgi_app, environ, start_response)
+            for datos in respuesta.pop('escritos', []):
+                await enviar(datos)
+            if isinstance(resultado, (list, tuple)):
+                # Respuesta ya armada (lo habitual): no hace falta volver al executor
+                for datos in resultado:
+                    await enviar(datos)
+            else:
+                iterador = iter(resultado)
+                while True:
+                    datos = await ejecutar(next, iterador, _FIN)
+                    if datos is _FIN:
+                        break
+                    await enviar(datos)
+            await enviar(b'')
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(resultado, 'close'):
+                await ejecutar(resultado.close)
+            body.close()
+
+
+def _config_value(flask_app, key):
+    """Variable de entorno, si existe; si no, app.config"""
+    return os.environ.get(key, flask_app.config.get(key, DEFAULT_CONFIG[key]))
+
+
+def crear(flask_app=None):
+    """Aplicación ASGI para la app de app.py, con arranque y cierre por lifespan"""
+    import activos
+    import app as aplicacion
+    import db
+    import shards
+
+    flask_app = flask_app or aplicacion.app
+    tareas = []
+
+    def iniciar():
+        # Lo mismo que gunicorn.conf.py hace en el master y en cada worker:
+        # sin build de los activos el arranque falla (lifespan.startup.failed)
+        activos.verificar(flask_app)
+        aplicacion.init_db()
+        programador = aplicacion.iniciar_tareas()
+        if programador is not None:
+            tareas.append(programador)
+
+    def terminar():
+        for programador in tareas:
+            programador.detener()
+        db.reset_pool(flask_app)
+        shards.reset_router(flask_app)
+
+    return AdaptadorWSGI(
+        flask_app,
+        hilos=_config_value(flask_app, 'ASGI_THREADS'),
+        max_body=_config_value(flask_app, 'ASGI_MAX_BODY'),
+        body_memoria=_config_value(flask_app, 'ASGI_BODY_MEMORIA'),
+        al_iniciar=iniciar,
+        al_terminar=terminar,
+    )
+
+
+app = crear()
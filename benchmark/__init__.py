@@ -0,0 +1,11 @@
+"""
+Benchmark reproducible de la aplicación.
+
+- datos.generar(): base sintética con miles de usuarios repartidos entre los
+  tres paquetes, cada uno lleno hasta sus máximos, a partir de una semilla.
+- carga.ejecutar(): recorre todas las rutas de app.py a través de la app WSGI
+  con varios threads y devuelve p50/p95/p99, throughput y consultas SQL por
+  ruta, listo para guardar como JSON y comparar entre commits.
+
+Uso: python -m benchmark --help
+"""
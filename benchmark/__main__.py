@@ -0,0 +1,65 @@
+"""Línea de comandos del benchmark: python -m benchmark {generar,carga,comparar}"""
+
+import json
+import os
+import sys
+
+import click
+
+from benchmark import carga, datos
+
+
+@click.group()
+def cli():
+    """Benchmark reproducible del sistema de alquileres."""
+
+
+@cli.command()
+@click.argument('database', default='bench.db')
+@click.option('--usuarios', default=2000, show_default=True, help='Usuarios a generar.')
+@click.option('--semilla', default=42, show_default=True, help='Semilla del generador.')
+def generar(database, usuarios, semilla):
+    """Crear DATABASE con usuarios de benchmark llenos hasta los límites de su paquete."""
+    totales = datos.generar(database, usuarios=usuarios, semilla=semilla)
+    click.echo(json.dumps(totales))
+
+
+@cli.command('carga')
+@click.argument('database', default='bench.db')
+@click.option('--hilos', default=4, show_default=True, help='Threads concurrentes.')
+@click.option('--iteraciones', default=5, show_default=True, help='Sesiones completas por thread.')
+@click.option('--lecturas', type=click.FloatRange(0, 1),
+              help='Carga mixta con esta fracción de lecturas (p. ej. 0.9) en vez de sesiones completas.')
+@click.option('--operaciones', default=50, show_default=True, help='Requests por sesión en la carga mixta.')
+@click.option('--salida', type=click.Path(dir_okay=False), help='Guardar el resultado en este archivo JSON.')
+def correr_carga(database, hilos, iteraciones, lecturas, operaciones, salida):
+    """Recorrer todas las rutas sobre DATABASE y mostrar latencias por ruta."""
+    if not os.path.exists(database):
+        raise click.ClickException(f'No existe {database}; créala con "python -m benchmark generar"')
+    resumen = carga.ejecutar(database, hilos=hilos, iteraciones=iteraciones, lecturas=lecturas,
+                             operaciones=operaciones)
+    texto = json.dumps(resumen, indent=2, ensure_ascii=False)
+    if salida:
+        with open(salida, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+    click.echo(texto)
+    if resumen['fallas'] or resumen['errores']:
+        sys.exit(1)
+
+
+@cli.command()
+@click.argument('antes', type=click.File(encoding='utf-8'))
+@click.argument('despues', type=click.File(encoding='utf-8'))
+def comparar(antes, despues):
+    """Comparar el p95 por ruta de dos resultados guardados con --salida."""
+    antes, despues = json.load(antes), json.load(despues)
+    click.echo(f"{'ruta':40} {'p95 antes':>10} {'p95 después':>12} {'cambio':>8}")
+    for fila in carga.comparar(antes, despues):
+        p95_antes = f"{fila['antes']['p95_ms']:.1f}" if fila['antes'] else '-'
+        p95_despues = f"{fila['despues']['p95_ms']:.1f}" if fila['despues'] else '-'
+        cambio = f"{fila['cambio_p95_pct']:+.1f}%" if fila['cambio_p95_pct'] is not None else ''
+        click.echo(f"{fila['ruta']:40} {p95_antes:>10} {p95_despues:>12} {cambio:>8}")
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,346 @@
+"""
+Driver de carga: recorre las rutas de app.py con varios threads, cada uno con
+su propio test client sobre la app WSGI (sin servidor HTTP de por medio).
+
+Cada iteración de un thread toma el siguiente usuario de benchmark que le
+toca (los threads nunca comparten usuarios) y hace una sesión completa:
+login, dashboard, listados, búsqueda, exportación, edición de una fila de cada
+tipo, baja y alta de un inquilino, una propiedad y un contrato, y logout. Las
+bajas y altas dejan los datos como estaban, así que la base se puede reusar
+entre corridas.
+
+Con `lecturas` (por ejemplo 0.9) cada iteración es en cambio una carga mixta:
+login y `operaciones` requests elegidos al azar, esa fracción de GET
+(dashboard, listados y formularios de edición) y el resto ediciones que
+guardan los mismos valores, seguidas del GET de la redirección como haría el
+navegador.
+
+Las consultas SQL se cuentan con el observador de db.py: el test client
+atiende el request en el mismo thread que lo envía.
+"""
+
+import math
+import platform
+import random
+import subprocess
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import db
+from benchmark import datos
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano de una lista ya ordenada"""
+    if not valores:
+        return 0.0
+    return valores[max(0, math.ceil(p / 100 * len(valores)) - 1)]
+
+
+class _Consultas(threading.local):
+    cantidad = 0
+    segundos = 0.0
+
+
+_consultas = _Consultas()
+
+
+def _contar_consulta(conn, sql, params, segundos):
+    _consultas.cantidad += 1
+    _consultas.segundos += segundos
+
+
+class Resultados:
+    """Muestras por ruta, compartidas por todos los threads"""
+
+    def __init__(self):
+        self.rutas = {}
+        self._lock = threading.Lock()
+
+    def agregar(self, ruta, segundos, status, consultas, sql_segundos):
+        with self._lock:
+            datos_ruta = self.rutas.setdefault(ruta, {
+                'tiempos': [], 'errores': 0, 'status': {}, 'consultas': 0, 'sql_segundos': 0.0,
+            })
+            datos_ruta['tiempos'].append(segundos)
+            datos_ruta['status'][str(status)] = datos_ruta['status'].get(str(status), 0) + 1
+            datos_ruta['consultas'] += consultas
+            datos_ruta['sql_segundos'] += sql_segundos
+            if status >= 500:
+                datos_ruta['errores'] += 1
+
+    def resumen(self, segundos):
+        rutas = {}
+        for ruta, datos_ruta in sorted(self.rutas.items()):
+            tiempos = sorted(datos_ruta['tiempos'])
+            n = len(tiempos)
+            rutas[ruta] = {
+                'requests': n,
+                'errores': datos_ruta['errores'],
+                'status': datos_ruta['status'],
+                'p50_ms': round(percentil(tiempos, 50) * 1000, 3),
+                'p95_ms': round(percentil(tiempos, 95) * 1000, 3),
+                'p99_ms': round(percentil(tiempos, 99) * 1000, 3),
+                'media_ms': round(sum(tiempos) / n * 1000, 3),
+                'max_ms': round(tiempos[-1] * 1000, 3),
+                'rps': round(n / segundos, 2) if segundos else 0.0,
+                'consultas_por_request': round(datos_ruta['consultas'] / n, 2),
+                'sql_ms_por_request': round(datos_ruta['sql_segundos'] / n * 1000, 3),
+            }
+        total = sum(ruta['requests'] for ruta in rutas.values())
+        return {
+            'requests': total,
+            'errores': sum(ruta['errores'] for ruta in rutas.values()),
+            'segundos': round(segundos, 3),
+            'rps': round(total / segundos, 2) if segundos else 0.0,
+            'rutas': rutas,
+        }
+
+
+class Sesion:
+    """Una iteración completa de un usuario de benchmark"""
+
+    def __init__(self, client, conn, resultados, user_id, password):
+        self.client = client
+        self.conn = conn
+        self.resultados = resultados
+        self.user_id = user_id
+        self.password = password
+
+    def pedir(self, ruta, metodo, url, data=None, esperado=(200, 302)):
+        if data is not None:
+            data = {clave: '' if valor is None else str(valor) for clave, valor in data.items()}
+        _consultas.cantidad, _consultas.segundos = 0, 0.0
+        inicio = time.perf_counter()
+        respuesta = self.client.open(url, method=metodo, data=data)
+        respuesta.get_data()
+        segundos = time.perf_counter() - inicio
+        self.resultados.agregar(ruta, segundos, respuesta.status_code, _consultas.cantidad, _consultas.segundos)
+        if respuesta.status_code not in esperado:
+            raise RuntimeError(f'{ruta}: status {respuesta.status_code}')
+        return respuesta
+
+    def fila(self, sql, *params):
+        """Lectura directa de la base, fuera de lo medido"""
+        return self.conn.execute(sql, params).fetchone()
+
+    def ultimo_id(self, tabla):
+        return self.fila(f'SELECT MAX(id) FROM {tabla} WHERE user_id = ?', self.user_id)[0]
+
+    def login(self):
+        usuario = self.fila('SELECT username, apellido FROM usuarios WHERE id = ?', self.user_id)
+        self.pedir('GET /login', 'GET', '/login')
+        self.pedir('POST /login', 'POST', '/login',
+                   {'username': usuario['username'], 'password': self.password}, esperado=(302,))
+        return usuario
+
+    def ejecutar(self):
+        usuario = self.login()
+
+        self.pedir('GET /', 'GET', '/')
+        self.pedir('GET /propiedades', 'GET', '/propiedades')
+        self.pedir('GET /inquilinos', 'GET', '/inquilinos')
+        self.pedir('GET /contratos', 'GET', '/contratos')
+        self.pedir('GET /contratos/por-vencer', 'GET', '/contratos/por-vencer')
+        self.pedir('GET /buscar', 'GET', f"/buscar?q={usuario['apellido'][:4]}")
+        self.pedir('GET /<recurso>/exportar', 'GET', '/contratos/exportar')
+
+        self.editar()
+        self.baja_y_alta()
+
+        self.pedir('GET /logout', 'GET', '/logout')
+
+    def primera(self, tabla):
+        return self.fila(f'SELECT * FROM {tabla} WHERE user_id = ? ORDER BY id LIMIT 1', self.user_id)
+
+    def editar_propiedad(self, propiedad):
+        return self.pedir('POST /propiedades/<id>/editar', 'POST', f"/propiedades/{propiedad['id']}/editar", {
+            'direccion': propiedad['direccion'], 'tipo': propiedad['tipo'],
+            'habitaciones': propiedad['habitaciones'], 'baños': propiedad['baños'],
+            'precio': propiedad['precio'], 'estado': propiedad['estado'],
+        })
+
+    def editar_inquilino(self, inquilino):
+        return self.pedir('POST /inquilinos/<id>/editar', 'POST', f"/inquilinos/{inquilino['id']}/editar", {
+            'nombre': inquilino['nombre'], 'apellido': inquilino['apellido'], 'email': inquilino['email'],
+            'telefono': inquilino['telefono'], 'dni': inquilino['dni'],
+        })
+
+    def editar_contrato(self, contrato):
+        return self.pedir('POST /contratos/<id>/editar', 'POST', f"/contratos/{contrato['id']}/editar", {
+            'fecha_inicio': contrato['fecha_inicio'], 'fecha_fin': contrato['fecha_fin'],
+            'precio_mensual': contrato['precio_mensual'], 'estado': contrato['estado'],
+        })
+
+    def editar(self):
+        propiedad = self.primera('propiedades')
+        self.pedir('GET /propiedades/<id>/editar', 'GET', f"/propiedades/{propiedad['id']}/editar")
+        self.editar_propiedad(propiedad)
+
+        inquilino = self.primera('inquilinos')
+        self.pedir('GET /inquilinos/<id>/editar', 'GET', f"/inquilinos/{inquilino['id']}/editar")
+        self.editar_inquilino(inquilino)
+
+        contrato = self.primera('contratos')
+        self.pedir('GET /contratos/<id>/editar', 'GET', f"/contratos/{contrato['id']}/editar")
+        self.editar_contrato(contrato)
+
+    def mixta(self, rng, operaciones, lecturas):
+        """Login y `operaciones` requests: una fracción `lecturas` de GET y el resto ediciones"""
+        self.login()
+        propiedad, inquilino, contrato = self.primera('propiedades'), self.primera('inquilinos'), \
+            self.primera('contratos')
+        gets = [
+            ('GET /', '/'),
+            ('GET /propiedades', '/propiedades'),
+            ('GET /inquilinos', '/inquilinos'),
+            ('GET /contratos', '/contratos'),
+            ('GET /propiedades/<id>/editar', f"/propiedades/{propiedad['id']}/editar"),
+            ('GET /inquilinos/<id>/editar', f"/inquilinos/{inquilino['id']}/editar"),
+            ('GET /contratos/<id>/editar', f"/contratos/{contrato['id']}/editar"),
+        ]
+        ediciones = [
+            lambda: self.editar_propiedad(propiedad),
+            lambda: self.editar_inquilino(inquilino),
+            lambda: self.editar_contrato(contrato),
+        ]
+        for _ in range(operaciones):
+            if rng.random() < lecturas:
+                ruta, url = rng.choice(gets)
+                self.pedir(ruta, 'GET', url)
+                continue
+            respuesta = rng.choice(ediciones)()
+            if respuesta.location:
+                destino = urlsplit(respuesta.location).path
+                self.pedir(f'GET {destino}', 'GET', destino)
+        self.pedir('GET /logout', 'GET', '/logout')
+
+    def baja_y_alta(self):
+        # La última propiedad y el último inquilino no tienen contratos
+        inquilino = self.fila('SELECT * FROM inquilinos WHERE id = ?', self.ultimo_id('inquilinos'))
+        self.pedir('POST /inquilinos/<id>/eliminar', 'POST', f"/inquilinos/{inquilino['id']}/eliminar")
+        self.pedir('GET /inquilinos/nuevo', 'GET', '/inquilinos/nuevo')
+        self.pedir('POST /inquilinos/nuevo', 'POST', '/inquilinos/nuevo', {
+            'nombre': inquilino['nombre'], 'apellido': inquilino['apellido'], 'email': inquilino['email'],
+            'telefono': inquilino['telefono'], 'dni': inquilino['dni'],
+        })
+
+        propiedad = self.fila('SELECT * FROM propiedades WHERE id = ?', self.ultimo_id('propiedades'))
+        self.pedir('POST /propiedades/<id>/eliminar', 'POST', f"/propiedades/{propiedad['id']}/eliminar")
+        self.pedir('GET /propiedades/nueva', 'GET', '/propiedades/nueva')
+        self.pedir('POST /propiedades/nueva', 'POST', '/propiedades/nueva', {
+            'direccion': propiedad['direccion'], 'tipo': propiedad['tipo'],
+            'habitaciones': propiedad['habitaciones'], 'baños': propiedad['baños'], 'precio': propiedad['precio'],
+        })
+
+        # El contrato se vuelve a crear igual; nuevo_contrato lo deja activo
+        contrato = self.fila('SELECT * FROM contratos WHERE id = ?', self.ultimo_id('contratos'))
+        self.pedir('POST /contratos/<id>/eliminar', 'POST', f"/contratos/{contrato['id']}/eliminar")
+        self.pedir('GET /contratos/nuevo', 'GET', '/contratos/nuevo')
+        self.pedir('POST /contratos/nuevo', 'POST', '/contratos/nuevo', {
+            'propiedad_id': contrato['propiedad_id'], 'inquilino_id': contrato['inquilino_id'],
+            'fecha_inicio': contrato['fecha_inicio'], 'fecha_fin': contrato['fecha_fin'],
+            'precio_mensual': contrato['precio_mensual'],
+        })
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _preparar_app(database):
+    """La app de app.py apuntando a la base de benchmark"""
+    import cuentas
+    from app import app
+
+    app.config['DATABASE'] = database
+    db.reset_pool(app)
+    cuentas.reset()
+    with app.app_context():
+        cuentas.cargar_paquetes(db.get_db())
+    return app
+
+
+def ejecutar(database, hilos=4, iteraciones=5, password=datos.PASSWORD, lecturas=None, operaciones=50):
+    """Correr `iteraciones` sesiones por thread; devuelve el resumen (serializable a JSON).
+
+    Con `lecturas`, cada sesión es una carga mixta de `operaciones` requests.
+    """
+    app = _preparar_app(database)
+    with sqlite3.connect(database) as conn:
+        usuarios = [row[0] for row in conn.execute(
+            'SELECT id FROM usuarios WHERE username LIKE ? ORDER BY id', (f'{datos.PREFIJO}%',))]
+    if len(usuarios) < hilos:
+        raise ValueError(f'Hay {len(usuarios)} usuarios de benchmark y se pidieron {hilos} threads')
+
+    resultados = Resultados()
+    fallas = []
+
+    def trabajar(numero):
+        client = app.test_client()
+        conn = sqlite3.connect(database, timeout=30)
+        conn.row_factory = sqlite3.Row
+        rng = random.Random(numero)
+        try:
+            # Los usuarios del thread: numero, numero + hilos, numero + 2 * hilos, ...
+            propios = usuarios[numero::hilos]
+            for i in range(iteraciones):
+                sesion = Sesion(client, conn, resultados, propios[i % len(propios)], password)
+                if lecturas is None:
+                    sesion.ejecutar()
+                else:
+                    sesion.mixta(rng, operaciones, lecturas)
+        except Exception as e:
+            fallas.append(f'thread {numero}: {e}')
+        finally:
+            conn.close()
+
+    db.agregar_observador(_contar_consulta)
+    try:
+        threads = [threading.Thread(target=trabajar, args=(n,), name=f'carga-{n}') for n in range(hilos)]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        segundos = time.perf_counter() - inicio
+    finally:
+        db.quitar_observador(_contar_consulta)
+
+    resumen = resultados.resumen(segundos)
+    resumen.update(
+        commit=_commit(),
+        fecha=datetime.now().isoformat(timespec='seconds'),
+        python=platform.python_version(),
+        sqlite=sqlite3.sqlite_version,
+        hilos=hilos,
+        iteraciones=iteraciones,
+        lecturas=lecturas,
+        operaciones=operaciones if lecturas is not None else None,
+        fallas=fallas,
+    )
+    return resumen
+
+
+def comparar(antes, despues):
+    """Filas (ruta, p50, p95 y p99 antes/después y cambio porcentual del p95)"""
+    filas = []
+    for ruta in sorted(set(antes['rutas']) | set(despues['rutas'])):
+        a, d = antes['rutas'].get(ruta), despues['rutas'].get(ruta)
+        cambio = None
+        if a and d and a['p95_ms']:
+            cambio = round((d['p95_ms'] - a['p95_ms']) / a['p95_ms'] * 100, 1)
+        filas.append({
+            'ruta': ruta,
+            'antes': {k: a[k] for k in ('p50_ms', 'p95_ms', 'p99_ms', 'consultas_por_request')} if a else None,
+            'despues': {k: d[k] for k in ('p50_ms', 'p95_ms', 'p99_ms', 'consultas_por_request')} if d else None,
+            'cambio_p95_pct': cambio,
+        })
+    return filas
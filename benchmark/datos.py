@@ -0,0 +1,185 @@
+"""
+Generador de datos sintéticos para el benchmark.
+
+Crea usuarios bench00000, bench00001, ... con la misma contraseña, repartidos
+entre los paquetes Básico, Profesional y Empresarial (60/30/10 %), y llena a
+cada uno hasta max_propiedades, max_inquilinos y max_contratos. Con la misma
+semilla y la misma cantidad de usuarios los datos son idénticos; las fechas de
+los contratos se calculan a partir de `hoy`, para que siempre haya contratos
+activos, vencidos y próximos a vencer.
+
+Los contratos de cada propiedad son consecutivos y no se superponen (los
+triggers de la migración 7 lo exigen). La última propiedad y el último
+inquilino de cada usuario quedan sin contratos: carga.py los borra y los
+vuelve a crear en cada iteración.
+"""
+
+import os
+import random
+import sqlite3
+import time
+from datetime import date, timedelta
+
+from werkzeug.security import generate_password_hash
+
+import claves
+import migrations
+
+PASSWORD = 'bench123'
+PREFIJO = 'bench'
+# (paquete_id, peso)
+PAQUETES = ((1, 60), (2, 30), (3, 10))
+TAMANO_LOTE = 50          # usuarios por transacción
+
+CALLES = ('San Martín', 'Belgrano', 'Rivadavia', 'Mitre', 'Sarmiento', 'Moreno', 'Alsina', 'Urquiza',
+          'Lavalle', 'Corrientes', 'Córdoba', 'Santa Fe', 'Pueyrredón', 'Güemes', 'Las Heras')
+NOMBRES = ('Ana', 'Juan', 'María', 'Carlos', 'Lucía', 'Pedro', 'Sofía', 'Diego', 'Valentina', 'Martín',
+           'Camila', 'Federico', 'Julieta', 'Tomás', 'Paula', 'Nicolás')
+APELLIDOS = ('González', 'Rodríguez', 'Gómez', 'Fernández', 'López', 'Díaz', 'Martínez', 'Pérez',
+             'García', 'Sánchez', 'Romero', 'Sosa', 'Álvarez', 'Torres', 'Ruiz', 'Ramírez')
+TIPOS = ('casa', 'departamento', 'local', 'oficina')
+
+
+def username(n):
+    return f'{PREFIJO}{n:05d}'
+
+
+def metodo_por_defecto():
+    """Método de hash que usará la app, para que el login no tenga que recalcularlo"""
+    return claves.metodo_completo(
+        os.environ.get('PASSWORD_HASH_METHOD', claves.DEFAULT_CONFIG['PASSWORD_HASH_METHOD']),
+        os.environ.get('PASSWORD_HASH_ITERATIONS', claves.DEFAULT_CONFIG['PASSWORD_HASH_ITERATIONS']),
+    )
+
+
+def _siguiente_id(conn, tabla):
+    return conn.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {tabla}').fetchone()[0]
+
+
+def _creado(rng, hoy):
+    """fecha_creacion fija (no CURRENT_TIMESTAMP) para que la base sea reproducible"""
+    return f'{(hoy - timedelta(days=rng.randint(0, 1500))).isoformat()} 12:00:00'
+
+
+def _contratos_de_propiedad(rng, cantidad, hoy):
+    """Períodos consecutivos hacia atrás: el último puede estar activo, los anteriores vencidos"""
+    periodos = []
+    fin = hoy + timedelta(days=rng.randint(-60, 400))
+    for k in range(cantidad):
+        inicio = fin - timedelta(days=rng.choice((180, 365, 730)))
+        estado = 'activo' if k == 0 and fin >= hoy else 'vencido'
+        periodos.append((inicio, fin, estado))
+        fin = inicio - timedelta(days=1 + rng.randint(0, 30))
+    return periodos
+
+
+def _usuario(rng, n, paquete, ids, hoy):
+    """Filas de un usuario: (usuario, propiedades, inquilinos, contratos)"""
+    max_propiedades, max_inquilinos, max_contratos = paquete
+    user_id = ids['usuarios']
+    usuario = (user_id, username(n), f'{username(n)}@example.com', rng.choice(NOMBRES), rng.choice(APELLIDOS))
+
+    propiedades = []
+    for i in range(max_propiedades):
+        propiedades.append([
+            ids['propiedades'] + i, user_id,
+            f'{rng.choice(CALLES)} {rng.randint(1, 9999)}', rng.choice(TIPOS),
+            rng.randint(1, 5), rng.randint(1, 3), rng.randrange(300, 3000, 10), 'disponible',
+            _creado(rng, hoy),
+        ])
+    inquilinos = []
+    for i in range(max_inquilinos):
+        inquilinos.append((
+            ids['inquilinos'] + i, user_id, rng.choice(NOMBRES), rng.choice(APELLIDOS),
+            f'inq{n:05d}-{i}@example.com', f'11{rng.randint(10000000, 99999999)}', f'{n:05d}{i:04d}',
+            _creado(rng, hoy),
+        ))
+
+    # Los contratos se reparten entre todas las propiedades menos la última
+    con_contratos = propiedades[:-1] or propiedades
+    por_propiedad = [max_contratos // len(con_contratos)] * len(con_contratos)
+    for i in range(max_contratos % len(con_contratos)):
+        por_propiedad[i] += 1
+    inquilinos_contrato = inquilinos[:-1] or inquilinos
+
+    contratos = []
+    contrato_id = ids['contratos']
+    for propiedad, cantidad in zip(con_contratos, por_propiedad):
+        for inicio, fin, estado in _contratos_de_propiedad(rng, cantidad, hoy):
+            if estado == 'activo':
+                propiedad[7] = 'alquilada'
+            contratos.append((
+                contrato_id, user_id, propiedad[0], rng.choice(inquilinos_contrato)[0],
+                inicio.isoformat(), fin.isoformat(), propiedad[6], estado, f'{inicio.isoformat()} 12:00:00',
+            ))
+            contrato_id += 1
+
+    ids['usuarios'] += 1
+    ids['propiedades'] += len(propiedades)
+    ids['inquilinos'] += len(inquilinos)
+    ids['contratos'] = contrato_id
+    return usuario, propiedades, inquilinos, contratos
+
+
+def generar(database, usuarios=2000, semilla=42, hoy=None, password=PASSWORD, metodo=None):
+    """Crear la base de benchmark; devuelve la cantidad de filas por tabla y los segundos"""
+    inicio = time.perf_counter()
+    hoy = hoy or date.today()
+    migrations.migrate(database)
+
+    conn = sqlite3.connect(database)
+    try:
+        if conn.execute('SELECT 1 FROM usuarios WHERE username = ?', (username(0),)).fetchone():
+            raise ValueError(f'{database} ya tiene datos de benchmark')
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = OFF')
+
+        # Un solo hash para todos: es deliberadamente lento
+        password_hash = generate_password_hash(password, method=metodo or metodo_por_defecto())
+        paquetes = {row[0]: row[1:] for row in conn.execute(
+            'SELECT id, max_propiedades, max_inquilinos, max_contratos FROM paquetes')}
+        ids = {tabla: _siguiente_id(conn, tabla) for tabla in ('usuarios', 'propiedades', 'inquilinos', 'contratos')}
+        rng = random.Random(semilla)
+        pesos = [peso for _, peso in PAQUETES]
+        totales = {'usuarios': 0, 'propiedades': 0, 'inquilinos': 0, 'contratos': 0}
+
+        for desde in range(0, usuarios, TAMANO_LOTE):
+            filas = {'usuarios': [], 'propiedades': [], 'inquilinos': [], 'contratos': []}
+            for n in range(desde, min(desde + TAMANO_LOTE, usuarios)):
+                paquete_id = rng.choices([p for p, _ in PAQUETES], weights=pesos)[0]
+                creado = _creado(rng, hoy)
+                usuario, propiedades, inquilinos, contratos = _usuario(rng, n, paquetes[paquete_id], ids, hoy)
+                filas['usuarios'].append(usuario[:3] + (password_hash,) + usuario[3:] + (paquete_id, creado))
+                filas['propiedades'] += [tuple(p) for p in propiedades]
+                filas['inquilinos'] += inquilinos
+                filas['contratos'] += contratos
+
+            with conn:
+                conn.executemany('''
+                    INSERT INTO usuarios (id, username, email, password_hash, nombre, apellido, paquete_id,
+                                          fecha_registro)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', filas['usuarios'])
+                conn.executemany('''
+                    INSERT INTO propiedades (id, user_id, direccion, tipo, habitaciones, baños, precio, estado,
+                                             fecha_creacion)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', filas['propiedades'])
+                conn.executemany('''
+                    INSERT INTO inquilinos (id, user_id, nombre, apellido, email, telefono, dni, fecha_creacion)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', filas['inquilinos'])
+                conn.executemany('''
+                    INSERT INTO contratos (id, user_id, propiedad_id, inquilino_id, fecha_inicio, fecha_fin,
+                                           precio_mensual, estado, fecha_creacion)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', filas['contratos'])
+            for tabla, lista in filas.items():
+                totales[tabla] += len(lista)
+
+        conn.execute('PRAGMA optimize')
+    finally:
+        conn.close()
+
+    totales['segundos'] = round(time.perf_counter() - inicio, 2)
+    return totales
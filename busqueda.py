@@ -0,0 +1,90 @@
+"""
+Búsqueda de texto completo sobre propiedades, inquilinos y contratos.
+
+El índice FTS5 (tabla busqueda) lo mantienen los triggers de la migración 5.
+Cada término se busca por prefijo y los resultados se ordenan por bm25, con
+más peso en el título (dirección o nombre) que en el detalle.
+"""
+
+import re
+
+ENTIDADES = ('propiedad', 'inquilino', 'contrato')
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+MAX_TERMINOS = 8
+
+_TERMINO = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_query(texto):
+    """Expresión FTS5 segura a partir del texto del usuario (prefijo por término)"""
+    terminos = _TERMINO.findall(texto or '')[:MAX_TERMINOS]
+    return ' '.join(f'"{termino}"*' for termino in terminos)
+
+
+def _url(entidad, entidad_id, url_for):
+    endpoint = {
+        'propiedad': 'editar_propiedad',
+        'inquilino': 'editar_inquilino',
+        'contrato': 'editar_contrato',
+    }[entidad]
+    return url_for(endpoint, id=entidad_id)
+
+
+def buscar(conn, user_id, texto, entidad=None, solo_disponibles=False, limite=DEFAULT_LIMIT):
+    """Documentos del usuario que coinciden con el texto, ordenados por relevancia"""
+    expresion = fts_query(texto)
+    if not expresion:
+        return []
+
+    match = f'propietario:u{int(user_id)}'
+    if entidad in ENTIDADES:
+        match += f' AND entidad:{entidad}'
+    match += f' AND {{titulo detalle}} : ({expresion})'
+
+    sql = '''
+        SELECT b.entidad, b.entidad_id AS id, b.titulo, b.detalle, p.precio, p.estado
+        FROM busqueda b
+        LEFT JOIN propiedades p ON b.entidad = 'propiedad' AND p.id = b.entidad_id
+        WHERE busqueda MATCH ?
+    '''
+    if solo_disponibles:
+        sql += " AND p.estado = 'disponible'"
+    sql += ' ORDER BY bm25(busqueda, 0.0, 0.0, 10.0, 1.0) LIMIT ?'
+    return conn.execute(sql, (match, limite)).fetchall()
+
+
+def recientes(conn, user_id, entidad, solo_disponibles=False, limite=DEFAULT_LIMIT):
+    """Últimos registros de una entidad, para los selectores sin texto escrito"""
+    if entidad == 'propiedad':
+        sql = '''
+            SELECT 'propiedad' AS entidad, id, direccion AS titulo, tipo AS detalle, precio, estado
+            FROM propiedades WHERE user_id = ?
+        '''
+        if solo_disponibles:
+            sql += " AND estado = 'disponible'"
+    elif entidad == 'inquilino':
+        sql = '''
+            SELECT 'inquilino' AS entidad, id, nombre || ' ' || apellido AS titulo,
+                   COALESCE(dni, '') AS detalle, NULL AS precio, NULL AS estado
+            FROM inquilinos WHERE user_id = ?
+        '''
+    else:
+        return []
+    sql += ' ORDER BY fecha_creacion DESC LIMIT ?'
+    return conn.execute(sql, (user_id, limite)).fetchall()
+
+
+def serializar(rows, url_for):
+    """Resultados listos para jsonify"""
+    return [
+        {
+            'entidad': row['entidad'],
+            'id': row['id'],
+            'titulo': row['titulo'],
+            'detalle': ' '.join((row['detalle'] or '').split()),
+            'precio': row['precio'],
+            'url': _url(row['entidad'], row['id'], url_for),
+        }
+        for row in rows
+    ]
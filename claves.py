@@ -0,0 +1,215 @@
+"""
+Hash y verificación de contraseñas fuera del worker web.
+
+PBKDF2 y scrypt son deliberadamente lentos. Para que una ráfaga de logins no
+deje a todos los workers calculando hashes, el cálculo se hace en un pool de
+procesos acotado por worker, con un límite de trabajos en cola: si se supera,
+se rechaza con ColaLlena en lugar de esperar.
+
+Esto sirve cuando cada worker atiende varios requests a la vez (gunicorn con
+worker_class gthread, como en gunicorn.conf.py, o asgi.py): el thread del
+login espera el resultado y los demás siguen libres. PASSWORD_HASH_MAX_QUEUE
+tiene que ser menor que los threads por worker para que el rechazo llegue
+antes de ocuparlos todos. Con workers sync hay un solo request por proceso y
+el hash lo bloquea igual.
+
+El método y las iteraciones son configurables. Al iniciar sesión, un hash
+generado con otros parámetros se recalcula con los actuales (rehash).
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_CONFIG = {
+    'PASSWORD_HASH_METHOD': 'pbkdf2:sha256',   # pbkdf2:<digest> o scrypt[:n:r:p]
+    'PASSWORD_HASH_ITERATIONS': 600000,       # solo para pbkdf2
+    'PASSWORD_HASH_WORKERS': 2,               # procesos por worker; 0 = en el mismo proceso
+    'PASSWORD_HASH_MAX_QUEUE': 16,            # trabajos en curso + en espera
+    'PASSWORD_HASH_TIMEOUT': 10,              # segundos
+}
+
+# Límites superiores (segundos) del histograma de latencia
+BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class ColaLlena(Exception):
+    """Hay demasiados hashes pendientes; conviene reintentar más tarde"""
+
+
+def metodo_completo(metodo, iteraciones):
+    """Método en el formato que werkzeug guarda al principio del hash"""
+    partes = metodo.split(':')
+    if partes[0] == 'pbkdf2':
+        digest = partes[1] if len(partes) > 1 else 'sha256'
+        return f'pbkdf2:{digest}:{int(iteraciones)}'
+    if partes[0] == 'scrypt' and len(partes) == 1:
+        return 'scrypt:32768:8:1'
+    return metodo
+
+
+# Funciones que corren en los procesos del pool (deben ser de nivel módulo)
+
+def _generar(password, metodo):
+    return generate_password_hash(password, method=metodo)
+
+
+def _verificar(password_hash, password, metodo):
+    """(válida, hash nuevo o None si no hace falta recalcularlo)"""
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if password_hash.split('$', 1)[0] != metodo:
+        return True, generate_password_hash(password, method=metodo)
+    return True, None
+
+
+class Hasher:
+    """Pool de procesos acotado para calcular hashes de contraseñas"""
+
+    def __init__(self, metodo='pbkdf2:sha256', iteraciones=600000, workers=2, max_cola=16, timeout=10):
+        self.metodo = metodo_completo(metodo, iteraciones)
+        self.workers = int(workers)
+        self.max_cola = int(max_cola)
+        self.timeout = float(timeout)
+        self._cola = threading.BoundedSemaphore(self.max_cola)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._stats = {
+            'operaciones': 0, 'rechazadas': 0, 'rehash': 0,
+            'segundos_total': 0.0, 'segundos_max': 0.0, 'en_cola': 0,
+            'buckets': [0] * len(BUCKETS),
+        }
+
+    def _get_executor(self):
+        # El pool no sobrevive a un fork: cada worker arma el suyo
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            return self._executor
+
+    def _registrar(self, segundos):
+        with self._lock:
+            self._stats['operaciones'] += 1
+            self._stats['segundos_total'] += segundos
+            self._stats['segundos_max'] = max(self._stats['segundos_max'], segundos)
+            for n, limite in enumerate(BUCKETS):
+                if segundos <= limite:
+                    self._stats['buckets'][n] += 1
+                    break
+
+    def _liberar(self, _future=None):
+        with self._lock:
+            self._stats['en_cola'] -= 1
+        self._cola.release()
+
+    def _ejecutar(self, funcion, *args):
+        if not self._cola.acquire(blocking=False):
+            with self._lock:
+                self._stats['rechazadas'] += 1
+            raise ColaLlena('Demasiadas contraseñas pendientes de verificar')
+        with self._lock:
+            self._stats['en_cola'] += 1
+
+        inicio = time.perf_counter()
+        if self.workers <= 0:
+            try:
+                return funcion(*args)
+            finally:
+                self._liberar()
+                self._registrar(time.perf_counter() - inicio)
+
+        try:
+            future = self._get_executor().submit(funcion, *args)
+        except Exception:
+            self._liberar()
+            raise
+        # El lugar en la cola se libera cuando el proceso termina, aunque
+        # quien esperaba ya se haya ido por timeout
+        future.add_done_callback(self._liberar)
+        try:
+            return future.result(timeout=self.timeout)
+        except FuturesTimeout:
+            with self._lock:
+                self._stats['rechazadas'] += 1
+            raise ColaLlena('La verificación de la contraseña tardó demasiado')
+        finally:
+            self._registrar(time.perf_counter() - inicio)
+
+    def generar(self, password):
+        """Hash de una contraseña con los parámetros configurados"""
+        return self._ejecutar(_generar, password, self.metodo)
+
+    def verificar(self, password_hash, password):
+        """(válida, hash nuevo o None).
+
+        Si la contraseña es correcta pero el hash usa otros parámetros, se
+        devuelve el hash recalculado para guardarlo.
+        """
+        valida, nuevo = self._ejecutar(_verificar, password_hash, password, self.metodo)
+        if nuevo:
+            with self._lock:
+                self._stats['rehash'] += 1
+        return valida, nuevo
+
+    def stats(self):
+        """Contadores y histograma de latencia (acumulado, como Prometheus)"""
+        with self._lock:
+            datos = dict(self._stats)
+            acumulado = 0
+            datos['buckets'] = {}
+            for limite, cantidad in zip(BUCKETS, self._stats['buckets']):
+                acumulado += cantidad
+                datos['buckets'][str(limite)] = acumulado
+            datos['segundos_promedio'] = (
+                datos['segundos_total'] / datos['operaciones'] if datos['operaciones'] else 0.0)
+        datos.update(metodo=self.metodo, workers=self.workers, max_cola=self.max_cola)
+        return datos
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _config_value(app, key):
+    """Variable de entorno, si existe; si no, app.config"""
+    return os.environ.get(key, app.config.get(key, DEFAULT_CONFIG[key]))
+
+
+def get_hasher(app=None):
+    """Hasher del proceso actual, creado la primera vez que se necesita"""
+    app = app or current_app
+    hasher = app.extensions.get('password_hasher')
+    if hasher is None:
+        hasher = Hasher(
+            metodo=_config_value(app, 'PASSWORD_HASH_METHOD'),
+            iteraciones=_config_value(app, 'PASSWORD_HASH_ITERATIONS'),
+            workers=_config_value(app, 'PASSWORD_HASH_WORKERS'),
+            max_cola=_config_value(app, 'PASSWORD_HASH_MAX_QUEUE'),
+            timeout=_config_value(app, 'PASSWORD_HASH_TIMEOUT'),
+        )
+        app.extensions['password_hasher'] = hasher
+    return hasher
+
+
+def reset_hasher(app=None):
+    """Cerrar el Hasher actual para que se vuelva a crear con la configuración vigente"""
+    app = app or current_app
+    hasher = app.extensions.pop('password_hasher', None)
+    if hasher is not None:
+        hasher.close()
+
+
+def init_app(app):
+    """Registrar la configuración del hash de contraseñas en la aplicación"""
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
@@ -0,0 +1,240 @@
+"""
+Compresión gzip/brotli de las respuestas, como middleware WSGI.
+
+init_app() envuelve app.wsgi_app, así vale igual bajo gunicorn y bajo el
+adaptador de asgi.py. Se comprimen las respuestas 200 de tipos de texto
+(HTML, CSS, JS, JSON, CSV, métricas) cuando el cliente lo acepta en
+Accept-Encoding: brotli si está instalado el módulo `brotli` y el cliente lo
+prefiere, si no gzip. No se tocan las que ya traen Content-Encoding (los
+archivos precomprimidos de /activos/), las que piden `no-transform`, los HEAD
+ni las más chicas que COMPRESION_MINIMO.
+
+Las respuestas en streaming (sin Content-Length: listados con
+stream_template, exportaciones) se comprimen desde el primer bloque, sin
+esperar a juntar COMPRESION_MINIMO bytes, y cada bloque se envía con un flush
+del compresor: el encabezado de la página llega al navegador apenas la app lo
+entrega (ver listados.en_bloques), antes de las consultas de la tabla.
+"""
+
+import os
+import threading
+import zlib
+from itertools import chain
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header, parse_set_header
+from werkzeug.wsgi import ClosingIterator
+
+import metricas
+
+try:
+    import brotli
+except ImportError:  # opcional: sin él solo se usa gzip
+    brotli = None
+
+# Valores por defecto, sobreescribibles por app.config o variables de entorno
+DEFAULT_CONFIG = {
+    'COMPRESION': 1,                # 0 = no comprimir
+    'COMPRESION_MINIMO': 1024,      # bytes; las respuestas más chicas (con Content-Length) salen tal cual
+    'COMPRESION_NIVEL_GZIP': 6,     # 1-9
+    'COMPRESION_NIVEL_BROTLI': 5,   # 0-11; los niveles altos son para precomprimir, no por request
+}
+
+TIPOS = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+
+
+def _config_value(app, key):
+    """Variable de entorno, si existe; si no, app.config"""
+    return os.environ.get(key, app.config.get(key, DEFAULT_CONFIG[key]))
+
+
+class _Gzip:
+    def __init__(self, nivel):
+        self._compresor = zlib.compressobj(nivel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def comprimir(self, datos):
+        return self._compresor.compress(datos) + self._compresor.flush(zlib.Z_SYNC_FLUSH)
+
+    def terminar(self):
+        return self._compresor.flush()
+
+
+class _Brotli:
+    def __init__(self, nivel):
+        self._compresor = brotli.Compressor(quality=nivel)
+
+    def comprimir(self, datos):
+        return self._compresor.process(datos) + self._compresor.flush()
+
+    def terminar(self):
+        return self._compresor.finish()
+
+
+class Contadores:
+    """Bytes antes y después de comprimir, por codificación, en el proceso"""
+
+    def __init__(self):
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def sumar(self, codificacion, original, enviado):
+        with self._lock:
+            contador = self._datos.setdefault(codificacion, [0, 0, 0])
+            contador[0] += 1
+            contador[1] += original
+            contador[2] += enviado
+
+    def stats(self):
+        with self._lock:
+            datos = {codificacion: tuple(contador) for codificacion, contador in self._datos.items()}
+        return {
+            codificacion: {'respuestas': respuestas, 'original': original, 'enviado': enviado,
+                           'ratio': round(enviado / original, 4) if original else 0.0}
+            for codificacion, (respuestas, original, enviado) in sorted(datos.items())
+        }
+
+    def reset(self):
+        with self._lock:
+            self._datos.clear()
+
+
+CONTADORES = Contadores()
+
+
+def codificacion(accept_encoding):
+    """'br', 'gzip' o None según el Accept-Encoding del cliente"""
+    aceptadas = parse_accept_header(accept_encoding)
+    gzip_q = aceptadas['gzip']
+    if brotli is not None and aceptadas['br'] and aceptadas['br'] >= gzip_q:
+        return 'br'
+    return 'gzip' if gzip_q else None
+
+
+def comprimible(environ, status, headers):
+    """Si la respuesta es de un tipo que conviene comprimir y nadie la codificó antes"""
+    return (
+        status.startswith('200')
+        and environ.get('REQUEST_METHOD') != 'HEAD'
+        and 'Content-Encoding' not in headers
+        and 'Content-Range' not in headers
+        and headers.get('Content-Type', '').startswith(TIPOS)
+        and 'no-transform' not in headers.get('Cache-Control', '')
+    )
+
+
+class Compresion:
+    """Middleware WSGI que comprime las respuestas según Accept-Encoding"""
+
+    def __init__(self, wsgi_app, app):
+        self.wsgi_app = wsgi_app
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        if not int(_config_value(self.app, 'COMPRESION')):
+            return self.wsgi_app(environ, start_response)
+
+        respuesta = {}
+
+        def capturar(status, headers, exc_info=None):
+            if exc_info is not None and respuesta.get('enviada'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            respuesta.update(status=status, headers=headers, exc_info=exc_info)
+            return respuesta.setdefault('escritos', []).append
+
+        resultado = self.wsgi_app(environ, capturar)
+        status, headers = respuesta['status'], Headers(respuesta['headers'])
+        if not comprimible(environ, status, headers):
+            start_response(status, respuesta['headers'], respuesta['exc_info'])
+            return self._con_escritos(respuesta, resultado)
+
+        vary = parse_set_header(headers.get('Vary'))
+        vary.add('Accept-Encoding')
+        headers['Vary'] = vary.to_header()
+        metodo = codificacion(environ.get('HTTP_ACCEPT_ENCODING'))
+        largo = headers.get('Content-Length', type=int)
+        # En streaming se decide con el primer bloque: esperar el mínimo demoraría el encabezado
+        minimo = int(_config_value(self.app, 'COMPRESION_MINIMO')) if largo is not None else 1
+        if metodo is None or (largo is not None and largo < minimo):
+            start_response(status, headers.to_wsgi_list(), respuesta['exc_info'])
+            return self._con_escritos(respuesta, resultado)
+        return self._comprimir(respuesta, resultado, headers, metodo, minimo, start_response)
+
+    @staticmethod
+    def _con_escritos(respuesta, resultado):
+        # Sin write() de por medio se devuelve el iterable original (file_wrapper incluido)
+        escritos = respuesta.get('escritos')
+        if not escritos:
+            return resultado
+        return ClosingIterator(chain(escritos, resultado), getattr(resultado, 'close', None))
+
+    def _comprimir(self, respuesta, resultado, headers, metodo, minimo, start_response):
+        partes = self._partes(respuesta, resultado, headers, metodo, minimo, start_response)
+        return ClosingIterator(partes, getattr(resultado, 'close', None))
+
+    def _partes(self, respuesta, resultado, headers, metodo, minimo, start_response):
+        partes = chain(respuesta.get('escritos', ()), resultado)
+        # Juntar `minimo` bytes antes de decidir (un cuerpo vacío sale tal cual)
+        inicio, largo = [], 0
+        for parte in partes:
+            inicio.append(parte)
+            largo += len(parte)
+            if largo >= minimo:
+                break
+        else:
+            headers['Content-Length'] = str(largo)
+            respuesta['enviada'] = True
+            start_response(respuesta['status'], headers.to_wsgi_list(), respuesta['exc_info'])
+            yield b''.join(inicio)
+            return
+
+        if metodo == 'br':
+            compresor = _Brotli(int(_config_value(self.app, 'COMPRESION_NIVEL_BROTLI')))
+        else:
+            compresor = _Gzip(int(_config_value(self.app, 'COMPRESION_NIVEL_GZIP')))
+        headers['Content-Encoding'] = metodo
+        headers.pop('Content-Length', None)
+        # El cuerpo ya no es idéntico byte a byte: el ETag pasa a débil
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = f'W/{etag}'
+        respuesta['enviada'] = True
+        start_response(respuesta['status'], headers.to_wsgi_list(), respuesta['exc_info'])
+
+        original = enviado = 0
+        for parte in chain(inicio, partes):
+            if not parte:
+                continue
+            original += len(parte)
+            datos = compresor.comprimir(parte)
+            enviado += len(datos)
+            yield datos
+        datos = compresor.terminar()
+        enviado += len(datos)
+        yield datos
+        CONTADORES.sumar(metodo, original, enviado)
+
+
+def stats():
+    return CONTADORES.stats()
+
+
+def _metricas():
+    por_codificacion = CONTADORES.stats()
+    lineas = []
+    for nombre, ayuda, clave in (
+        ('http_compressed_responses_total', 'Respuestas comprimidas', 'respuestas'),
+        ('http_compression_input_bytes_total', 'Bytes de las respuestas antes de comprimir', 'original'),
+        ('http_compression_output_bytes_total', 'Bytes enviados de las respuestas comprimidas', 'enviado'),
+    ):
+        lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} counter']
+        lineas += [f'{nombre}{{codificacion="{metodo}"}} {valores[clave]}'
+                   for metodo, valores in por_codificacion.items()]
+    return lineas
+
+
+def init_app(app):
+    """Registrar la configuración, envolver app.wsgi_app y publicar las métricas"""
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+    app.wsgi_app = Compresion(app.wsgi_app, app)
+    metricas.REGISTRO.colector(_metricas)
@@ -0,0 +1,115 @@
+"""
+GET condicional (ETag y Last-Modified) para los listados y la API JSON.
+
+tenant_usage guarda por usuario cuántas escrituras hubo en propiedades,
+inquilinos y contratos y la hora de la última (migración 9). El decorador
+validar() arma el ETag con esa marca antes de llamar a la vista: si el cliente
+ya tiene esa versión (If-None-Match, o If-Modified-Since si no manda ETag) se
+responde 304 sin leer filas ni renderizar plantillas. Si no, la respuesta sale
+con ETag, Last-Modified y `Cache-Control: private, no-cache`, así el navegador
+siempre revalida pero no vuelve a descargar lo que no cambió.
+
+Además de la marca, el ETag incluye la URL (filtros y página), la fecha (los
+días restantes de los contratos cambian cada día), los datos de la sesión que
+muestra la barra de navegación y la versión de la app (fecha de las plantillas
+y módulos), para que un deploy no revalide páginas viejas.
+"""
+
+import glob
+import hashlib
+import os
+from datetime import date, datetime, time, timezone
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+
+
+MARCA_SQL = 'SELECT cambios, modificado FROM tenant_usage WHERE user_id = ?'
+
+
+def marca(conn, user_id):
+    """(cambios, modificado) de los datos del usuario, leída una vez por request.
+
+    La comparten el ETag y las versiones de fragmentos.py.
+    """
+    marcas = g.setdefault('condicional_marcas', {})
+    if user_id not in marcas:
+        row = conn.execute(MARCA_SQL, (user_id,)).fetchone()
+        marcas[user_id] = (row['cambios'], row['modificado']) if row is not None else (0, None)
+    return marcas[user_id]
+
+
+def _fecha(modificado):
+    """datetime UTC de una marca 'AAAA-MM-DD HH:MM:SS[.fff]', o None"""
+    try:
+        return datetime.strptime(modificado[:19], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+def version_app(app):
+    """Fecha de la última modificación de plantillas y módulos (una vez por proceso).
+
+    Es la misma en todos los workers de un deploy, a diferencia de un valor al azar.
+    """
+    version = app.extensions.get('condicional_version')
+    if version is None:
+        archivos = glob.glob(os.path.join(app.root_path, '*.py'))
+        if app.template_folder:
+            archivos += glob.glob(os.path.join(app.root_path, app.template_folder, '*.html'))
+        segundos = max((os.path.getmtime(archivo) for archivo in archivos), default=0)
+        version = datetime.fromtimestamp(int(segundos), timezone.utc)
+        app.extensions['condicional_version'] = version
+    return version
+
+
+def etag(*partes):
+    """ETag débil a partir de las partes que identifican una versión de la respuesta"""
+    return hashlib.sha1('|'.join(str(parte) for parte in partes).encode('utf-8')).hexdigest()[:24]
+
+
+def _no_modificado(valor, ultima):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(valor)
+    return request.if_modified_since is not None and ultima <= request.if_modified_since
+
+
+def _cabeceras(response, valor, ultima):
+    response.set_etag(valor, weak=True)
+    response.last_modified = ultima
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+
+def validar(get_conn):
+    """Decorador de vistas GET de un usuario: 304 si el cliente tiene la versión actual.
+
+    `get_conn` devuelve la conexión donde están los datos del usuario de la
+    sesión (en modo shards, su base).
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            # Con mensajes flash pendientes la página no es reutilizable
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return vista(*args, **kwargs)
+
+            user_id = session['user_id']
+            cambios, modificado = marca(get_conn(), user_id)
+            hoy = date.today()
+            version = version_app(current_app)
+            valor = etag(user_id, cambios, modificado, hoy.isoformat(), request.full_path,
+                         session.get('username'), session.get('nombre'), version.timestamp())
+            inicio_del_dia = datetime.combine(hoy, time()).astimezone(timezone.utc)
+            ultima = max(filter(None, (_fecha(modificado), version, inicio_del_dia)))
+
+            if _no_modificado(valor, ultima):
+                return _cabeceras(current_app.response_class(status=304), valor, ultima)
+            response = make_response(vista(*args, **kwargs))
+            if response.status_code == 200:
+                _cabeceras(response, valor, ultima)
+            return response
+        return envoltura
+    return decorador
@@ -0,0 +1,262 @@
+"""
+Consola de administración: usuarios con su paquete, uso y último acceso.
+
+La lista se arma con usuarios + paquetes + los contadores de tenant_usage
+(búsquedas por clave primaria, sin un COUNT por usuario) y se ordena y
+pagina en SQL, con cursores por (valor de la columna de orden, id) igual que
+listados.py: el costo de una página no depende de cuántas se salteen. El
+orden por defecto, el uso del paquete, es una columna que mantienen los
+triggers (migración 14) con su índice (uso, user_id): la página recorre el
+índice en lugar de calcular y ordenar el uso de todos los usuarios.
+
+Con shards, los contadores viven en la base de cada usuario; la consola lee
+la copia que el catálogo guarda en uso_shards (migración 10) y que actualiza
+sincronizar() (`flask --app app sincronizar-uso`, por ejemplo desde cron).
+
+Las acciones masivas (cambiar el paquete, desactivar, reactivar) se aplican
+en una sola transacción del catálogo.
+"""
+
+import base64
+import binascii
+import json
+
+import listados
+import usage
+
+DEFAULT_PAGE_SIZE = 50
+ESTADOS = ('activos', 'inactivos')
+ACCIONES = {
+    'paquete': 'UPDATE usuarios SET paquete_id = ? WHERE id = ? AND paquete_id IS NOT ?',
+    # Los administradores no se desactivan desde la consola
+    'desactivar': 'UPDATE usuarios SET activo = 0 WHERE id = ? AND activo = 1 AND es_admin = 0',
+    'activar': 'UPDATE usuarios SET activo = 1 WHERE id = ? AND activo = 0',
+}
+MAX_SELECCION = 500  # usuarios por acción (cada id es un parámetro de excedidos())
+
+# Fracción del límite más usado del paquete (propiedades, inquilinos o
+# contratos): MAX(t.propiedades / p.max_propiedades, ...), con los límites en
+# 0 o NULL contados como 1. La calculan los triggers de la migración 14.
+USO_SQL = 't.uso'
+
+# Orden pedido en la URL -> expresión SQL (sin NULL, para comparar cursores)
+ORDENES = {
+    'usuario': 'u.username',
+    'registro': "COALESCE(u.fecha_registro, '')",
+    'acceso': "COALESCE(u.ultimo_acceso, '')",
+    'paquete': "COALESCE(p.nombre, '')",
+    'propiedades': 't.propiedades',
+    'inquilinos': 't.inquilinos',
+    'contratos': 't.contratos_activos',
+    'uso': USO_SQL,
+}
+# Columna de desempate de cada orden: la que acompaña a su índice
+DESEMPATES = {'uso': 't.user_id'}
+
+CONSULTA_SQL = '''
+    SELECT u.id, u.username, u.email, u.nombre, u.apellido, u.activo, u.es_admin,
+           u.fecha_registro, u.ultimo_acceso, u.paquete_id, p.nombre AS paquete,
+           COALESCE(p.max_propiedades, 0) AS max_propiedades,
+           COALESCE(p.max_inquilinos, 0) AS max_inquilinos,
+           COALESCE(p.max_contratos, 0) AS max_contratos,
+           t.propiedades, t.inquilinos, t.contratos, t.contratos_activos,
+           {uso} AS uso, {actualizado} AS uso_actualizado, {orden} AS orden_valor
+    FROM {tabla} t
+    JOIN usuarios u ON u.id = t.user_id
+    LEFT JOIN paquetes p ON p.id = u.paquete_id
+    WHERE 1 = 1
+'''
+
+
+def _entero(valor, minimo=0):
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        return None
+    return valor if valor >= minimo else None
+
+
+def filtros(args):
+    """Filtros válidos pedidos en la URL (q, paquete, estado, uso_min, sin_acceso)"""
+    resultado = {}
+    q = (args.get('q') or '').strip()
+    if q:
+        resultado['q'] = q[:100]
+    paquete = _entero(args.get('paquete'), 1)
+    if paquete is not None:
+        resultado['paquete'] = paquete
+    if args.get('estado') in ESTADOS:
+        resultado['estado'] = args['estado']
+    uso_min = _entero(args.get('uso_min'), 1)
+    if uso_min is not None:
+        resultado['uso_min'] = uso_min
+    sin_acceso = _entero(args.get('sin_acceso'), 1)
+    if sin_acceso is not None:
+        resultado['sin_acceso'] = sin_acceso
+    return resultado
+
+
+def orden(args):
+    """(columna, descendente) pedidos en la URL; por defecto, los más cerca del límite primero"""
+    columna = args.get('orden')
+    if columna not in ORDENES:
+        return 'uso', True
+    return columna, args.get('dir', 'desc') != 'asc'
+
+
+def _tabla_uso(con_shards):
+    return 'uso_shards' if con_shards else 'tenant_usage'
+
+
+def consulta(filtros, columna='uso', con_shards=False):
+    """SQL (terminado en su WHERE) y parámetros de la lista de usuarios"""
+    sql = CONSULTA_SQL.format(uso=USO_SQL, orden=ORDENES[columna], tabla=_tabla_uso(con_shards),
+                              actualizado='t.actualizado' if con_shards else 'NULL')
+    params = []
+    if 'q' in filtros:
+        patron = filtros['q'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        sql += " AND (u.username LIKE ? ESCAPE '\\' OR u.email LIKE ? ESCAPE '\\' OR u.apellido LIKE ? ESCAPE '\\')"
+        params += [patron] * 3
+    if 'paquete' in filtros:
+        sql += ' AND u.paquete_id = ?'
+        params.append(filtros['paquete'])
+    if 'estado' in filtros:
+        sql += ' AND u.activo = ?'
+        params.append(1 if filtros['estado'] == 'activos' else 0)
+    if 'uso_min' in filtros:
+        sql += f' AND {USO_SQL} >= ?'
+        params.append(filtros['uso_min'] / 100)
+    if 'sin_acceso' in filtros:
+        sql += " AND (u.ultimo_acceso IS NULL OR u.ultimo_acceso < datetime('now', ?))"
+        params.append(f"-{filtros['sin_acceso']} days")
+    return sql, params
+
+
+def encode_cursor(row):
+    """Cursor opaco con el valor de orden y el id de una fila"""
+    valor = json.dumps([row['orden_valor'], row['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(valor.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(valor, id) de un cursor, o None si no es válido"""
+    if not token:
+        return None
+    try:
+        valor, user_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return valor, int(user_id)
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def _consulta_pagina(filtros, columna, descendente, por_pagina, despues, antes, con_shards):
+    """SQL de una página (por_pagina + 1 filas) y los cursores decodificados"""
+    sql, params = consulta(filtros, columna, con_shards)
+    expresion = ORDENES[columna]
+    desempate = DESEMPATES.get(columna, 'u.id')
+    cursor_antes = decode_cursor(antes)
+    cursor_despues = None if cursor_antes else decode_cursor(despues)
+
+    # La página anterior se recorre en el sentido contrario y se invierte
+    sentido = 'DESC' if descendente != (cursor_antes is not None) else 'ASC'
+    cursor = cursor_antes or cursor_despues
+    if cursor is not None:
+        sql += f" AND ({expresion}, {desempate}) {'<' if sentido == 'DESC' else '>'} (?, ?)"
+        params += list(cursor)
+    sql += f' ORDER BY {expresion} {sentido}, {desempate} {sentido} LIMIT ?'
+    params.append(por_pagina + 1)
+    return sql, params, cursor_antes, cursor_despues
+
+
+def paginar(conn, filtros, columna, descendente, por_pagina, despues=None, antes=None, con_shards=False):
+    """Página de usuarios ordenada por `columna`, como listados.Pagina"""
+    sql, params, cursor_antes, cursor_despues = _consulta_pagina(
+        filtros, columna, descendente, por_pagina, despues, antes, con_shards)
+    hacia_atras = cursor_antes is not None
+
+    rows = conn.execute(sql, params).fetchall()
+    hay_mas = len(rows) > por_pagina
+    rows = rows[:por_pagina]
+    if hacia_atras:
+        rows.reverse()
+        tiene_anterior, tiene_siguiente = hay_mas, True
+    else:
+        tiene_anterior, tiene_siguiente = cursor_despues is not None, hay_mas
+
+    return listados.Pagina(
+        rows,
+        por_pagina,
+        siguiente=encode_cursor(rows[-1]) if rows and tiene_siguiente else None,
+        anterior=encode_cursor(rows[0]) if rows and tiene_anterior else None,
+    )
+
+
+def resumen(conn, con_shards=False):
+    """Totales de la consola en una sola pasada: usuarios, activos, cerca del límite y sin acceso"""
+    row = conn.execute(f'''
+        SELECT COUNT(*) AS usuarios, COALESCE(SUM(u.activo), 0) AS activos,
+               COALESCE(SUM({USO_SQL} >= 0.8), 0) AS cerca_del_limite,
+               COALESCE(SUM(u.ultimo_acceso IS NULL OR u.ultimo_acceso < datetime('now', '-90 days')), 0)
+                   AS sin_acceso_90
+        FROM usuarios u
+        JOIN {_tabla_uso(con_shards)} t ON t.user_id = u.id
+    ''').fetchone()
+    return dict(row)
+
+
+def aplicar(conn, accion, ids, paquete_id=None):
+    """Aplicar una acción de ACCIONES a varios usuarios en una transacción.
+
+    Devuelve cuántos usuarios cambiaron. Quien llama invalida las cachés
+    (cuentas, fragmentos) de los ids.
+    """
+    if accion == 'paquete':
+        params = [(paquete_id, user_id, paquete_id) for user_id in ids]
+    else:
+        params = [(user_id,) for user_id in ids]
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if accion == 'paquete' and conn.execute(
+                'SELECT 1 FROM paquetes WHERE id = ? AND activo = 1', (paquete_id,)).fetchone() is None:
+            raise ValueError('El paquete no existe o no está activo')
+        cambiados = conn.executemany(ACCIONES[accion], params).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return cambiados
+
+
+def excedidos(conn, ids, con_shards=False):
+    """Cuántos de los usuarios usan más de lo que permite su paquete (tras bajarlo de paquete)"""
+    marcadores = ', '.join('?' * len(ids))
+    return conn.execute(f'''
+        SELECT COUNT(*) FROM {_tabla_uso(con_shards)} t
+        WHERE t.user_id IN ({marcadores}) AND {USO_SQL} > 1
+    ''', list(ids)).fetchone()[0]
+
+
+def sincronizar(catalogo, bases):
+    """Copiar a uso_shards los contadores de cada shard; devuelve cuántos usuarios se copiaron.
+
+    `bases` son los (user_id, conexión) de shards.conexiones(). La copia se
+    reemplaza entera en una transacción del catálogo; los usuarios sin shard
+    quedan con una fila en cero y los triggers calculan el uso.
+    """
+    columnas = ', '.join(usage.CONTADORES)
+    filas = []
+    for user_id, conn in bases:
+        contadores = usage.get_usage(conn, user_id)
+        filas.append((user_id,) + tuple(contadores[nombre] for nombre in usage.CONTADORES))
+    catalogo.execute('BEGIN IMMEDIATE')
+    try:
+        catalogo.execute('DELETE FROM uso_shards')
+        catalogo.executemany(
+            f'INSERT INTO uso_shards (user_id, {columnas}) VALUES ({", ".join("?" * (len(usage.CONTADORES) + 1))})',
+            filas)
+        catalogo.execute('INSERT OR IGNORE INTO uso_shards (user_id) SELECT id FROM usuarios')
+        catalogo.commit()
+    except Exception:
+        catalogo.rollback()
+        raise
+    return len(filas)
@@ -0,0 +1,235 @@
+"""
+Registro de consultas lentas.
+
+Toda sentencia que tarde más que SLOW_QUERY_MS (ejecución más lectura de
+filas, medido por el observador de db.py) se escribe como una línea JSON en
+un log rotativo con su SQL normalizado, los tipos de sus parámetros (nunca los
+valores), la duración, el endpoint y la salida de EXPLAIN QUERY PLAN.
+
+Cada proceso escribe y rota su propio archivo, SLOW_QUERY_LOG.<pid>: rotar
+un archivo compartido no es seguro entre workers (uno renombra el archivo
+mientras otro escribe y se pierden o mezclan líneas). top() lee los archivos
+de todos los procesos (incluidos los rotados) y agrupa por forma de la
+consulta, así el resumen junta lo registrado por todos los workers. Los de
+procesos que ya no escriben se borran a los RETENER_DIAS días.
+
+Por defecto no se escribe nada: hay que indicar la ruta en SLOW_QUERY_LOG,
+idealmente en un disco que sobreviva a los deploys.
+"""
+
+import glob
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from flask import has_request_context, request
+
+import db
+
+# Valores por defecto, sobreescribibles por app.config o variables de entorno
+DEFAULT_CONFIG = {
+    'SLOW_QUERY_MS': 100,                   # 0 o menos = desactivado
+    'SLOW_QUERY_LOG': '',                   # ruta del log; vacío = desactivado
+    'SLOW_QUERY_LOG_BYTES': 5 * 1024 * 1024,
+    'SLOW_QUERY_LOG_BACKUPS': 3,
+}
+
+ORDENES = ('max_ms', 'total_ms', 'cantidad')
+RETENER_DIAS = 7  # días sin escrituras tras los que se borra el log de un proceso
+
+# Sentencias a las que se les puede pedir el plan
+EXPLICABLES = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+_CADENAS = re.compile(r"'(?:[^']|'')*'")
+_NUMEROS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_NOMBRADOS = re.compile(r':\w+')
+_ESPACIOS = re.compile(r'\s+')
+_LISTAS = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+
+logger = logging.getLogger('consultas_lentas')
+logger.propagate = False
+
+_umbral_ms = 0.0
+
+
+def normalizar(sql):
+    """Forma de la consulta: literales y parámetros como ?, listas IN colapsadas"""
+    sql = _CADENAS.sub('?', sql)
+    sql = _NUMEROS.sub('?', sql)
+    sql = _NOMBRADOS.sub('?', sql)
+    sql = _ESPACIOS.sub(' ', sql).strip()
+    return _LISTAS.sub('IN (?...)', sql)
+
+
+def _tipo(valor):
+    return 'NULL' if valor is None else type(valor).__name__
+
+
+def redactar(params):
+    """Tipos de los parámetros en lugar de sus valores"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {clave: _tipo(valor) for clave, valor in params.items()}
+    return [_tipo(valor) for valor in params]
+
+
+def plan(conn, sql, params):
+    """Detalle de EXPLAIN QUERY PLAN, sangrado según la jerarquía del plan.
+
+    Se ejecuta con un cursor común (no medido) para no volver a pasar por los
+    observadores. Sin conexión (cursor recolectado sin terminar de leerse, ver
+    db.agregar_observador) no hay plan.
+    """
+    palabras = sql.split(None, 1)
+    if conn is None or params is None or not palabras or palabras[0].upper() not in EXPLICABLES:
+        return None
+    try:
+        filas = sqlite3.Cursor(conn).execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    except sqlite3.Error as e:
+        return [f'(sin plan: {e})']
+    profundidad = {0: -1}
+    lineas = []
+    for fila in filas:
+        nivel = profundidad.get(fila[1], -1) + 1
+        profundidad[fila[0]] = nivel
+        lineas.append('  ' * nivel + fila[3])
+    return lineas
+
+
+def _observar(conn, sql, params, segundos):
+    ms = segundos * 1000
+    if _umbral_ms <= 0 or ms < _umbral_ms or not logger.handlers:
+        return
+    registro = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'ms': round(ms, 3),
+        'endpoint': (request.endpoint or 'desconocido') if has_request_context() else 'sin_request',
+        'metodo': request.method if has_request_context() else None,
+        'sql': normalizar(sql),
+        'params': redactar(params),
+        'plan': plan(conn, sql, params),
+    }
+    logger.warning(json.dumps(registro, ensure_ascii=False))
+
+
+def archivo_del_proceso(ruta, pid=None):
+    """Log que escribe el proceso `pid` (por defecto, el actual)"""
+    return f'{ruta}.{os.getpid() if pid is None else pid}'
+
+
+def _archivos(ruta):
+    """Logs de todos los procesos, con sus rotados, del más viejo al más nuevo"""
+    patron = re.compile(re.escape(os.path.basename(ruta)) + r'\.\d+(?:\.\d+)?$')
+    candidatos = [ruta] + [archivo for archivo in glob.glob(f'{glob.escape(ruta)}.*')
+                           if patron.match(os.path.basename(archivo))]
+    existentes = []
+    for archivo in candidatos:
+        try:
+            existentes.append((os.path.getmtime(archivo), archivo))
+        except FileNotFoundError:
+            continue
+    return [archivo for _, archivo in sorted(existentes)]
+
+
+def podar(ruta, dias=RETENER_DIAS):
+    """Borrar los logs (y rotados) que nadie escribe hace más de `dias` días"""
+    limite = time.time() - dias * 86400
+    for archivo in glob.glob(f'{glob.escape(ruta)}.*'):
+        try:
+            if os.path.getmtime(archivo) < limite:
+                os.remove(archivo)
+        except FileNotFoundError:
+            continue
+
+
+def top(ruta, limite=20, orden='max_ms'):
+    """Formas de consulta más lentas según el log, con el plan de su peor caso"""
+    if orden not in ORDENES:
+        orden = 'max_ms'
+    formas = {}
+    for archivo in _archivos(ruta):
+        with open(archivo, encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    continue
+                forma = formas.get(registro['sql'])
+                if forma is None:
+                    forma = formas[registro['sql']] = {
+                        'sql': registro['sql'], 'cantidad': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                        'endpoints': set(), 'plan': None, 'ultima': None,
+                    }
+                forma['cantidad'] += 1
+                forma['total_ms'] += registro['ms']
+                forma['endpoints'].add(registro['endpoint'])
+                forma['ultima'] = max(forma['ultima'] or '', registro['fecha'])
+                if registro['ms'] >= forma['max_ms']:
+                    forma['max_ms'] = registro['ms']
+                    forma['plan'] = registro.get('plan')
+
+    resultado = sorted(formas.values(), key=lambda forma: forma[orden], reverse=True)[:limite]
+    for forma in resultado:
+        forma['total_ms'] = round(forma['total_ms'], 3)
+        forma['promedio_ms'] = round(forma['total_ms'] / forma['cantidad'], 3)
+        forma['endpoints'] = sorted(forma['endpoints'])
+    return resultado
+
+
+def _config_value(app, key):
+    """Variable de entorno, si existe; si no, app.config"""
+    return os.environ.get(key, app.config.get(key, DEFAULT_CONFIG[key]))
+
+
+def umbral_ms(app):
+    """Umbral vigente en milisegundos; 0 si el registro está desactivado"""
+    if not _config_value(app, 'SLOW_QUERY_LOG'):
+        return 0.0
+    return max(float(_config_value(app, 'SLOW_QUERY_MS')), 0.0)
+
+
+def resumen(app, limite=20, orden='max_ms'):
+    """top() sobre el log configurado en la aplicación"""
+    if not _config_value(app, 'SLOW_QUERY_LOG'):
+        return []
+    return top(_config_value(app, 'SLOW_QUERY_LOG'), limite=limite, orden=orden)
+
+
+def configurar(app):
+    """(Re)abrir el log del proceso con la configuración vigente de la aplicación.
+
+    init_app() la llama al importar la app, que gunicorn hace en cada worker
+    (sin preload_app), así cada uno abre el archivo con su pid.
+    """
+    global _umbral_ms
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    _umbral_ms = umbral_ms(app)
+    if _umbral_ms <= 0:
+        return
+    ruta = _config_value(app, 'SLOW_QUERY_LOG')
+    podar(ruta)
+    handler = RotatingFileHandler(
+        archivo_del_proceso(ruta),
+        maxBytes=int(_config_value(app, 'SLOW_QUERY_LOG_BYTES')),
+        backupCount=int(_config_value(app, 'SLOW_QUERY_LOG_BACKUPS')),
+        encoding='utf-8', delay=True,
+    )
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.WARNING)
+
+
+def init_app(app):
+    """Registrar el log de consultas lentas en la aplicación"""
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+    configurar(app)
+    db.agregar_observador(_observar)
@@ -0,0 +1,171 @@
+"""
+Usuario actual y su paquete, con caché en el proceso.
+
+Los paquetes casi no cambian: se cargan completos al arrancar y se releen solo
+cuando se invalidan. Los usuarios se guardan en una caché LRU con vencimiento
+(TTL), de modo que las páginas autenticadas no releen en cada request quién
+es el usuario ni qué límites tiene su plan.
+
+Cada usuario guardado lleva la columna version de su fila, que un trigger
+sube cuando cambia alguna de COLUMNAS_USUARIO (migración 15). get_usuario()
+la compara en cada llamada con una búsqueda por clave primaria y relee la
+fila si no coincide, así desactivar una cuenta o cambiarle el paquete rige
+enseguida en todos los workers. invalidar_usuario() descarta la copia del
+proceso actual, por ejemplo tras un cambio que no sube la versión.
+
+Los paquetes no llevan versión: quien modifique la tabla paquetes debe llamar
+a invalidar_paquetes(), y en los demás workers el cambio se ve al reiniciar.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 300
+DEFAULT_MAXSIZE = 1024
+
+# Columnas de usuarios que se guardan en la caché (nunca el hash de la contraseña)
+COLUMNAS_USUARIO = ('id', 'username', 'email', 'nombre', 'apellido', 'paquete_id', 'es_admin', 'activo')
+
+VERSION_SQL = 'SELECT version FROM usuarios WHERE id = ?'
+
+
+class TTLCache:
+    """Caché LRU con vencimiento por entrada, segura entre threads"""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[0] < time.monotonic():
+                if entrada is not None:
+                    del self._datos[clave]
+                self.misses += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return entrada[1]
+
+    def set(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+
+    def invalidate(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._datos), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+_usuarios = TTLCache()
+_paquetes = None
+_paquetes_lock = threading.Lock()
+
+
+def configurar(ttl=DEFAULT_TTL, maxsize=DEFAULT_MAXSIZE):
+    """Reemplazar la caché de usuarios con otros parámetros (vacía)"""
+    global _usuarios
+    _usuarios = TTLCache(maxsize=maxsize, ttl=ttl)
+
+
+def cargar_paquetes(conn):
+    """Leer la tabla paquetes completa y dejarla en memoria"""
+    global _paquetes
+    paquetes = {row['id']: dict(row) for row in conn.execute('SELECT * FROM paquetes ORDER BY id')}
+    with _paquetes_lock:
+        _paquetes = paquetes
+    return paquetes
+
+
+def _todos_los_paquetes(get_conn):
+    paquetes = _paquetes
+    if paquetes is None:
+        paquetes = cargar_paquetes(get_conn())
+    return paquetes
+
+
+def get_paquetes(get_conn, solo_activos=True):
+    """Paquetes ordenados por id. get_conn solo se llama si hay que leer la base"""
+    paquetes = _todos_los_paquetes(get_conn).values()
+    return [p for p in paquetes if p['activo'] or not solo_activos]
+
+
+def get_paquete(get_conn, paquete_id):
+    """Un paquete por id, o None"""
+    return _todos_los_paquetes(get_conn).get(paquete_id)
+
+
+def get_usuario(get_conn, user_id):
+    """Usuario con los datos de su paquete, o None si no existe.
+
+    Devuelve un dict con las columnas de COLUMNAS_USUARIO más paquete_nombre,
+    paquete_precio y max_propiedades / max_inquilinos / max_contratos.
+    Con el usuario en la caché solo se lee su versión; la fila completa se
+    vuelve a leer si cambió en la base, aunque haya sido en otro proceso.
+    """
+    usuario = _usuarios.get(user_id)
+    if usuario is not None:
+        row = get_conn().execute(VERSION_SQL, (user_id,)).fetchone()
+        if row is None or row['version'] != usuario['version']:
+            _usuarios.invalidate(user_id)
+            usuario = None
+    if usuario is None:
+        row = get_conn().execute(
+            f'SELECT {", ".join(COLUMNAS_USUARIO)}, version FROM usuarios WHERE id = ?', (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        usuario = dict(row)
+        _usuarios.set(user_id, usuario)
+
+    paquete = get_paquete(get_conn, usuario['paquete_id']) or {}
+    return dict(
+        usuario,
+        paquete_nombre=paquete.get('nombre'),
+        paquete_precio=paquete.get('precio', 0),
+        max_propiedades=paquete.get('max_propiedades', 0),
+        max_inquilinos=paquete.get('max_inquilinos', 0),
+        max_contratos=paquete.get('max_contratos', 0),
+    )
+
+
+def invalidar_usuario(user_id):
+    """Descartar un usuario de la caché tras modificar su fila"""
+    _usuarios.invalidate(user_id)
+
+
+def invalidar_paquetes():
+    """Descartar los paquetes cargados tras modificar la tabla paquetes"""
+    global _paquetes
+    with _paquetes_lock:
+        _paquetes = None
+
+
+def reset():
+    """Vaciar ambas cachés (al cambiar de base de datos, por ejemplo en los tests)"""
+    _usuarios.clear()
+    invalidar_paquetes()
+
+
+def stats():
+    """Contadores de la caché de usuarios y cantidad de paquetes cargados"""
+    datos = _usuarios.stats()
+    datos['paquetes'] = len(_paquetes) if _paquetes is not None else None
+    return datos
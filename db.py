@@ -0,0 +1,438 @@
+"""
+Capa de conexiones a SQLite.
+
+Cada proceso (worker de gunicorn) mantiene un pool de conexiones ya abiertas y
+configuradas; cada request toma una sola conexión a través de flask.g y la
+devuelve al pool en teardown_appcontext.
+
+Las conexiones del pool miden cada sentencia (ejecución más lectura de filas)
+y avisan a los observadores registrados con agregar_observador(); así se
+cuentan consultas y tiempo en SQL sin tocar el código que las ejecuta.
+
+Los requests GET y HEAD leen de un segundo pool de conexiones de solo lectura
+(mode=ro), que no compiten con las escrituras. Las transacciones de escritura
+de un proceso se serializan con un lock de Python en vez de esperar en el
+busy handler de SQLite. Tras un request que escribió, el siguiente request del
+mismo usuario lee de la conexión de escritura, así ve sus propios cambios
+aunque las lecturas sean de una copia inmutable.
+"""
+
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request, session
+
+# Valores por defecto, sobreescribibles por app.config o variables de entorno
+DEFAULT_CONFIG = {
+    'SQLITE_POOL_SIZE': 8,
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_CACHE_SIZE': -16000,      # negativo = KiB (16 MB por conexión)
+    'SQLITE_MMAP_SIZE': 67108864,     # 64 MB
+    'SQLITE_BUSY_TIMEOUT': 5000,      # milisegundos
+    'SQLITE_READ_POOL_SIZE': 8,       # conexiones de solo lectura; 0 = todo por el pool de escritura
+    'SQLITE_READ_IMMUTABLE': False,   # solo si nada más escribe la base (copias de solo lectura)
+}
+
+SYNCHRONOUS_VALUES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+METODOS_LECTURA = ('GET', 'HEAD')
+# Sentencias que abren (o son) una transacción de escritura
+ESCRITURAS = ('BEGIN', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'CREATE', 'DROP', 'ALTER')
+# Clave de sesión: el próximo request lee de la conexión de escritura
+LEER_ESCRITURAS = '_leer_escrituras'
+
+# Funciones f(conn, sql, params, segundos) llamadas al terminar cada sentencia
+_observadores = []
+
+
+def agregar_observador(funcion):
+    """Registrar un observador de sentencias (una sola vez por función).
+
+    Se llama como funcion(conn, sql, params, segundos). `conn` es None cuando
+    la sentencia se da por terminada al recolectar un cursor que no se leyó
+    hasta el final: puede ser en otro thread, con la conexión ya devuelta al
+    pool, así que solo vale el tiempo.
+    """
+    if funcion not in _observadores:
+        _observadores.append(funcion)
+
+
+def quitar_observador(funcion):
+    if funcion in _observadores:
+        _observadores.remove(funcion)
+
+
+class CursorMedido(sqlite3.Cursor):
+    """Cursor que acumula el tiempo de una sentencia hasta que termina de leerse"""
+
+    _sql = None
+
+    def _empezar(self, sql, params):
+        self._terminar()
+        self._sql, self._params, self._segundos = sql, params, 0.0
+
+    def _terminar(self, con_conexion=True):
+        if self._sql is None:
+            return
+        sql, self._sql = self._sql, None
+        conn = self.connection if con_conexion else None
+        for observador in list(_observadores):
+            observador(conn, sql, self._params, self._segundos)
+
+    def _medir(self, metodo, *args):
+        inicio = time.perf_counter()
+        try:
+            return metodo(*args)
+        finally:
+            if self._sql is not None:
+                self._segundos += time.perf_counter() - inicio
+
+    def execute(self, sql, parameters=()):
+        self._empezar(sql, parameters)
+        self.connection._antes_de(sql)
+        try:
+            self._medir(super().execute, sql, parameters)
+        except Exception:
+            self._terminar()
+            self.connection._despues()
+            raise
+        self.connection._despues()
+        # Sin filas para leer (INSERT, UPDATE, ...): la sentencia ya terminó
+        if self.description is None:
+            self._terminar()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._empezar(sql, None)
+        self.connection._antes_de(sql)
+        try:
+            return self._medir(super().executemany, sql, seq_of_parameters)
+        finally:
+            self._terminar()
+            self.connection._despues()
+
+    def fetchone(self):
+        row = self._medir(super().fetchone)
+        if row is None:
+            self._terminar()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._medir(super().fetchmany, size)
+        if len(rows) < size:
+            self._terminar()
+        return rows
+
+    def fetchall(self):
+        rows = self._medir(super().fetchall)
+        self._terminar()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._medir(super().__next__)
+        except StopIteration:
+            self._terminar()
+            raise
+
+    def close(self):
+        self._terminar()
+        super().close()
+
+    def __del__(self):
+        # Desde el recolector de basura solo se informa el tiempo: la conexión
+        # puede estar en uso por otro request
+        self._terminar(con_conexion=False)
+
+
+class ConexionMedida(sqlite3.Connection):
+    """Conexión cuyos cursores son CursorMedido.
+
+    Si tiene `escritor` (el lock de su pool), lo toma antes de la primera
+    sentencia de escritura y lo suelta cuando la transacción termina.
+    """
+
+    escritor = None
+    escritor_timeout = -1
+    _con_escritor = False
+
+    def _antes_de(self, sql):
+        if self.escritor is None or self._con_escritor or self.in_transaction:
+            return
+        palabras = sql.split(None, 1)
+        if not palabras or palabras[0].upper() not in ESCRITURAS:
+            return
+        if not self.escritor.acquire(timeout=self.escritor_timeout):
+            raise sqlite3.OperationalError('database is locked')
+        self._con_escritor = True
+
+    def _despues(self):
+        # Una sentencia suelta en autocommit ya terminó su transacción
+        if self._con_escritor and not self.in_transaction:
+            self._con_escritor = False
+            self.escritor.release()
+
+    def commit(self):
+        try:
+            super().commit()
+        finally:
+            self._despues()
+
+    def rollback(self):
+        try:
+            super().rollback()
+        finally:
+            self._despues()
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self._con_escritor:
+                self._con_escritor = False
+                self.escritor.release()
+
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class ConnectionPool:
+    """Pool de conexiones SQLite reutilizables dentro de un proceso"""
+
+    def __init__(self, database, size=8, synchronous='NORMAL', cache_size=-16000,
+                 mmap_size=67108864, busy_timeout=5000, solo_lectura=False, immutable=False):
+        synchronous = str(synchronous).upper()
+        if synchronous not in SYNCHRONOUS_VALUES:
+            raise ValueError(f'Valor de synchronous no válido: {synchronous}')
+
+        self.database = database
+        self.size = int(size)
+        self.synchronous = synchronous
+        self.cache_size = int(cache_size)
+        self.mmap_size = int(mmap_size)
+        self.busy_timeout = int(busy_timeout)
+        self.solo_lectura = bool(solo_lectura)
+        self.immutable = bool(immutable)
+
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._cerrado = False
+        # Las conexiones de escritura del proceso se turnan para escribir
+        self._escritor = None if self.solo_lectura else threading.Lock()
+
+    def connect(self):
+        """Abrir una conexión nueva con los PRAGMAs del pool aplicados"""
+        if self.solo_lectura:
+            uri = pathlib.Path(self.database).absolute().as_uri() + '?mode=ro'
+            if self.immutable:
+                uri += '&immutable=1'
+            conn = sqlite3.connect(uri, uri=True, timeout=self.busy_timeout / 1000,
+                                   check_same_thread=False, factory=ConexionMedida)
+        else:
+            conn = sqlite3.connect(self.database, timeout=self.busy_timeout / 1000,
+                                   check_same_thread=False, factory=ConexionMedida)
+            conn.escritor = self._escritor
+            conn.escritor_timeout = self.busy_timeout / 1000
+            conn.execute('PRAGMA journal_mode = WAL')
+        conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA cache_size = {self.cache_size}')
+        conn.execute(f'PRAGMA mmap_size = {self.mmap_size}')
+        conn.execute(f'PRAGMA busy_timeout = {self.busy_timeout}')
+        return conn
+
+    def _check_fork(self):
+        """Descartar las conexiones heredadas del proceso padre tras un fork"""
+        if self._pid != os.getpid():
+            # No se cierran: pertenecen al proceso padre
+            self._idle = []
+            self._lock = threading.Lock()
+            self._escritor = None if self.solo_lectura else threading.Lock()
+            self._pid = os.getpid()
+
+    def acquire(self):
+        """Obtener una conexión del pool o abrir una nueva"""
+        self._check_fork()
+        with self._lock:
+            if self._idle:
+                self.hits += 1
+                return self._idle.pop()
+            self.misses += 1
+        return self.connect()
+
+    def release(self, conn):
+        """Devolver una conexión al pool, deshaciendo lo que no se haya confirmado"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if not self._cerrado and self._pid == os.getpid() and len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+            self.discarded += 1
+        conn.close()
+
+    def close_all(self):
+        """Cerrar todas las conexiones ociosas; las que estén en uso se cierran al devolverse"""
+        with self._lock:
+            self._cerrado = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        """Contadores del pool para diagnóstico"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'database': self.database,
+                'solo_lectura': self.solo_lectura,
+                'pid': self._pid,
+                'size': self.size,
+                'idle': len(self._idle),
+                'hits': self.hits,
+                'misses': self.misses,
+                'discarded': self.discarded,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+def _config_value(app, key):
+    if key in os.environ:
+        return os.environ[key]
+    return app.config.get(key, DEFAULT_CONFIG[key])
+
+
+def _activado(valor):
+    """Booleano de app.config o de una variable de entorno ('1', 'true', ...)"""
+    if isinstance(valor, str):
+        return valor.strip().lower() in ('1', 'true', 'yes', 'si', 'sí', 'on')
+    return bool(valor)
+
+
+def get_pool(app=None):
+    """Pool del proceso actual, creado la primera vez que se necesita"""
+    app = app or current_app
+    pool = app.extensions.get('sqlite_pool')
+    if pool is None:
+        pool = ConnectionPool(
+            app.config['DATABASE'],
+            size=_config_value(app, 'SQLITE_POOL_SIZE'),
+            synchronous=_config_value(app, 'SQLITE_SYNCHRONOUS'),
+            cache_size=_config_value(app, 'SQLITE_CACHE_SIZE'),
+            mmap_size=_config_value(app, 'SQLITE_MMAP_SIZE'),
+            busy_timeout=_config_value(app, 'SQLITE_BUSY_TIMEOUT'),
+        )
+        app.extensions['sqlite_pool'] = pool
+    return pool
+
+
+def get_pool_lectura(app=None):
+    """Pool de solo lectura del proceso, o None si SQLITE_READ_POOL_SIZE es 0"""
+    app = app or current_app
+    size = int(_config_value(app, 'SQLITE_READ_POOL_SIZE'))
+    if size <= 0:
+        return None
+    pool = app.extensions.get('sqlite_pool_lectura')
+    if pool is None:
+        pool = ConnectionPool(
+            app.config['DATABASE'],
+            size=size,
+            synchronous=_config_value(app, 'SQLITE_SYNCHRONOUS'),
+            cache_size=_config_value(app, 'SQLITE_CACHE_SIZE'),
+            mmap_size=_config_value(app, 'SQLITE_MMAP_SIZE'),
+            busy_timeout=_config_value(app, 'SQLITE_BUSY_TIMEOUT'),
+            solo_lectura=True,
+            immutable=_activado(_config_value(app, 'SQLITE_READ_IMMUTABLE')),
+        )
+        app.extensions['sqlite_pool_lectura'] = pool
+    return pool
+
+
+def reset_pool(app=None):
+    """Cerrar los pools actuales para que se vuelvan a crear con la configuración vigente"""
+    app = app or current_app
+    for clave in ('sqlite_pool', 'sqlite_pool_lectura'):
+        pool = app.extensions.pop(clave, None)
+        if pool is not None:
+            pool.close_all()
+
+
+def _pool_del_request():
+    """Pool de lectura para GET/HEAD, salvo justo después de que el usuario escribió"""
+    if not has_request_context() or request.method not in METODOS_LECTURA:
+        return get_pool()
+    if session.pop(LEER_ESCRITURAS, False):
+        return get_pool()
+    return get_pool_lectura() or get_pool()
+
+
+def get_db(pool=None):
+    """Conexión del request actual (una sola por request).
+
+    Sin argumentos es la base principal (DATABASE): de solo lectura en los
+    GET, de escritura en los demás métodos. Con `pool`, la base de ese pool,
+    por ejemplo la del usuario en modo shards (ver shards.py). Un request usa
+    a lo sumo una base además de la principal.
+    """
+    if pool is None:
+        if 'db' not in g:
+            g.db_pool = _pool_del_request()
+            g.db = g.db_pool.acquire()
+            g.db_cambios = g.db.total_changes
+        return g.db
+    if 'db_shard' not in g:
+        g.db_shard = (pool, pool.acquire())
+        g.db_shard_cambios = g.db_shard[1].total_changes
+    elif g.db_shard[0] is not pool:
+        raise RuntimeError('El request ya usa otra base además de la principal')
+    return g.db_shard[1]
+
+
+def escribio():
+    """Si el request actual modificó filas en alguna de sus conexiones"""
+    cambios = 'db' in g and g.db.total_changes != g.db_cambios
+    if 'db_shard' in g:
+        cambios = cambios or g.db_shard[1].total_changes != g.db_shard_cambios
+    return cambios
+
+
+def marcar_escrituras(response):
+    """Si el request escribió, el próximo request del usuario lee lo que escribió.
+
+    Corre en after_request, antes de que se guarde la cookie de sesión.
+    """
+    if escribio():
+        session[LEER_ESCRITURAS] = True
+    return response
+
+
+def close_db(exception=None):
+    """Devolver las conexiones del request a sus pools"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        g.pop('db_pool').release(conn)
+    shard = g.pop('db_shard', None)
+    if shard is not None:
+        shard[0].release(shard[1])
+
+
+def init_app(app):
+    """Registrar la capa de conexiones en la aplicación"""
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+    app.after_request(marcar_escrituras)
+    app.teardown_appcontext(close_db)
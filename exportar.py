@@ -0,0 +1,166 @@
+"""
+Exportación de propiedades, inquilinos y contratos a CSV y XLSX.
+
+Las filas se leen del cursor en lotes y el archivo se genera por partes, de
+modo que la memoria usada no depende del tamaño de la exportación y la
+descarga empieza en cuanto sale el primer lote. El XLSX se arma a mano como
+un zip en streaming, sin dependencias externas.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+TAMANO_LOTE = 500
+
+# (columna de la consulta, encabezado)
+COLUMNAS = {
+    'propiedades': [
+        ('id', 'ID'), ('direccion', 'Dirección'), ('tipo', 'Tipo'), ('habitaciones', 'Habitaciones'),
+        ('baños', 'Baños'), ('precio', 'Precio'), ('estado', 'Estado'), ('fecha_creacion', 'Fecha Creación'),
+    ],
+    'inquilinos': [
+        ('id', 'ID'), ('nombre', 'Nombre'), ('apellido', 'Apellido'), ('email', 'Email'),
+        ('telefono', 'Teléfono'), ('dni', 'DNI'), ('fecha_creacion', 'Fecha Registro'),
+    ],
+    'contratos': [
+        ('id', 'ID'), ('direccion', 'Propiedad'), ('inquilino', 'Inquilino'), ('fecha_inicio', 'Fecha Inicio'),
+        ('fecha_fin', 'Fecha Fin'), ('precio_mensual', 'Precio Mensual'), ('estado', 'Estado'),
+        ('fecha_creacion', 'Fecha Creación'),
+    ],
+}
+
+
+def filas(conn, sql, params, columnas, alias='', tamano_lote=TAMANO_LOTE):
+    """Filas de la consulta como tuplas, leídas del cursor de a lotes"""
+    prefijo = f'{alias}.' if alias else ''
+    cursor = conn.execute(f'{sql} ORDER BY {prefijo}fecha_creacion DESC, {prefijo}id DESC', params)
+    while True:
+        lote = cursor.fetchmany(tamano_lote)
+        if not lote:
+            break
+        for row in lote:
+            valores = []
+            for columna, _ in columnas:
+                if columna == 'inquilino':
+                    valores.append(f"{row['nombre']} {row['apellido']}")
+                else:
+                    valores.append(row[columna])
+            yield tuple(valores)
+
+
+def csv_stream(encabezados, filas, filas_por_parte=200):
+    """Generar un CSV por partes (con BOM para que Excel detecte UTF-8)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(encabezados)
+    for n, fila in enumerate(filas, start=1):
+        writer.writerow(fila)
+        if n % filas_por_parte == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _SalidaZip(io.RawIOBase):
+    """Destino no posicionable para zipfile: acumula lo escrito hasta vaciarlo"""
+
+    def __init__(self):
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+
+# Caracteres no permitidos en XML 1.0
+_XML_INVALIDO = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>'''
+
+_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+_WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{hoja}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+
+_WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>'''
+
+
+def _celda(valor):
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f'<c t="n"><v>{valor}</v></c>'
+    texto = escape(_XML_INVALIDO.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila(valores):
+    return '<row>' + ''.join(_celda(valor) for valor in valores) + '</row>'
+
+
+def xlsx_stream(encabezados, filas, hoja='Datos', filas_por_parte=200):
+    """Generar un libro XLSX de una hoja por partes"""
+    salida = _SalidaZip()
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_DEFLATED) as libro:
+        libro.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        libro.writestr('_rels/.rels', _RELS)
+        libro.writestr('xl/workbook.xml', _WORKBOOK.format(hoja=escape(hoja)))
+        libro.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        yield salida.vaciar()
+
+        with libro.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_fila(encabezados).encode('utf-8'))
+            partes = []
+            for n, fila in enumerate(filas, start=1):
+                partes.append(_fila(fila))
+                if n % filas_por_parte == 0:
+                    sheet.write(''.join(partes).encode('utf-8'))
+                    partes = []
+                    yield salida.vaciar()
+            sheet.write(''.join(partes).encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+    yield salida.vaciar()
+
+
+def stream(formato, recurso, filas):
+    """Generador del archivo pedido"""
+    encabezados = [encabezado for _, encabezado in COLUMNAS[recurso]]
+    if formato == 'xlsx':
+        return xlsx_stream(encabezados, filas, hoja=recurso.title())
+    return csv_stream(encabezados, filas)
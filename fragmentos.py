@@ -0,0 +1,432 @@
+"""
+Caché de fragmentos HTML ya renderizados, por usuario.
+
+El dashboard y los listados se arman con bloques (estadísticas, recientes,
+vencimientos, tablas) que solo cambian cuando el usuario escribe. Cada bloque
+se guarda con una clave que incluye la versión de los datos del usuario; un
+acierto se sirve sin consultar SQLite ni renderizar Jinja. Las entradas con
+una versión vieja no se borran: dejan de pedirse y salen por LRU o por
+vencimiento.
+
+La versión tiene cuatro partes:
+
+- la marca de tenant_usage (cambios, migración 9), que los triggers suben con
+  cada escritura en propiedades, inquilinos o contratos, venga de un request,
+  de `flask vencer-contratos` o de cualquier otro proceso. Es la misma lectura
+  por clave primaria que hace el ETag de condicional.py, una vez por request;
+- un contador por usuario en el backend, que se incrementa cuando un request
+  del usuario modifica filas (after_request) o al llamar a invalidar(), para
+  los cambios que no pasan por esas tablas (por ejemplo, el paquete);
+- una marca en la sesión que cambia con cada escritura, para que el usuario
+  vea sus cambios enseguida aunque el siguiente request lo atienda otro
+  worker;
+- la fecha del día, porque los vencimientos y el informe mensual dependen de
+  ella.
+
+Backends (FRAGMENTOS_BACKEND):
+
+- memoria: LRU del proceso acotada en bytes (FRAGMENTOS_MAX_BYTES). Los
+  contadores también son del proceso: con varios workers, un invalidar()
+  hecho en otro proceso puede tardar hasta FRAGMENTOS_TTL segundos en verse
+  (las escrituras en los datos se ven enseguida por la marca de la base).
+- archivos: un archivo por entrada en FRAGMENTOS_DIR, compartido por todos
+  los workers; en /dev/shm queda en memoria compartida.
+- ninguno: sin caché.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date
+
+from flask import current_app, g, session
+from markupsafe import Markup
+
+import condicional
+import db
+import metricas
+
+# Valores por defecto, sobreescribibles por app.config o variables de entorno
+DEFAULT_CONFIG = {
+    'FRAGMENTOS_BACKEND': 'memoria',            # memoria, archivos o ninguno
+    'FRAGMENTOS_DIR': '',                       # para archivos; vacío = <tmp>/alquileres-fragmentos
+    'FRAGMENTOS_MAX_BYTES': 32 * 1024 * 1024,   # tamaño máximo de la caché
+    'FRAGMENTOS_TTL': 300,                      # segundos que vive cada entrada
+}
+
+VERSION_SESION = '_fragmentos_version'
+TODOS = '*'           # contador que invalida a todos los usuarios
+PODAR_CADA = 256      # escrituras entre podas del backend de archivos
+
+
+class Memoria:
+    """LRU del proceso acotada en bytes, con vencimiento por entrada"""
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = int(max_bytes)
+        self.ttl = float(ttl)
+        self.bytes = 0
+        self.desalojos = 0
+        self._datos = OrderedDict()
+        self._versiones = {}
+        self._lock = threading.Lock()
+
+    def version(self, clave):
+        with self._lock:
+            return str(self._versiones.get(clave, 0))
+
+    def incrementar(self, clave):
+        with self._lock:
+            self._versiones[clave] = self._versiones.get(clave, 0) + 1
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            vence, valor = entrada
+            if vence < time.monotonic():
+                del self._datos[clave]
+                self.bytes -= len(valor)
+                return None
+            self._datos.move_to_end(clave)
+            return valor.decode('utf-8')
+
+    def set(self, clave, valor):
+        valor = valor.encode('utf-8')
+        if len(valor) > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._datos.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= len(anterior[1])
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self.bytes += len(valor)
+            while self.bytes > self.max_bytes:
+                _, (_, viejo) = self._datos.popitem(last=False)
+                self.bytes -= len(viejo)
+                self.desalojos += 1
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memoria', 'entradas': len(self._datos), 'bytes': self.bytes,
+                    'max_bytes': self.max_bytes, 'ttl': self.ttl, 'desalojos': self.desalojos}
+
+
+class Archivos:
+    """Un archivo por entrada en un directorio compartido entre procesos.
+
+    Las escrituras van a un temporal y se publican con os.replace, así un
+    lector nunca ve un archivo a medias. Cada PODAR_CADA escrituras se borran
+    los vencidos y, si se supera max_bytes, los menos usados.
+    """
+
+    def __init__(self, carpeta, max_bytes, ttl):
+        self.carpeta = carpeta
+        self.max_bytes = int(max_bytes)
+        self.ttl = float(ttl)
+        self.desalojos = 0
+        self._escrituras = 0
+        self._lock = threading.Lock()
+        for sub in ('f', 'v'):
+            os.makedirs(os.path.join(carpeta, sub), exist_ok=True)
+
+    def _escribir(self, ruta, datos):
+        temporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporal, 'wb') as archivo:
+            archivo.write(datos)
+        os.replace(temporal, ruta)
+
+    def _ruta(self, clave):
+        return os.path.join(self.carpeta, 'f', hashlib.sha1(clave.encode('utf-8')).hexdigest())
+
+    def _ruta_version(self, clave):
+        return os.path.join(self.carpeta, 'v', hashlib.sha1(str(clave).encode('utf-8')).hexdigest())
+
+    def version(self, clave):
+        try:
+            with open(self._ruta_version(clave), 'rb') as archivo:
+                return archivo.read().decode('ascii')
+        except FileNotFoundError:
+            return '0'
+
+    def incrementar(self, clave):
+        # Una marca nueva, no un contador: dos procesos no pueden pisarse
+        self._escribir(self._ruta_version(clave), uuid.uuid4().hex.encode('ascii'))
+
+    def get(self, clave):
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, 'rb') as archivo:
+                if os.fstat(archivo.fileno()).st_mtime + self.ttl < time.time():
+                    return None
+                valor = archivo.read()
+        except FileNotFoundError:
+            return None
+        # La fecha de acceso ordena la poda (LRU aproximada)
+        try:
+            os.utime(ruta, (time.time(), os.stat(ruta).st_mtime))
+        except OSError:
+            pass
+        return valor.decode('utf-8')
+
+    def set(self, clave, valor):
+        valor = valor.encode('utf-8')
+        if len(valor) > self.max_bytes:
+            return
+        self._escribir(self._ruta(clave), valor)
+        with self._lock:
+            self._escrituras += 1
+            podar = self._escrituras % PODAR_CADA == 0
+        if podar:
+            self.podar()
+
+    def _entradas(self):
+        carpeta = os.path.join(self.carpeta, 'f')
+        entradas = []
+        for nombre in os.listdir(carpeta):
+            if nombre.endswith('.tmp'):
+                continue
+            try:
+                st = os.stat(os.path.join(carpeta, nombre))
+            except FileNotFoundError:
+                continue
+            entradas.append((st.st_atime, st.st_mtime, st.st_size, os.path.join(carpeta, nombre)))
+        return entradas
+
+    def _borrar(self, ruta):
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+    def podar(self):
+        """Borrar las entradas vencidas y las menos usadas hasta quedar en max_bytes"""
+        limite = time.time() - self.ttl
+        vigentes = []
+        for entrada in self._entradas():
+            if entrada[1] < limite:
+                self._borrar(entrada[3])
+            else:
+                vigentes.append(entrada)
+        total = sum(entrada[2] for entrada in vigentes)
+        vigentes.sort()
+        for _, _, tamano, ruta in vigentes:
+            if total <= self.max_bytes:
+                break
+            self._borrar(ruta)
+            total -= tamano
+            with self._lock:
+                self.desalojos += 1
+
+    def clear(self):
+        for entrada in self._entradas():
+            self._borrar(entrada[3])
+
+    def stats(self):
+        entradas = self._entradas()
+        return {'backend': 'archivos', 'directorio': self.carpeta, 'entradas': len(entradas),
+                'bytes': sum(entrada[2] for entrada in entradas), 'max_bytes': self.max_bytes,
+                'ttl': self.ttl, 'desalojos': self.desalojos}
+
+
+class Contadores:
+    """Aciertos y fallos por fragmento en el proceso"""
+
+    def __init__(self):
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def sumar(self, nombre, acierto):
+        with self._lock:
+            contador = self._datos.setdefault(nombre, [0, 0])
+            contador[0 if acierto else 1] += 1
+
+    def stats(self):
+        with self._lock:
+            datos = {nombre: tuple(contador) for nombre, contador in self._datos.items()}
+        return {
+            nombre: {'hits': hits, 'misses': misses,
+                     'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else 0.0}
+            for nombre, (hits, misses) in sorted(datos.items())
+        }
+
+    def reset(self):
+        with self._lock:
+            self._datos.clear()
+
+
+CONTADORES = Contadores()
+
+
+def _config_value(app, key):
+    """Variable de entorno, si existe; si no, app.config"""
+    return os.environ.get(key, app.config.get(key, DEFAULT_CONFIG[key]))
+
+
+def _directorio(app):
+    return _config_value(app, 'FRAGMENTOS_DIR') or os.path.join(tempfile.gettempdir(), 'alquileres-fragmentos')
+
+
+def get_cache(app=None):
+    """Backend del proceso actual, o None si la caché está desactivada"""
+    app = app or current_app
+    backend = _config_value(app, 'FRAGMENTOS_BACKEND')
+    if backend not in ('memoria', 'archivos'):
+        return None
+    cache = app.extensions.get('fragmentos')
+    if cache is None:
+        max_bytes = _config_value(app, 'FRAGMENTOS_MAX_BYTES')
+        ttl = _config_value(app, 'FRAGMENTOS_TTL')
+        if backend == 'archivos':
+            cache = Archivos(_directorio(app), max_bytes, ttl)
+        else:
+            cache = Memoria(max_bytes, ttl)
+        app.extensions['fragmentos'] = cache
+    return cache
+
+
+def reset_cache(app=None):
+    """Descartar el backend del proceso (se vuelve a crear con la configuración actual)"""
+    app = app or current_app
+    app.extensions.pop('fragmentos', None)
+    CONTADORES.reset()
+
+
+def _version(cache, user_id):
+    """Versión de los datos del usuario, leída una vez por request"""
+    versiones = g.setdefault('fragmentos_versiones', {})
+    if user_id not in versiones:
+        cambios, _ = condicional.marca(current_app.extensions['fragmentos_conexion'](), user_id)
+        versiones[user_id] = '.'.join((str(cambios), cache.version(TODOS), cache.version(user_id),
+                                       session.get(VERSION_SESION, '0'), date.today().isoformat()))
+    return versiones[user_id]
+
+
+def _clave(cache, nombre, partes):
+    user_id = session['user_id']
+    return '|'.join([nombre, str(user_id), _version(cache, user_id)] + [repr(parte) for parte in partes])
+
+
+def obtener(nombre, calcular, *partes):
+    """HTML del fragmento `nombre` del usuario de la sesión.
+
+    `partes` distingue variantes del mismo fragmento (filtros, página);
+    `calcular()` lo renderiza cuando no está en la caché. Las consultas deben
+    hacerse dentro de `calcular` para que un acierto no toque la base.
+    """
+    cache = get_cache()
+    if cache is None:
+        return Markup(calcular())
+    clave = _clave(cache, nombre, partes)
+    valor = cache.get(clave)
+    CONTADORES.sumar(nombre, valor is not None)
+    if valor is None:
+        valor = str(calcular())
+        cache.set(clave, valor)
+    return Markup(valor)
+
+
+def trozos(nombre, calcular, *partes):
+    """Como obtener(), pero entrega el HTML de a trozos.
+
+    `calcular()` puede devolver el HTML completo o un iterador (stream_template):
+    en ese caso cada trozo se entrega apenas se genera y el fragmento entra en
+    la caché al terminar. Es un generador, así que nada se calcula hasta que
+    la plantilla que lo incluye llega a ese punto. Antes de calcular entrega
+    un trozo vacío: listados.en_bloques() lo toma como la señal para enviar lo
+    ya renderizado (el encabezado de la página) sin esperar a las consultas.
+    """
+    cache = get_cache()
+    clave = None
+    if cache is not None:
+        clave = _clave(cache, nombre, partes)
+        valor = cache.get(clave)
+        CONTADORES.sumar(nombre, valor is not None)
+        if valor is not None:
+            yield Markup(valor)
+            return
+    yield Markup('')
+    resultado = calcular()
+    if isinstance(resultado, str):
+        if clave is not None:
+            cache.set(clave, str(resultado))
+        yield Markup(resultado)
+        return
+    generado = [] if clave is not None else None
+    for trozo in resultado:
+        if generado is not None:
+            generado.append(trozo)
+        yield Markup(trozo)
+    if generado is not None:
+        cache.set(clave, ''.join(generado))
+
+
+def invalidar(user_id, app=None):
+    """Descartar los fragmentos de un usuario (por ejemplo, tras cambiarle el paquete)"""
+    cache = get_cache(app)
+    if cache is not None:
+        cache.incrementar(user_id)
+
+
+def invalidar_todos(app=None):
+    """Descartar los fragmentos de todos los usuarios (en este proceso, con el backend memoria)"""
+    cache = get_cache(app)
+    if cache is not None:
+        cache.incrementar(TODOS)
+
+
+def _invalidar_escrituras(response):
+    """Si el request modificó filas, nueva versión para el usuario de la sesión"""
+    if 'user_id' in session and db.escribio():
+        invalidar(session['user_id'])
+        session[VERSION_SESION] = uuid.uuid4().hex[:8]
+    return response
+
+
+def stats(app=None):
+    cache = get_cache(app)
+    return {'cache': cache.stats() if cache is not None else None, 'fragmentos': CONTADORES.stats()}
+
+
+def _metricas(app):
+    por_fragmento = CONTADORES.stats()
+    lineas = []
+    for nombre, ayuda, clave in (
+        ('fragment_cache_hits_total', 'Fragmentos servidos desde la caché', 'hits'),
+        ('fragment_cache_misses_total', 'Fragmentos renderizados', 'misses'),
+    ):
+        lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} counter']
+        lineas += [f'{nombre}{{fragmento="{fragmento}"}} {valores[clave]}'
+                   for fragmento, valores in por_fragmento.items()]
+    cache = app.extensions.get('fragmentos')
+    if cache is not None and isinstance(cache, Memoria):
+        datos = cache.stats()
+        lineas += ['# HELP fragment_cache_bytes Bytes en la caché de fragmentos del proceso',
+                   '# TYPE fragment_cache_bytes gauge', f'fragment_cache_bytes {datos["bytes"]}',
+                   '# HELP fragment_cache_evictions_total Fragmentos desalojados por tamaño',
+                   '# TYPE fragment_cache_evictions_total counter',
+                   f'fragment_cache_evictions_total {datos["desalojos"]}']
+    return lineas
+
+
+def init_app(app, get_conn):
+    """Registrar la configuración, la invalidación por escrituras y las métricas.
+
+    `get_conn` devuelve la conexión con el tenant_usage del usuario de la
+    sesión (en modo shards, su base), como en condicional.validar().
+    """
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+    app.extensions['fragmentos_conexion'] = get_conn
+    app.after_request(_invalidar_escrituras)
+    metricas.REGISTRO.colector(lambda: _metricas(app))
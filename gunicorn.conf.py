@@ -0,0 +1,43 @@
+"""Configuración de gunicorn (se carga automáticamente desde el directorio de trabajo)"""
+
+import os
+import sys
+
+import migrations
+
+# Código de salida con el que el master de gunicorn se detiene en vez de
+# volver a levantar el worker (APP_LOAD_ERROR)
+ERROR_DE_CARGA = 4
+
+# Workers con threads: mientras un thread espera el hash de una contraseña en
+# el pool de procesos de claves.py, los demás siguen atendiendo requests. Con
+# workers sync cada proceso atiende un request por vez y el hash lo bloquea.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Hashes pendientes por worker antes de rechazar logins con 503: la mitad de
+# los threads, así una ráfaga de logins no ocupa el worker entero
+os.environ.setdefault('PASSWORD_HASH_MAX_QUEUE', str(max(1, threads // 2)))
+
+
+def on_starting(server):
+    """Aplicar las migraciones una sola vez, en el master y antes del fork de los workers"""
+    database = os.environ.get('DATABASE', 'alquileres.db')
+    version = migrations.migrate(database)
+    server.log.info('Esquema de %s en la versión %s', database, version)
+
+def post_worker_init(worker):
+    """Cargar la tabla paquetes en la caché de cuentas y arrancar las tareas periódicas de cada worker"""
+    import activos
+    import cuentas
+    import db
+    from app import app, iniciar_tareas
+
+    try:
+        activos.verificar(app)
+    except RuntimeError as e:
+        worker.log.error('%s', e)
+        sys.exit(ERROR_DE_CARGA)
+    with app.app_context():
+        cuentas.cargar_paquetes(db.get_db())
+    iniciar_tareas()
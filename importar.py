@@ -0,0 +1,231 @@
+"""
+Importación masiva de propiedades e inquilinos desde CSV.
+
+El archivo se lee en streaming y se valida por lotes. Las filas válidas se
+insertan con executemany dentro de una sola transacción, y el límite del
+paquete se controla una vez contra el total importado. Las filas con errores
+no se importan y se informan con su número de línea.
+"""
+
+import csv
+import io
+import time
+import unicodedata
+
+import listados
+import usage
+
+TAMANO_LOTE = 500
+MAX_ERRORES = 200
+
+# Nombre normalizado del encabezado -> columna. Acepta también los
+# encabezados de la exportación (Dirección, Teléfono, ...).
+COLUMNAS = {
+    'propiedades': {
+        'direccion': 'direccion', 'tipo': 'tipo', 'habitaciones': 'habitaciones',
+        'banos': 'baños', 'precio': 'precio', 'estado': 'estado',
+    },
+    'inquilinos': {
+        'nombre': 'nombre', 'apellido': 'apellido', 'email': 'email',
+        'telefono': 'telefono', 'dni': 'dni',
+    },
+}
+
+INSERT_SQL = {
+    'propiedades': '''
+        INSERT INTO propiedades (user_id, direccion, tipo, habitaciones, baños, precio, estado)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''',
+    'inquilinos': '''
+        INSERT INTO inquilinos (user_id, nombre, apellido, email, telefono, dni)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''',
+}
+
+
+class ErrorImportacion(Exception):
+    """Error que impide importar el archivo completo"""
+
+
+class Resultado:
+    """Resumen de una importación"""
+
+    def __init__(self):
+        self.importadas = 0
+        self.procesadas = 0
+        self.errores = []
+        self.segundos = 0.0
+
+    @property
+    def filas_por_segundo(self):
+        return round(self.procesadas / self.segundos, 1) if self.segundos else 0.0
+
+    def agregar_error(self, linea, mensaje):
+        if len(self.errores) < MAX_ERRORES:
+            self.errores.append((linea, mensaje))
+
+
+def _normalizar(nombre):
+    nombre = unicodedata.normalize('NFKD', (nombre or '').strip().lower())
+    return ''.join(c for c in nombre if not unicodedata.combining(c)).replace(' ', '_')
+
+
+def _texto(valor):
+    valor = (valor or '').strip()
+    return valor or None
+
+
+def _entero(valor, campo):
+    valor = (valor or '').strip()
+    if not valor:
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        raise ValueError(f'{campo} debe ser un número entero')
+
+
+def leer_csv(archivo, recurso):
+    """Filas del CSV como (línea, dict columna -> valor), leídas en streaming"""
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    reader = csv.reader(texto)
+    try:
+        encabezados = next(reader)
+    except StopIteration:
+        raise ErrorImportacion('El archivo está vacío')
+    except UnicodeDecodeError:
+        raise ErrorImportacion('El archivo debe estar en UTF-8')
+
+    mapa = COLUMNAS[recurso]
+    columnas = [mapa.get(_normalizar(nombre)) for nombre in encabezados]
+    obligatorias = {'direccion', 'tipo', 'precio'} if recurso == 'propiedades' else {'nombre', 'apellido', 'dni'}
+    faltantes = obligatorias - set(columnas)
+    if faltantes:
+        raise ErrorImportacion(f"Faltan columnas obligatorias: {', '.join(sorted(faltantes))}")
+
+    try:
+        for fila in reader:
+            if not any(valor.strip() for valor in fila):
+                continue
+            datos = {columna: valor for columna, valor in zip(columnas, fila) if columna}
+            yield reader.line_num, datos
+    except UnicodeDecodeError:
+        raise ErrorImportacion('El archivo debe estar en UTF-8')
+
+
+def validar_propiedad(user_id, datos):
+    """Tupla de parámetros para el INSERT, o ValueError con el motivo"""
+    direccion = _texto(datos.get('direccion'))
+    tipo = (_texto(datos.get('tipo')) or '').lower()
+    estado = (_texto(datos.get('estado')) or 'disponible').lower()
+    if not direccion:
+        raise ValueError('La dirección es obligatoria')
+    if tipo not in listados.TIPOS_PROPIEDAD:
+        raise ValueError(f"Tipo no válido: {datos.get('tipo') or '(vacío)'}")
+    if estado not in listados.ESTADOS_PROPIEDAD:
+        raise ValueError(f'Estado no válido: {estado}')
+    try:
+        precio = float((datos.get('precio') or '').strip().replace('$', ''))
+    except ValueError:
+        raise ValueError('El precio debe ser un número')
+    if precio < 0:
+        raise ValueError('El precio no puede ser negativo')
+    habitaciones = _entero(datos.get('habitaciones'), 'Habitaciones')
+    banos = _entero(datos.get('baños'), 'Baños')
+    return (user_id, direccion, tipo, habitaciones, banos, precio, estado)
+
+
+def validar_inquilino(user_id, datos):
+    """Tupla de parámetros para el INSERT, o ValueError con el motivo"""
+    nombre = _texto(datos.get('nombre'))
+    apellido = _texto(datos.get('apellido'))
+    dni = _texto(datos.get('dni'))
+    # Vacíos como NULL: email y dni son UNIQUE y varios '' chocarían entre sí
+    email = _texto(datos.get('email'))
+    telefono = _texto(datos.get('telefono'))
+    if not nombre or not apellido or not dni:
+        raise ValueError('Nombre, apellido y DNI son obligatorios')
+    if email and '@' not in email:
+        raise ValueError(f'Email no válido: {email}')
+    return (user_id, nombre, apellido, email, telefono, dni)
+
+
+def _duplicados_inquilinos(conn, lote, vistos, resultado):
+    """Quitar del lote los inquilinos cuyo DNI o email ya existen (UNIQUE)"""
+    dnis = [params[5] for _, params in lote]
+    emails = [params[3] for _, params in lote if params[3]]
+    existentes = set()
+    for columna, valores in (('dni', dnis), ('email', emails)):
+        if valores:
+            marcadores = ', '.join('?' * len(valores))
+            existentes.update(
+                (columna, row[0])
+                for row in conn.execute(f'SELECT {columna} FROM inquilinos WHERE {columna} IN ({marcadores})', valores)
+            )
+
+    validas = []
+    for linea, params in lote:
+        claves = [('dni', params[5])] + ([('email', params[3])] if params[3] else [])
+        repetida = next((clave for clave in claves if clave in existentes or clave in vistos), None)
+        if repetida:
+            resultado.agregar_error(linea, f'{repetida[0].upper() if repetida[0] == "dni" else "Email"} ya registrado: {repetida[1]}')
+            continue
+        vistos.update(claves)
+        validas.append((linea, params))
+    return validas
+
+
+def importar(conn, user_id, recurso, filas, maximo, tamano_lote=TAMANO_LOTE):
+    """Importar las filas en una sola transacción y devolver el Resultado.
+
+    maximo es el límite del paquete para el recurso. Si el total lo supera o
+    falla la base, no se importa nada y se lanza ErrorImportacion.
+    """
+    validar = validar_propiedad if recurso == 'propiedades' else validar_inquilino
+    resultado = Resultado()
+    inicio = time.perf_counter()
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # El uso actual se lee una sola vez, dentro de la transacción
+        actual = usage.get_usage(conn, user_id)[recurso]
+        disponibles = maximo - actual
+
+        vistos = set()
+        lote = []
+
+        def insertar_lote():
+            nonlocal disponibles
+            validas = lote
+            if recurso == 'inquilinos':
+                validas = _duplicados_inquilinos(conn, lote, vistos, resultado)
+            if len(validas) > disponibles:
+                raise ErrorImportacion(
+                    f"El archivo supera el límite de {recurso} de tu paquete ({maximo}); "
+                    f"puedes agregar {maximo - actual} más")
+            conn.executemany(INSERT_SQL[recurso], [params for _, params in validas])
+            disponibles -= len(validas)
+            resultado.importadas += len(validas)
+            lote.clear()
+
+        for linea, datos in filas:
+            resultado.procesadas += 1
+            try:
+                lote.append((linea, validar(user_id, datos)))
+            except ValueError as e:
+                resultado.agregar_error(linea, str(e))
+            if len(lote) >= tamano_lote:
+                insertar_lote()
+        if lote:
+            insertar_lote()
+
+        conn.commit()
+    except ErrorImportacion:
+        conn.rollback()
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise ErrorImportacion(f'Error al importar: {e}')
+
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
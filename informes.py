@@ -0,0 +1,173 @@
+"""
+Informes de rentas y ocupación por mes (tabla renta_mensual).
+
+Por cada usuario, mes y propiedad, renta_mensual guarda cuántos contratos
+tocan el mes, los días ocupados, el ingreso esperado (precio_mensual
+prorrateado por los días del contrato dentro del mes) y el ingreso que vence
+(precio_mensual de los contratos que terminan ese mes). Los importes están en
+centavos. La mantienen los triggers de la migración 8 al crear, editar o
+borrar contratos, así un informe de varios años lee unas pocas filas por mes
+en vez de expandir cada contrato.
+
+verify() y rebuild() comparan y recalculan la tabla con una sola consulta
+sobre contratos y el calendario `meses`.
+"""
+
+from datetime import date
+
+VALORES = ('contratos', 'dias_ocupados', 'ingreso', 'ingreso_que_vence')
+MESES_ATRAS = 5
+MESES_ADELANTE = 6
+MAX_MESES = 120
+
+# Recuento real a partir de los contratos; misma fórmula que los triggers
+RECUENTO_SQL = '''
+    SELECT user_id, mes, propiedad_id, COUNT(*) AS contratos, SUM(dias) AS dias_ocupados,
+           SUM(CAST(ROUND(precio_mensual * 100 * dias / dias_mes) AS INTEGER)) AS ingreso,
+           SUM(CASE WHEN fecha_fin <= fin THEN CAST(ROUND(precio_mensual * 100) AS INTEGER) ELSE 0 END)
+               AS ingreso_que_vence
+    FROM (
+        SELECT c.user_id, c.propiedad_id, c.precio_mensual, c.fecha_fin, m.mes, m.fin, m.dias AS dias_mes,
+               CAST(julianday(MIN(c.fecha_fin, m.fin)) - julianday(MAX(c.fecha_inicio, m.inicio)) + 1
+                    AS INTEGER) AS dias
+        FROM contratos c
+        JOIN meses m ON m.mes BETWEEN substr(c.fecha_inicio, 1, 7) AND substr(c.fecha_fin, 1, 7)
+        WHERE c.estado IS NOT 'cancelado' {filtro}
+    )
+    GROUP BY user_id, mes, propiedad_id
+'''
+
+
+def _sumar_meses(anio, mes, cantidad):
+    total = anio * 12 + mes - 1 + cantidad
+    return total // 12, total % 12 + 1
+
+
+def _mes(valor):
+    """'AAAA-MM' válido, o None"""
+    try:
+        anio, mes = (int(parte) for parte in str(valor).split('-'))
+    except (TypeError, ValueError):
+        return None
+    if not (1990 <= anio <= 2099 and 1 <= mes <= 12):
+        return None
+    return anio, mes
+
+
+def periodo(args, hoy=None):
+    """Meses desde/hasta ('AAAA-MM') pedidos en la URL.
+
+    Por defecto, los últimos MESES_ATRAS meses, el actual y los MESES_ADELANTE
+    siguientes; el período se acota a MAX_MESES.
+    """
+    hoy = hoy or date.today()
+    desde = _mes(args.get('desde')) or _sumar_meses(hoy.year, hoy.month, -MESES_ATRAS)
+    hasta = _mes(args.get('hasta')) or _sumar_meses(hoy.year, hoy.month, MESES_ADELANTE)
+    if desde > hasta:
+        desde, hasta = hasta, desde
+    if (hasta[0] - desde[0]) * 12 + hasta[1] - desde[1] >= MAX_MESES:
+        hasta = _sumar_meses(*desde, MAX_MESES - 1)
+    return '%04d-%02d' % desde, '%04d-%02d' % hasta
+
+
+def mensual(conn, user_id, desde, hasta):
+    """Totales del usuario por mes, incluidos los meses sin contratos.
+
+    La ocupación es días ocupados sobre días disponibles de las propiedades
+    que el usuario tiene hoy.
+    """
+    propiedades = conn.execute(
+        'SELECT propiedades FROM tenant_usage WHERE user_id = ?', (user_id,)).fetchone()
+    propiedades = propiedades[0] if propiedades else 0
+    rows = conn.execute('''
+        SELECT m.mes, m.dias, COALESCE(SUM(r.contratos), 0) AS contratos,
+               COALESCE(SUM(r.dias_ocupados), 0) AS dias_ocupados, COALESCE(SUM(r.ingreso), 0) AS ingreso,
+               COALESCE(SUM(r.ingreso_que_vence), 0) AS ingreso_que_vence
+        FROM meses m
+        LEFT JOIN renta_mensual r ON r.user_id = ? AND r.mes = m.mes
+        WHERE m.mes BETWEEN ? AND ?
+        GROUP BY m.mes
+        ORDER BY m.mes
+    ''', (user_id, desde, hasta)).fetchall()
+
+    meses = []
+    for row in rows:
+        disponibles = propiedades * row['dias']
+        meses.append({
+            'mes': row['mes'],
+            'contratos': row['contratos'],
+            'ingreso_esperado': row['ingreso'] / 100,
+            'ingreso_que_vence': row['ingreso_que_vence'] / 100,
+            'dias_ocupados': row['dias_ocupados'],
+            'dias_disponibles': disponibles,
+            'ocupacion': round(min(1.0, row['dias_ocupados'] / disponibles), 4) if disponibles else 0.0,
+        })
+    return {'desde': desde, 'hasta': hasta, 'propiedades': propiedades, 'meses': meses}
+
+
+def vacancia(conn, user_id, desde, hasta):
+    """Días ocupados y vacantes de cada propiedad en el período, las más vacantes primero"""
+    dias = conn.execute('SELECT COALESCE(SUM(dias), 0) FROM meses WHERE mes BETWEEN ? AND ?',
+                        (desde, hasta)).fetchone()[0]
+    rows = conn.execute('''
+        SELECT p.id, p.direccion, p.estado, COALESCE(r.dias_ocupados, 0) AS dias_ocupados,
+               COALESCE(r.ingreso, 0) AS ingreso
+        FROM propiedades p
+        LEFT JOIN (
+            SELECT propiedad_id, SUM(dias_ocupados) AS dias_ocupados, SUM(ingreso) AS ingreso
+            FROM renta_mensual
+            WHERE user_id = ? AND mes BETWEEN ? AND ?
+            GROUP BY propiedad_id
+        ) r ON r.propiedad_id = p.id
+        WHERE p.user_id = ?
+    ''', (user_id, desde, hasta, user_id)).fetchall()
+
+    propiedades = [
+        {
+            'id': row['id'],
+            'direccion': row['direccion'],
+            'estado': row['estado'],
+            'dias_ocupados': min(row['dias_ocupados'], dias),
+            'dias_vacantes': max(0, dias - row['dias_ocupados']),
+            'ocupacion': round(min(1.0, row['dias_ocupados'] / dias), 4) if dias else 0.0,
+            'ingreso': row['ingreso'] / 100,
+        }
+        for row in rows
+    ]
+    propiedades.sort(key=lambda fila: (-fila['dias_vacantes'], fila['id']))
+    return {'desde': desde, 'hasta': hasta, 'dias': dias, 'propiedades': propiedades}
+
+
+def verify(conn):
+    """Comparar renta_mensual con los contratos.
+
+    Devuelve una lista de (user_id, mes, propiedad_id, guardado, real) con
+    cada fila distinta; los valores son tuplas en el orden de VALORES.
+    """
+    columnas = ', '.join(VALORES)
+    reales = {row[:3]: row[3:] for row in conn.execute(RECUENTO_SQL.format(filtro=''))}
+    guardados = {
+        row[:3]: row[3:]
+        for row in conn.execute(f'SELECT user_id, mes, propiedad_id, {columnas} FROM renta_mensual')
+    }
+
+    ceros = (0,) * len(VALORES)
+    diferencias = []
+    for clave in sorted(set(reales) | set(guardados)):
+        real, guardado = tuple(reales.get(clave, ceros)), tuple(guardados.get(clave, ceros))
+        if real != guardado:
+            diferencias.append(clave + (guardado, real))
+    return diferencias
+
+
+def rebuild(conn, user_id=None):
+    """Recalcular renta_mensual, de todos o de un usuario (la transacción la confirma quien llama)"""
+    filtro, params = ('AND c.user_id = ?', (user_id,)) if user_id is not None else ('', ())
+    if user_id is None:
+        conn.execute('DELETE FROM renta_mensual')
+    else:
+        conn.execute('DELETE FROM renta_mensual WHERE user_id = ?', (user_id,))
+    conn.execute(f'''
+        INSERT INTO renta_mensual (user_id, mes, propiedad_id, {", ".join(VALORES)})
+        {RECUENTO_SQL.format(filtro=filtro)}
+    ''', params)
@@ -0,0 +1,327 @@
+"""
+Listados paginados de propiedades, inquilinos y contratos.
+
+La paginación es por clave (keyset) sobre (fecha_creacion, id): cada página
+continúa desde la última fila de la anterior usando los índices
+(user_id, fecha_creacion), de modo que el costo de una página no depende de
+cuántas filas tenga el usuario. Los filtros se aplican en SQL, y las
+tarjetas de resumen salen de los contadores de tenant_usage (una búsqueda por
+clave primaria) en lugar de recorrer las filas del usuario.
+"""
+
+import base64
+import binascii
+
+import usage
+import vencimientos
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+ESTADOS_PROPIEDAD = ('disponible', 'alquilada', 'mantenimiento')
+TIPOS_PROPIEDAD = ('casa', 'departamento', 'local', 'oficina')
+ESTADOS_CONTRATO = ('activo', 'vencido', 'cancelado')
+
+# Últimas altas del usuario, para el dashboard
+PROPIEDADES_RECIENTES_SQL = '''
+    SELECT * FROM propiedades
+    WHERE user_id = ?
+    ORDER BY fecha_creacion DESC
+    LIMIT ?
+'''
+CONTRATOS_RECIENTES_SQL = '''
+    SELECT c.*, p.direccion, i.nombre, i.apellido
+    FROM contratos c
+    JOIN propiedades p ON c.propiedad_id = p.id
+    JOIN inquilinos i ON c.inquilino_id = i.id
+    WHERE c.user_id = ?
+    ORDER BY c.fecha_creacion DESC
+    LIMIT ?
+'''
+
+
+class Pagina:
+    """Una página de resultados y los cursores para moverse entre páginas"""
+
+    def __init__(self, items, por_pagina, siguiente=None, anterior=None):
+        self.items = items
+        self.por_pagina = por_pagina
+        self.siguiente = siguiente
+        self.anterior = anterior
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def encode_cursor(row):
+    """Cursor opaco a partir de la fecha de creación y el id de una fila"""
+    valor = f"{row['fecha_creacion'] or ''}|{row['id']}"
+    return base64.urlsafe_b64encode(valor.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(fecha_creacion, id) de un cursor, o None si no es válido"""
+    if not token:
+        return None
+    try:
+        valor = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        fecha, _, row_id = valor.rpartition('|')
+        return fecha, int(row_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def page_size(args, default=DEFAULT_PAGE_SIZE):
+    """Tamaño de página pedido en la URL, acotado a [1, MAX_PAGE_SIZE]"""
+    try:
+        size = int(args.get('por_pagina', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def _consulta_pagina(sql, params, por_pagina, despues, antes, alias):
+    """SQL de una página (una fila de más para saber si hay siguiente) y los cursores usados"""
+    prefijo = f'{alias}.' if alias else ''
+    clave = f'({prefijo}fecha_creacion, {prefijo}id)'
+    params = list(params)
+
+    cursor_antes = decode_cursor(antes)
+    cursor_despues = None if cursor_antes else decode_cursor(despues)
+
+    if cursor_antes:
+        # Página anterior: se recorre en orden ascendente y se invierte
+        sql += f' AND {clave} > (?, ?) ORDER BY {prefijo}fecha_creacion ASC, {prefijo}id ASC'
+        params.extend(cursor_antes)
+    else:
+        if cursor_despues:
+            sql += f' AND {clave} < (?, ?)'
+            params.extend(cursor_despues)
+        sql += f' ORDER BY {prefijo}fecha_creacion DESC, {prefijo}id DESC'
+    sql += ' LIMIT ?'
+    params.append(por_pagina + 1)
+    return sql, params, cursor_antes, cursor_despues
+
+
+def paginar(conn, sql, params, por_pagina, despues=None, antes=None, alias=''):
+    """Ejecutar una consulta filtrada y devolver una Pagina.
+
+    sql debe terminar en su cláusula WHERE (sin ORDER BY ni LIMIT) y
+    seleccionar las columnas id y fecha_creacion de la tabla principal.
+    """
+    sql, params, cursor_antes, cursor_despues = _consulta_pagina(sql, params, por_pagina, despues, antes, alias)
+    rows = conn.execute(sql, params).fetchall()
+    hay_mas = len(rows) > por_pagina
+    rows = rows[:por_pagina]
+
+    if cursor_antes:
+        rows.reverse()
+        tiene_anterior, tiene_siguiente = hay_mas, True
+    else:
+        tiene_anterior, tiene_siguiente = cursor_despues is not None, hay_mas
+
+    return Pagina(
+        rows,
+        por_pagina,
+        siguiente=encode_cursor(rows[-1]) if rows and tiene_siguiente else None,
+        anterior=encode_cursor(rows[0]) if rows and tiene_anterior else None,
+    )
+
+
+class PaginaCursor(Pagina):
+    """Pagina que va leyendo las filas del cursor mientras se recorre.
+
+    Sirve para renderizar con stream_template: cada fila se convierte en HTML
+    y se envía sin armar antes la lista completa. Se recorre una sola vez;
+    len() y siguiente se conocen al terminar (la plantilla los usa después de
+    la tabla) y, si se piden antes, descartan las filas que falten.
+    """
+
+    def __init__(self, cursor, por_pagina, tiene_anterior):
+        self._cursor = cursor
+        self._primera = cursor.fetchone()
+        self._ultima = None
+        self._leidas = 0
+        self._hay_mas = None
+        self.por_pagina = por_pagina
+        self.anterior = encode_cursor(self._primera) if self._primera is not None and tiene_anterior else None
+
+    @property
+    def items(self):
+        return list(self)
+
+    def __iter__(self):
+        if self._hay_mas is not None:
+            raise RuntimeError('Las filas de una PaginaCursor ya se leyeron')
+        self._hay_mas = False
+        fila = self._primera
+        self._primera = None
+        while fila is not None:
+            if self._leidas == self.por_pagina:
+                self._hay_mas = True
+                break
+            self._leidas += 1
+            self._ultima = fila
+            yield fila
+            fila = self._cursor.fetchone()
+        self._cursor.close()
+
+    def _terminar(self):
+        if self._hay_mas is None:
+            for _ in self:
+                pass
+
+    def __len__(self):
+        self._terminar()
+        return self._leidas
+
+    def __bool__(self):
+        return self._leidas > 0 or self._primera is not None
+
+    @property
+    def siguiente(self):
+        self._terminar()
+        return encode_cursor(self._ultima) if self._hay_mas else None
+
+
+def paginar_cursor(conn, sql, params, por_pagina, despues=None, antes=None, alias=''):
+    """Como paginar(), pero las filas se leen del cursor a medida que se recorren.
+
+    La página anterior (antes=) hay que invertirla, así que esa se arma con paginar().
+    """
+    if decode_cursor(antes):
+        return paginar(conn, sql, params, por_pagina, antes=antes, alias=alias)
+    sql, params, _, cursor_despues = _consulta_pagina(sql, params, por_pagina, despues, None, alias)
+    return PaginaCursor(conn.execute(sql, params), por_pagina, tiene_anterior=cursor_despues is not None)
+
+
+def en_bloques(partes, tamano=8192):
+    """Juntar los trozos chicos que genera una plantilla en bloques de ~tamano caracteres.
+
+    Un trozo vacío (fragmentos.trozos lo entrega antes de consultar la base)
+    envía lo juntado hasta ahí aunque no llegue a `tamano`.
+    """
+    bloque, largo = [], 0
+    for parte in partes:
+        bloque.append(parte)
+        largo += len(parte)
+        if largo >= tamano or (not parte and largo):
+            yield ''.join(bloque)
+            bloque, largo = [], 0
+    if bloque:
+        yield ''.join(bloque)
+
+
+def serializar(rows):
+    """Filas listas para jsonify (todas las columnas de la consulta)"""
+    return [dict(row) for row in rows]
+
+
+# Los filtros se devuelven solo con los valores presentes y válidos, listos
+# para pasarlos a url_for al armar los enlaces de paginación.
+
+def filtros_propiedades(args):
+    """Filtros válidos de la URL para el listado de propiedades"""
+    filtros = {}
+    if args.get('estado') in ESTADOS_PROPIEDAD:
+        filtros['estado'] = args['estado']
+    if args.get('tipo') in TIPOS_PROPIEDAD:
+        filtros['tipo'] = args['tipo']
+    return filtros
+
+
+def consulta_propiedades(user_id, filtros):
+    """SQL y parámetros de las propiedades del usuario con los filtros aplicados"""
+    sql = 'SELECT * FROM propiedades WHERE user_id = ?'
+    params = [user_id]
+    if filtros.get('estado'):
+        sql += ' AND estado = ?'
+        params.append(filtros['estado'])
+    if filtros.get('tipo'):
+        sql += ' AND tipo = ?'
+        params.append(filtros['tipo'])
+    return sql, params
+
+
+def filtros_inquilinos(args):
+    """Filtros válidos de la URL para el listado de inquilinos"""
+    return {}
+
+
+def consulta_inquilinos(user_id, filtros):
+    """SQL y parámetros de los inquilinos del usuario"""
+    return 'SELECT * FROM inquilinos WHERE user_id = ?', [user_id]
+
+
+def filtros_contratos(args):
+    """Filtros válidos de la URL para el listado de contratos (fechas en ISO)"""
+    filtros = {}
+    if args.get('estado') in ESTADOS_CONTRATO:
+        filtros['estado'] = args['estado']
+    for nombre in ('desde', 'hasta'):
+        valor = args.get(nombre, '')
+        if len(valor) == 10 and valor[4] == '-' and valor[7] == '-' and valor.replace('-', '').isdigit():
+            filtros[nombre] = valor
+    return filtros
+
+
+def consulta_contratos(user_id, filtros):
+    """SQL y parámetros de los contratos del usuario, con dirección, inquilino y días restantes"""
+    dias_restantes = vencimientos.DIAS_RESTANTES_SQL.format(columna='c.fecha_fin', hoy="date('now', 'localtime')")
+    sql = f'''
+        SELECT c.*, p.direccion, i.nombre, i.apellido, {dias_restantes} AS dias_restantes
+        FROM contratos c
+        JOIN propiedades p ON c.propiedad_id = p.id
+        JOIN inquilinos i ON c.inquilino_id = i.id
+        WHERE c.user_id = ?
+    '''
+    params = [user_id]
+    if filtros.get('estado'):
+        sql += ' AND c.estado = ?'
+        params.append(filtros['estado'])
+    if filtros.get('desde'):
+        sql += ' AND c.fecha_inicio >= ?'
+        params.append(filtros['desde'])
+    if filtros.get('hasta'):
+        sql += ' AND c.fecha_inicio <= ?'
+        params.append(filtros['hasta'])
+    return sql, params
+
+
+def resumen_propiedades(conn, user_id):
+    """Totales de las tarjetas de resumen del listado de propiedades (de tenant_usage)"""
+    uso = usage.get_usage(conn, user_id)
+    return {
+        'total': uso['propiedades'],
+        'disponibles': uso['propiedades_disponibles'],
+        'alquiladas': uso['propiedades_alquiladas'],
+        'valor_total': uso['valor_propiedades'] / 100,
+    }
+
+
+def resumen_inquilinos(conn, user_id):
+    """Totales de las tarjetas de resumen del listado de inquilinos (de tenant_usage)"""
+    uso = usage.get_usage(conn, user_id)
+    return {
+        'total': uso['inquilinos'],
+        'con_email': uso['inquilinos_con_email'],
+        'con_telefono': uso['inquilinos_con_telefono'],
+        'con_dni': uso['inquilinos_con_dni'],
+    }
+
+
+def resumen_contratos(conn, user_id):
+    """Totales de las tarjetas de resumen del listado de contratos (de tenant_usage)"""
+    uso = usage.get_usage(conn, user_id)
+    return {
+        'total': uso['contratos'],
+        'activos': uso['contratos_activos'],
+        'vencidos': uso['contratos_vencidos'],
+        'ingresos_mensuales': uso['ingresos_mensuales'] / 100,
+    }
@@ -0,0 +1,284 @@
+"""
+Métricas de la aplicación en formato de texto de Prometheus.
+
+Sin dependencias externas: contadores, gauges e histogramas con etiquetas,
+guardados en memoria del proceso. Con varios workers de gunicorn cada uno
+tiene sus propios valores (el label `pid` permite distinguirlos).
+
+init_app() registra:
+- latencia, código de estado y requests en curso por endpoint;
+- consultas SQL y tiempo en SQL por request, a partir del observador de
+  consultas de db.py.
+"""
+
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_request_context, request
+
+import db
+
+# Límites superiores por defecto de los histogramas (segundos)
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres, valores, extra=()):
+    pares = list(zip(nombres, valores)) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + '}'
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def encabezado(self):
+        return [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} {self.tipo}']
+
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def inc(self, *etiquetas, valor=1):
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + valor
+
+    def exponer(self):
+        with self._lock:
+            valores = sorted(self._valores.items())
+        return self.encabezado() + [
+            f'{self.nombre}{_etiquetas(self.etiquetas, clave)} {valor}' for clave, valor in valores
+        ]
+
+
+class Gauge(Contador):
+    tipo = 'gauge'
+
+    def dec(self, *etiquetas, valor=1):
+        self.inc(*etiquetas, valor=-valor)
+
+    def set(self, *etiquetas, valor):
+        with self._lock:
+            self._valores[etiquetas] = valor
+
+
+class Histograma(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *etiquetas, valor):
+        with self._lock:
+            datos = self._valores.get(etiquetas)
+            if datos is None:
+                datos = self._valores[etiquetas] = {'buckets': [0] * len(self.buckets), 'suma': 0.0, 'cuenta': 0}
+            for n, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    datos['buckets'][n] += 1
+                    break
+            datos['suma'] += valor
+            datos['cuenta'] += 1
+
+    def exponer(self):
+        with self._lock:
+            valores = sorted((clave, dict(datos, buckets=list(datos['buckets'])))
+                             for clave, datos in self._valores.items())
+        lineas = self.encabezado()
+        for clave, datos in valores:
+            acumulado = 0
+            for limite, cantidad in zip(self.buckets, datos['buckets']):
+                acumulado += cantidad
+                lineas.append(f'{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, [("le", limite)])} {acumulado}')
+            lineas.append(f'{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, [("le", "+Inf")])} {datos["cuenta"]}')
+            lineas.append(f'{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {datos["suma"]}')
+            lineas.append(f'{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {datos["cuenta"]}')
+        return lineas
+
+
+class Registro:
+    """Conjunto de métricas y colectores que se exponen juntos"""
+
+    def __init__(self):
+        self.metricas = []
+        self.colectores = []
+
+    def registrar(self, metrica):
+        self.metricas.append(metrica)
+        return metrica
+
+    def colector(self, funcion):
+        """Registrar una función que devuelve líneas ya formateadas al exponer"""
+        self.colectores.append(funcion)
+        return funcion
+
+    def exponer(self):
+        lineas = []
+        for metrica in self.metricas:
+            lineas.extend(metrica.exponer())
+        for colector in self.colectores:
+            lineas.extend(colector())
+        return '\n'.join(lineas) + '\n'
+
+
+REGISTRO = Registro()
+
+REQUESTS = REGISTRO.registrar(Contador(
+    'http_requests_total', 'Requests atendidos por endpoint, método y código de estado',
+    ('endpoint', 'method', 'status')))
+LATENCIA = REGISTRO.registrar(Histograma(
+    'http_request_duration_seconds', 'Duración de los requests por endpoint', ('endpoint',)))
+EN_CURSO = REGISTRO.registrar(Gauge(
+    'http_requests_in_flight', 'Requests en curso en este proceso'))
+SQL_CONSULTAS = REGISTRO.registrar(Contador(
+    'sql_queries_total', 'Consultas SQL ejecutadas por endpoint', ('endpoint',)))
+SQL_SEGUNDOS = REGISTRO.registrar(Contador(
+    'sql_seconds_total', 'Tiempo en SQL (ejecución y lectura de filas) por endpoint', ('endpoint',)))
+SQL_POR_REQUEST = REGISTRO.registrar(Histograma(
+    'http_request_sql_queries', 'Consultas SQL por request', ('endpoint',), buckets=BUCKETS_CONSULTAS))
+SQL_SEGUNDOS_POR_REQUEST = REGISTRO.registrar(Histograma(
+    'http_request_sql_seconds', 'Tiempo en SQL por request', ('endpoint',)))
+FUNCIONES = REGISTRO.registrar(Histograma(
+    'function_duration_seconds', 'Duración de funciones instrumentadas con @medido', ('funcion',)))
+ERRORES = REGISTRO.registrar(Contador(
+    'app_errors_total', 'Errores capturados por los handlers', ('endpoint',)))
+
+
+def _endpoint():
+    return (request.endpoint or 'desconocido') if has_request_context() else 'sin_request'
+
+
+def medido(nombre):
+    """Decorador: registrar la duración de la función en function_duration_seconds"""
+    def decorator(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                FUNCIONES.observe(nombre, valor=time.perf_counter() - inicio)
+        return envoltura
+    return decorator
+
+
+def registrar_error():
+    """Contar un error capturado en el endpoint actual"""
+    ERRORES.inc(_endpoint())
+
+
+def _observar_consulta(conn, sql, params, segundos):
+    endpoint = _endpoint()
+    SQL_CONSULTAS.inc(endpoint)
+    SQL_SEGUNDOS.inc(endpoint, valor=segundos)
+    if has_request_context() and 'metricas_sql' in g:
+        g.metricas_sql[0] += 1
+        g.metricas_sql[1] += segundos
+
+
+def _inicio_request():
+    g.metricas_inicio = time.perf_counter()
+    g.metricas_sql = [0, 0.0]
+    EN_CURSO.inc()
+
+
+def _registrar_request(status):
+    if 'metricas_inicio' not in g or g.get('metricas_registrado'):
+        return
+    g.metricas_registrado = True
+    endpoint = _endpoint()
+    REQUESTS.inc(endpoint, request.method, str(status))
+    LATENCIA.observe(endpoint, valor=time.perf_counter() - g.metricas_inicio)
+    consultas, segundos = g.metricas_sql
+    SQL_POR_REQUEST.observe(endpoint, valor=consultas)
+    SQL_SEGUNDOS_POR_REQUEST.observe(endpoint, valor=segundos)
+
+
+def _fin_request(response):
+    _registrar_request(response.status_code)
+    return response
+
+
+def _teardown_request(exception=None):
+    if 'metricas_inicio' not in g:
+        return
+    # Una excepción sin manejar no pasa por after_request
+    _registrar_request(500)
+    for clave in ('metricas_inicio', 'metricas_sql', 'metricas_registrado'):
+        g.pop(clave, None)
+    EN_CURSO.dec()
+
+
+@REGISTRO.colector
+def _proceso():
+    return ['# HELP process_info Proceso que atendió el scrape', '# TYPE process_info gauge',
+            f'process_info{{pid="{os.getpid()}"}} 1']
+
+
+def _pool(app):
+    pools = {'escritura': db.get_pool(app).stats()}
+    lectura = db.get_pool_lectura(app)
+    if lectura is not None:
+        pools['lectura'] = lectura.stats()
+    lineas = []
+    for nombre, ayuda, tipo, clave in (
+        ('sqlite_pool_hits_total', 'Conexiones reutilizadas del pool', 'counter', 'hits'),
+        ('sqlite_pool_misses_total', 'Conexiones abiertas por el pool', 'counter', 'misses'),
+        ('sqlite_pool_discarded_total', 'Conexiones cerradas por pool lleno', 'counter', 'discarded'),
+        ('sqlite_pool_idle', 'Conexiones ociosas en el pool', 'gauge', 'idle'),
+    ):
+        lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} {tipo}']
+        lineas += [f'{nombre}{{pool="{pool}"}} {stats[clave]}' for pool, stats in pools.items()]
+    return lineas
+
+
+def _claves(app):
+    # Solo si el proceso ya creó el hasher: exponer métricas no arranca sus workers
+    hasher = app.extensions.get('password_hasher')
+    if hasher is None:
+        return []
+    stats = hasher.stats()
+    nombre = 'password_hash_duration_seconds'
+    lineas = [f'# HELP {nombre} Duración del hash o verificación de contraseñas',
+              f'# TYPE {nombre} histogram']
+    lineas += [f'{nombre}_bucket{{le="{limite}"}} {cantidad}' for limite, cantidad in stats['buckets'].items()]
+    lineas += [f'{nombre}_bucket{{le="+Inf"}} {stats["operaciones"]}',
+               f'{nombre}_sum {stats["segundos_total"]}',
+               f'{nombre}_count {stats["operaciones"]}',
+               '# HELP password_hash_rejected_total Operaciones rechazadas por cola llena',
+               '# TYPE password_hash_rejected_total counter',
+               f'password_hash_rejected_total {stats["rechazadas"]}',
+               '# HELP password_hash_queue Operaciones en cola o en curso',
+               '# TYPE password_hash_queue gauge',
+               f'password_hash_queue {stats["en_cola"]}']
+    return lineas
+
+
+def exponer():
+    """Texto de todas las métricas en el formato de exposición de Prometheus"""
+    return REGISTRO.exponer()
+
+
+def init_app(app):
+    """Registrar la medición de requests y consultas en la aplicación"""
+    app.before_request(_inicio_request)
+    app.after_request(_fin_request)
+    app.teardown_request(_teardown_request)
+    db.agregar_observador(_observar_consulta)
+    REGISTRO.colector(lambda: _pool(app))
+    REGISTRO.colector(lambda: _claves(app))
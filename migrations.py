@@ -0,0 +1,964 @@
+"""
+Migraciones versionadas del esquema SQLite.
+
+La versión aplicada se guarda en PRAGMA user_version. Cada migración tiene un
+número correlativo y se aplica una sola vez; si no hay nada pendiente, migrar
+cuesta una sola lectura del encabezado de la base.
+
+Uso:
+    python migrations.py [ruta_base_de_datos]
+"""
+
+import os
+import sqlite3
+import sys
+
+from werkzeug.security import generate_password_hash
+
+MIGRACIONES = []
+
+
+def migracion(numero, descripcion):
+    """Registrar una migración; los números deben ser correlativos"""
+    def decorator(func):
+        if numero != len(MIGRACIONES) + 1:
+            raise RuntimeError(f'Migración {numero} fuera de orden')
+        MIGRACIONES.append((numero, descripcion, func))
+        return func
+    return decorator
+
+
+def _columnas(conn, tabla):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({tabla})')}
+
+
+@migracion(1, 'Esquema inicial, paquetes por defecto y usuario admin')
+def _esquema_inicial(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS paquetes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            max_propiedades INTEGER NOT NULL,
+            max_inquilinos INTEGER NOT NULL,
+            max_contratos INTEGER NOT NULL,
+            precio DECIMAL(10,2) NOT NULL,
+            descripcion TEXT,
+            activo BOOLEAN DEFAULT 1
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            nombre TEXT NOT NULL,
+            apellido TEXT NOT NULL,
+            paquete_id INTEGER,
+            fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ultimo_acceso TIMESTAMP,
+            activo BOOLEAN DEFAULT 1,
+            es_admin BOOLEAN DEFAULT 0,
+            FOREIGN KEY (paquete_id) REFERENCES paquetes (id)
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS propiedades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            direccion TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            habitaciones INTEGER,
+            baños INTEGER,
+            precio DECIMAL(10,2),
+            estado TEXT DEFAULT 'disponible',
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES usuarios (id)
+        )
+    ''')
+
+    # email y dni son UNIQUE, igual que en la base de producción
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS inquilinos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            nombre TEXT NOT NULL,
+            apellido TEXT NOT NULL,
+            email TEXT UNIQUE,
+            telefono TEXT,
+            dni TEXT UNIQUE,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES usuarios (id)
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS contratos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            propiedad_id INTEGER,
+            inquilino_id INTEGER,
+            fecha_inicio DATE,
+            fecha_fin DATE,
+            precio_mensual DECIMAL(10,2),
+            estado TEXT DEFAULT 'activo',
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES usuarios (id),
+            FOREIGN KEY (propiedad_id) REFERENCES propiedades (id),
+            FOREIGN KEY (inquilino_id) REFERENCES inquilinos (id)
+        )
+    ''')
+
+    # Bases anteriores al esquema multiusuario: los datos pasan al admin
+    for tabla in ('propiedades', 'inquilinos', 'contratos'):
+        if 'user_id' not in _columnas(conn, tabla):
+            conn.execute(f'ALTER TABLE {tabla} ADD COLUMN user_id INTEGER NOT NULL DEFAULT 1')
+
+    # Integridad de user_id mediante triggers, como en la base de producción
+    for tabla in ('propiedades', 'inquilinos', 'contratos'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS fk_{tabla}_user_id
+            BEFORE INSERT ON {tabla}
+            FOR EACH ROW
+            BEGIN
+                SELECT CASE
+                    WHEN NEW.user_id IS NULL OR NOT EXISTS(SELECT 1 FROM usuarios WHERE id = NEW.user_id)
+                    THEN RAISE(ABORT, 'Foreign key constraint failed')
+                END;
+            END
+        ''')
+
+    conn.execute('''
+        INSERT OR IGNORE INTO paquetes (id, nombre, max_propiedades, max_inquilinos, max_contratos, precio, descripcion)
+        VALUES
+        (1, 'Básico', 5, 10, 15, 0.00, 'Ideal para comenzar. Hasta 5 propiedades, 10 inquilinos y 15 contratos.'),
+        (2, 'Profesional', 20, 50, 100, 29.99, 'Para profesionales. Hasta 20 propiedades, 50 inquilinos y 100 contratos.'),
+        (3, 'Empresarial', 100, 250, 500, 99.99, 'Para empresas. Hasta 100 propiedades, 250 inquilinos y 500 contratos.')
+    ''')
+
+    # El hash es deliberadamente lento: solo se calcula si falta el admin
+    if conn.execute('SELECT 1 FROM usuarios WHERE id = 1').fetchone() is None:
+        conn.execute('''
+            INSERT INTO usuarios (id, username, email, password_hash, nombre, apellido, paquete_id, es_admin)
+            VALUES (1, 'admin', 'admin@alquileres.com', ?, 'Administrador', 'Sistema', 3, 1)
+        ''', (generate_password_hash('admin123'),))
+
+
+@migracion(2, 'Índices compuestos para las consultas por usuario')
+def _indices_por_usuario(conn):
+    # Listados y "recientes": filtran por user_id y ordenan por fecha_creacion
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_propiedades_user_fecha ON propiedades (user_id, fecha_creacion)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_inquilinos_user_fecha ON inquilinos (user_id, fecha_creacion)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_contratos_user_fecha ON contratos (user_id, fecha_creacion)')
+    # Conteos del dashboard y propiedades disponibles en nuevo_contrato
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_propiedades_user_estado ON propiedades (user_id, estado)')
+    # Contratos activos y próximos a vencer
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_contratos_user_estado_fin ON contratos (user_id, estado, fecha_fin)')
+
+
+@migracion(3, 'Contadores de uso por usuario mantenidos por triggers')
+def _tenant_usage(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS tenant_usage (
+            user_id INTEGER PRIMARY KEY,
+            propiedades INTEGER NOT NULL DEFAULT 0,
+            propiedades_disponibles INTEGER NOT NULL DEFAULT 0,
+            inquilinos INTEGER NOT NULL DEFAULT 0,
+            contratos INTEGER NOT NULL DEFAULT 0,
+            contratos_activos INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    # Los triggers mantienen los contadores exactos en la misma transacción
+    # que la escritura; "x IS 'valor'" devuelve 0/1 aunque x sea NULL.
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS tenant_usage_propiedades_ins AFTER INSERT ON propiedades
+        BEGIN
+            INSERT OR IGNORE INTO tenant_usage (user_id) VALUES (NEW.user_id);
+            UPDATE tenant_usage
+            SET propiedades = propiedades + 1,
+                propiedades_disponibles = propiedades_disponibles + (NEW.estado IS 'disponible')
+            WHERE user_id = NEW.user_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS tenant_usage_propiedades_del AFTER DELETE ON propiedades
+        BEGIN
+            UPDATE tenant_usage
+            SET propiedades = propiedades - 1,
+                propiedades_disponibles = propiedades_disponibles - (OLD.estado IS 'disponible')
+            WHERE user_id = OLD.user_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS tenant_usage_propiedades_upd AFTER UPDATE OF user_id, estado ON propiedades
+        BEGIN
+            INSERT OR IGNORE INTO tenant_usage (user_id) VALUES (NEW.user_id);
+            UPDATE tenant_usage
+            SET propiedades = propiedades - 1,
+                propiedades_disponibles = propiedades_disponibles - (OLD.estado IS 'disponible')
+            WHERE user_id = OLD.user_id;
+            UPDATE tenant_usage
+            SET propiedades = propiedades + 1,
+                propiedades_disponibles = propiedades_disponibles + (NEW.estado IS 'disponible')
+            WHERE user_id = NEW.user_id;
+        END
+    ''')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS tenant_usage_inquilinos_ins AFTER INSERT ON inquilinos
+        BEGIN
+            INSERT OR IGNORE INTO tenant_usage (user_id) VALUES (NEW.user_id);
+            UPDATE tenant_usage SET inquilinos = inquilinos + 1 WHERE user_id = NEW.user_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS tenant_usage_inquilinos_del AFTER DELETE ON inquilinos
+        BEGIN
+            UPDATE tenant_usage SET inquilinos = inquilinos - 1 WHERE user_id = OLD.user_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS tenant_usage_inquilinos_upd AFTER UPDATE OF user_id ON inquilinos
+        BEGIN
+            INSERT OR IGNORE INTO tenant_usage (user_id) VALUES (NEW.user_id);
+            UPDATE tenant_usage SET inquilinos = inquilinos - 1 WHERE user_id = OLD.user_id;
+            UPDATE tenant_usage SET inquilinos = inquilinos + 1 WHERE user_id = NEW.user_id;
+        END
+    ''')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS tenant_usage_contratos_ins AFTER INSERT ON contratos
+        BEGIN
+            INSERT OR IGNORE INTO tenant_usage (user_id) VALUES (NEW.user_id);
+            UPDATE tenant_usage
+            SET contratos = contratos + 1,
+                contratos_activos = contratos_activos + (NEW.estado IS 'activo')
+            WHERE user_id = NEW.user_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS tenant_usage_contratos_del AFTER DELETE ON contratos
+        BEGIN
+            UPDATE tenant_usage
+            SET contratos = contratos - 1,
+                contratos_activos = contratos_activos - (OLD.estado IS 'activo')
+            WHERE user_id = OLD.user_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS tenant_usage_contratos_upd AFTER UPDATE OF user_id, estado ON contratos
+        BEGIN
+            INSERT OR IGNORE INTO tenant_usage (user_id) VALUES (NEW.user_id);
+            UPDATE tenant_usage
+            SET contratos = contratos - 1,
+                contratos_activos = contratos_activos - (OLD.estado IS 'activo')
+            WHERE user_id = OLD.user_id;
+            UPDATE tenant_usage
+            SET contratos = contratos + 1,
+                contratos_activos = contratos_activos + (NEW.estado IS 'activo')
+            WHERE user_id = NEW.user_id;
+        END
+    ''')
+
+    # Carga inicial a partir de los datos existentes
+    conn.execute('DELETE FROM tenant_usage')
+    conn.execute('''
+        INSERT INTO tenant_usage (user_id, propiedades, propiedades_disponibles, inquilinos, contratos, contratos_activos)
+        SELECT user_id, SUM(p), SUM(pd), SUM(i), SUM(c), SUM(ca) FROM (
+            SELECT user_id, 1 AS p, estado IS 'disponible' AS pd, 0 AS i, 0 AS c, 0 AS ca FROM propiedades
+            UNION ALL SELECT user_id, 0, 0, 1, 0, 0 FROM inquilinos
+            UNION ALL SELECT user_id, 0, 0, 0, 1, estado IS 'activo' FROM contratos
+        )
+        GROUP BY user_id
+    ''')
+
+
+@migracion(4, 'Índices para los filtros de los listados paginados')
+def _indices_listados(conn):
+    # Filtro + orden por fecha_creacion sin ordenar en memoria; el índice
+    # (user_id, estado, fecha_creacion) también cubre el conteo por estado
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_propiedades_user_estado_fecha ON propiedades (user_id, estado, fecha_creacion)')
+    conn.execute('DROP INDEX IF EXISTS idx_propiedades_user_estado')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_propiedades_user_tipo_fecha ON propiedades (user_id, tipo, fecha_creacion)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_contratos_user_estado_fecha ON contratos (user_id, estado, fecha_creacion)')
+
+
+@migracion(5, 'Índice de búsqueda de texto completo (FTS5)')
+def _busqueda_fts(conn):
+    # rowid = id * 4 + {1: propiedad, 2: inquilino, 3: contrato}, así cada
+    # documento se actualiza o borra por clave. "propietario" (u<user_id>) y
+    # "entidad" son columnas indexadas para acotar la búsqueda por usuario.
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS busqueda USING fts5(
+            propietario, entidad, titulo, detalle, entidad_id UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+
+    # Para refrescar los contratos cuando cambia su propiedad o su inquilino
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_contratos_propiedad ON contratos (propiedad_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_contratos_inquilino ON contratos (inquilino_id)')
+
+    doc_propiedad = "'u' || NEW.user_id, 'propiedad', NEW.direccion, NEW.tipo, NEW.id"
+    doc_inquilino = (
+        "'u' || NEW.user_id, 'inquilino', NEW.nombre || ' ' || NEW.apellido, "
+        "COALESCE(NEW.dni, '') || ' ' || COALESCE(NEW.email, '') || ' ' || COALESCE(NEW.telefono, ''), NEW.id"
+    )
+    columnas = 'rowid, propietario, entidad, titulo, detalle, entidad_id'
+    # Documento de un contrato: dirección de la propiedad y nombre del inquilino
+    select_contrato = f'''
+        SELECT c.id * 4 + 3, 'u' || c.user_id, 'contrato', COALESCE(p.direccion, ''),
+               COALESCE(i.nombre || ' ' || i.apellido, ''), c.id
+        FROM contratos c
+        LEFT JOIN propiedades p ON p.id = c.propiedad_id
+        LEFT JOIN inquilinos i ON i.id = c.inquilino_id
+    '''
+
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS busqueda_propiedades_ins AFTER INSERT ON propiedades
+        BEGIN
+            INSERT INTO busqueda ({columnas}) VALUES (NEW.id * 4 + 1, {doc_propiedad});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS busqueda_propiedades_upd AFTER UPDATE OF user_id, direccion, tipo ON propiedades
+        BEGIN
+            DELETE FROM busqueda WHERE rowid = OLD.id * 4 + 1;
+            INSERT INTO busqueda ({columnas}) VALUES (NEW.id * 4 + 1, {doc_propiedad});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS busqueda_propiedades_dir AFTER UPDATE OF direccion ON propiedades
+        BEGIN
+            DELETE FROM busqueda WHERE rowid IN (SELECT id * 4 + 3 FROM contratos WHERE propiedad_id = NEW.id);
+            INSERT INTO busqueda ({columnas}) {select_contrato} WHERE c.propiedad_id = NEW.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS busqueda_propiedades_del AFTER DELETE ON propiedades
+        BEGIN
+            DELETE FROM busqueda WHERE rowid = OLD.id * 4 + 1;
+        END
+    ''')
+
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS busqueda_inquilinos_ins AFTER INSERT ON inquilinos
+        BEGIN
+            INSERT INTO busqueda ({columnas}) VALUES (NEW.id * 4 + 2, {doc_inquilino});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS busqueda_inquilinos_upd
+        AFTER UPDATE OF user_id, nombre, apellido, dni, email, telefono ON inquilinos
+        BEGIN
+            DELETE FROM busqueda WHERE rowid = OLD.id * 4 + 2;
+            INSERT INTO busqueda ({columnas}) VALUES (NEW.id * 4 + 2, {doc_inquilino});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS busqueda_inquilinos_nombre AFTER UPDATE OF nombre, apellido ON inquilinos
+        BEGIN
+            DELETE FROM busqueda WHERE rowid IN (SELECT id * 4 + 3 FROM contratos WHERE inquilino_id = NEW.id);
+            INSERT INTO busqueda ({columnas}) {select_contrato} WHERE c.inquilino_id = NEW.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS busqueda_inquilinos_del AFTER DELETE ON inquilinos
+        BEGIN
+            DELETE FROM busqueda WHERE rowid = OLD.id * 4 + 2;
+        END
+    ''')
+
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS busqueda_contratos_ins AFTER INSERT ON contratos
+        BEGIN
+            INSERT INTO busqueda ({columnas}) {select_contrato} WHERE c.id = NEW.id;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS busqueda_contratos_upd
+        AFTER UPDATE OF user_id, propiedad_id, inquilino_id ON contratos
+        BEGIN
+            DELETE FROM busqueda WHERE rowid = OLD.id * 4 + 3;
+            INSERT INTO busqueda ({columnas}) {select_contrato} WHERE c.id = NEW.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS busqueda_contratos_del AFTER DELETE ON contratos
+        BEGIN
+            DELETE FROM busqueda WHERE rowid = OLD.id * 4 + 3;
+        END
+    ''')
+
+    # Carga inicial
+    conn.execute('DELETE FROM busqueda')
+    conn.execute(f'''
+        INSERT INTO busqueda ({columnas})
+        SELECT id * 4 + 1, 'u' || user_id, 'propiedad', direccion, tipo, id FROM propiedades
+    ''')
+    conn.execute(f'''
+        INSERT INTO busqueda ({columnas})
+        SELECT id * 4 + 2, 'u' || user_id, 'inquilino', nombre || ' ' || apellido,
+               COALESCE(dni, '') || ' ' || COALESCE(email, '') || ' ' || COALESCE(telefono, ''), id
+        FROM inquilinos
+    ''')
+    conn.execute(f'INSERT INTO busqueda ({columnas}) {select_contrato}')
+
+
+@migracion(6, 'Vencimiento automático de contratos y registro de tareas')
+def _tareas(conn):
+    # Contratos activos de todos los usuarios por fecha de fin (índice parcial:
+    # solo contiene los activos, que son los que la tarea recorre)
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_contratos_activos_fin ON contratos (fecha_fin)
+        WHERE estado = 'activo'
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS tareas_ejecuciones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tarea TEXT NOT NULL,
+            inicio TIMESTAMP NOT NULL,
+            fin TIMESTAMP,
+            segundos REAL,
+            lotes INTEGER NOT NULL DEFAULT 0,
+            contratos INTEGER NOT NULL DEFAULT 0,
+            propiedades INTEGER NOT NULL DEFAULT 0,
+            lock_max_ms REAL,
+            error TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tareas_ejecuciones_tarea ON tareas_ejecuciones (tarea, inicio)')
+
+
+@migracion(7, 'Contratos sin superposición por propiedad')
+def _contratos_sin_solapamiento(conn):
+    # Reemplaza a idx_contratos_propiedad: sirve para las mismas búsquedas por
+    # propiedad y además para ubicar el contrato anterior a una fecha
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_contratos_propiedad_periodo
+        ON contratos (propiedad_id, fecha_inicio, fecha_fin)
+    ''')
+    conn.execute('DROP INDEX IF EXISTS idx_contratos_propiedad')
+
+    # Reemplazados por los de la migración 12. Solo se controlan las
+    # escrituras que cambian el período o reactivan un contrato cancelado, así
+    # las superposiciones heredadas no bloquean otros cambios (por ejemplo, el
+    # vencimiento automático); para encontrarlas está flask auditar-contratos.
+    solapado = '''
+        SELECT RAISE(ABORT, 'contrato_solapado') WHERE EXISTS (
+            SELECT 1 FROM (
+                SELECT fecha_fin FROM contratos
+                WHERE propiedad_id = NEW.propiedad_id AND fecha_inicio <= NEW.fecha_fin
+                  AND estado IS NOT 'cancelado' AND id IS NOT NEW.id
+                ORDER BY fecha_inicio DESC
+                LIMIT 1
+            ) WHERE fecha_fin >= NEW.fecha_inicio
+        );
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS contratos_solapamiento_ins BEFORE INSERT ON contratos
+        WHEN NEW.estado IS NOT 'cancelado'
+        BEGIN
+            {solapado}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS contratos_solapamiento_upd
+        BEFORE UPDATE OF propiedad_id, fecha_inicio, fecha_fin, estado ON contratos
+        WHEN NEW.estado IS NOT 'cancelado' AND (
+            NEW.propiedad_id IS NOT OLD.propiedad_id OR NEW.fecha_inicio IS NOT OLD.fecha_inicio
+            OR NEW.fecha_fin IS NOT OLD.fecha_fin OR OLD.estado IS 'cancelado'
+        )
+        BEGIN
+            {solapado}
+        END
+    ''')
+
+
+@migracion(8, 'Resumen mensual de rentas y ocupación por propiedad')
+def _renta_mensual(conn):
+    # Calendario fijo: los triggers no admiten WITH, así que los meses de un
+    # contrato salen de un rango de esta tabla
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS meses (
+            mes TEXT PRIMARY KEY,
+            inicio TEXT NOT NULL,
+            fin TEXT NOT NULL,
+            dias INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO meses (mes, inicio, fin, dias)
+        WITH RECURSIVE m(inicio) AS (
+            SELECT '1990-01-01'
+            UNION ALL SELECT date(inicio, '+1 month') FROM m WHERE inicio < '2099-12-01'
+        )
+        SELECT substr(inicio, 1, 7), inicio, date(inicio, '+1 month', '-1 day'),
+               CAST(julianday(inicio, '+1 month') - julianday(inicio) AS INTEGER)
+        FROM m
+    ''')
+
+    # Importes en centavos (enteros): sumar y restar contratos no acumula
+    # errores de redondeo y el resultado es idéntico al de informes.rebuild()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS renta_mensual (
+            user_id INTEGER NOT NULL,
+            mes TEXT NOT NULL,
+            propiedad_id INTEGER NOT NULL,
+            contratos INTEGER NOT NULL DEFAULT 0,
+            dias_ocupados INTEGER NOT NULL DEFAULT 0,
+            ingreso INTEGER NOT NULL DEFAULT 0,
+            ingreso_que_vence INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, mes, propiedad_id)
+        ) WITHOUT ROWID
+    ''')
+
+    # Aporte de un contrato (NEW u OLD) a cada mes que toca, con signo +1 o -1.
+    # Los contratos cancelados no aportan. Misma fórmula que informes.RECUENTO_SQL.
+    def aporte(fila, signo):
+        return f'''
+            INSERT INTO renta_mensual (user_id, mes, propiedad_id, contratos, dias_ocupados, ingreso,
+                                       ingreso_que_vence)
+            SELECT {fila}.user_id, mes, {fila}.propiedad_id, {signo}, {signo} * dias,
+                   {signo} * CAST(ROUND({fila}.precio_mensual * 100 * dias / dias_mes) AS INTEGER),
+                   {signo} * CASE WHEN {fila}.fecha_fin <= fin
+                                  THEN CAST(ROUND({fila}.precio_mensual * 100) AS INTEGER) ELSE 0 END
+            FROM (
+                SELECT mes, fin, dias AS dias_mes,
+                       CAST(julianday(MIN({fila}.fecha_fin, fin)) - julianday(MAX({fila}.fecha_inicio, inicio)) + 1
+                            AS INTEGER) AS dias
+                FROM meses
+                WHERE mes BETWEEN substr({fila}.fecha_inicio, 1, 7) AND substr({fila}.fecha_fin, 1, 7)
+            )
+            WHERE {fila}.estado IS NOT 'cancelado'
+            ON CONFLICT (user_id, mes, propiedad_id) DO UPDATE SET
+                contratos = contratos + excluded.contratos,
+                dias_ocupados = dias_ocupados + excluded.dias_ocupados,
+                ingreso = ingreso + excluded.ingreso,
+                ingreso_que_vence = ingreso_que_vence + excluded.ingreso_que_vence;
+        '''
+
+    limpiar = '''
+        DELETE FROM renta_mensual
+        WHERE user_id = OLD.user_id AND mes BETWEEN substr(OLD.fecha_inicio, 1, 7) AND substr(OLD.fecha_fin, 1, 7)
+          AND propiedad_id = OLD.propiedad_id AND contratos = 0;
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS renta_mensual_contratos_ins AFTER INSERT ON contratos
+        BEGIN
+            {aporte('NEW', 1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS renta_mensual_contratos_del AFTER DELETE ON contratos
+        BEGIN
+            {aporte('OLD', -1)}
+            {limpiar}
+        END
+    ''')
+    # Pasar de activo a vencido (la tarea de vencimientos) no cambia nada
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS renta_mensual_contratos_upd
+        AFTER UPDATE OF user_id, propiedad_id, fecha_inicio, fecha_fin, precio_mensual, estado ON contratos
+        WHEN NEW.user_id IS NOT OLD.user_id OR NEW.propiedad_id IS NOT OLD.propiedad_id
+          OR NEW.fecha_inicio IS NOT OLD.fecha_inicio OR NEW.fecha_fin IS NOT OLD.fecha_fin
+          OR NEW.precio_mensual IS NOT OLD.precio_mensual
+          OR (NEW.estado IS 'cancelado') IS NOT (OLD.estado IS 'cancelado')
+        BEGIN
+            {aporte('OLD', -1)}
+            {aporte('NEW', 1)}
+            {limpiar}
+        END
+    ''')
+
+    # Carga inicial a partir de los contratos existentes
+    conn.execute('DELETE FROM renta_mensual')
+    conn.execute('''
+        INSERT INTO renta_mensual (user_id, mes, propiedad_id, contratos, dias_ocupados, ingreso, ingreso_que_vence)
+        SELECT user_id, mes, propiedad_id, COUNT(*), SUM(dias),
+               SUM(CAST(ROUND(precio_mensual * 100 * dias / dias_mes) AS INTEGER)),
+               SUM(CASE WHEN fecha_fin <= fin THEN CAST(ROUND(precio_mensual * 100) AS INTEGER) ELSE 0 END)
+        FROM (
+            SELECT c.user_id, c.propiedad_id, c.precio_mensual, c.fecha_fin, m.mes, m.fin, m.dias AS dias_mes,
+                   CAST(julianday(MIN(c.fecha_fin, m.fin)) - julianday(MAX(c.fecha_inicio, m.inicio)) + 1
+                        AS INTEGER) AS dias
+            FROM contratos c
+            JOIN meses m ON m.mes BETWEEN substr(c.fecha_inicio, 1, 7) AND substr(c.fecha_fin, 1, 7)
+            WHERE c.estado IS NOT 'cancelado'
+        )
+        GROUP BY user_id, mes, propiedad_id
+    ''')
+
+
+@migracion(9, 'Marca de la última modificación de los datos de cada usuario')
+def _tenant_modificado(conn):
+    # cambios cuenta las escrituras y modificado guarda la hora (UTC, con
+    # milisegundos) de la última; juntas forman el ETag de los listados y la
+    # API, así validar una copia cacheada es una búsqueda por clave primaria.
+    columnas = _columnas(conn, 'tenant_usage')
+    if 'cambios' not in columnas:
+        conn.execute('ALTER TABLE tenant_usage ADD COLUMN cambios INTEGER NOT NULL DEFAULT 0')
+    if 'modificado' not in columnas:
+        conn.execute('ALTER TABLE tenant_usage ADD COLUMN modificado TEXT')
+
+    marcar = ("UPDATE tenant_usage SET cambios = cambios + 1, modificado = strftime('%Y-%m-%d %H:%M:%f', 'now') "
+              "WHERE user_id {condicion};")
+    for tabla in ('propiedades', 'inquilinos', 'contratos'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS tenant_modificado_{tabla}_ins AFTER INSERT ON {tabla}
+            BEGIN
+                INSERT OR IGNORE INTO tenant_usage (user_id) VALUES (NEW.user_id);
+                {marcar.format(condicion='= NEW.user_id')}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS tenant_modificado_{tabla}_del AFTER DELETE ON {tabla}
+            BEGIN
+                {marcar.format(condicion='= OLD.user_id')}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS tenant_modificado_{tabla}_upd AFTER UPDATE ON {tabla}
+            BEGIN
+                INSERT OR IGNORE INTO tenant_usage (user_id) VALUES (NEW.user_id);
+                {marcar.format(condicion='IN (OLD.user_id, NEW.user_id)')}
+            END
+        ''')
+
+    # Sin historial de ediciones, la marca inicial es el alta más reciente
+    conn.execute('''
+        UPDATE tenant_usage SET modificado = (
+            SELECT MAX(fecha_creacion) FROM (
+                SELECT fecha_creacion FROM propiedades WHERE user_id = tenant_usage.user_id
+                UNION ALL SELECT fecha_creacion FROM inquilinos WHERE user_id = tenant_usage.user_id
+                UNION ALL SELECT fecha_creacion FROM contratos WHERE user_id = tenant_usage.user_id
+            )
+        )
+        WHERE modificado IS NULL
+    ''')
+
+
+@migracion(10, 'Consola de administración: copia del uso de los shards e índices de orden')
+def _uso_shards(conn):
+    # Con shards, tenant_usage está en la base de cada usuario; la consola
+    # ordena y pagina sobre esta copia, que actualiza consola.sincronizar().
+    # Sin shards queda vacía y la consola lee tenant_usage directamente.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS uso_shards (
+            user_id INTEGER PRIMARY KEY,
+            propiedades INTEGER NOT NULL DEFAULT 0,
+            propiedades_disponibles INTEGER NOT NULL DEFAULT 0,
+            inquilinos INTEGER NOT NULL DEFAULT 0,
+            contratos INTEGER NOT NULL DEFAULT 0,
+            contratos_activos INTEGER NOT NULL DEFAULT 0,
+            actualizado TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Mismas expresiones que consola.ORDENES: ordenar por último acceso o por
+    # registro recorre el índice en lugar de ordenar todos los usuarios
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_usuarios_acceso ON usuarios (COALESCE(ultimo_acceso, ''))")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_usuarios_registro ON usuarios (COALESCE(fecha_registro, ''))")
+
+
+@migracion(11, 'Totales de las tarjetas de resumen en tenant_usage')
+def _tenant_usage_totales(conn):
+    # Las tarjetas de los listados (por estado, con email, importes) pasan a
+    # ser contadores como los de la migración 3, así una página no suma las
+    # filas del usuario. Importes en centavos, como en renta_mensual. Misma
+    # fórmula que usage.RECUENTO_SQL.
+    aportes = {
+        'propiedades': {
+            'propiedades': '1',
+            'propiedades_disponibles': "{fila}.estado IS 'disponible'",
+            'propiedades_alquiladas': "{fila}.estado IS 'alquilada'",
+            'valor_propiedades': 'CAST(ROUND(COALESCE({fila}.precio, 0) * 100) AS INTEGER)',
+        },
+        'inquilinos': {
+            'inquilinos': '1',
+            'inquilinos_con_email': "COALESCE({fila}.email, '') != ''",
+            'inquilinos_con_telefono': "COALESCE({fila}.telefono, '') != ''",
+            'inquilinos_con_dni': "COALESCE({fila}.dni, '') != ''",
+        },
+        'contratos': {
+            'contratos': '1',
+            'contratos_activos': "{fila}.estado IS 'activo'",
+            'contratos_vencidos': "{fila}.estado IS 'vencido'",
+            'ingresos_mensuales': 'CAST(ROUND(COALESCE({fila}.precio_mensual, 0) * 100) AS INTEGER)',
+        },
+    }
+    # Columnas de las que dependen los contadores de cada tabla
+    origen = {
+        'propiedades': 'user_id, estado, precio',
+        'inquilinos': 'user_id, email, telefono, dni',
+        'contratos': 'user_id, estado, precio_mensual',
+    }
+
+    # Bases heredadas a las que les falte alguna de esas columnas (como user_id
+    # en la migración 1): se agregan vacías para que los triggers compilen
+    tipos = {'precio': 'DECIMAL(10,2)', 'precio_mensual': 'DECIMAL(10,2)'}
+    for tabla, columnas in origen.items():
+        existentes = _columnas(conn, tabla)
+        for columna in columnas.split(', '):
+            if columna not in existentes:
+                conn.execute(f'ALTER TABLE {tabla} ADD COLUMN {columna} {tipos.get(columna, "TEXT")}')
+
+    # uso_shards es la copia de tenant_usage que lee la consola con shards
+    for tabla in ('tenant_usage', 'uso_shards'):
+        existentes = _columnas(conn, tabla)
+        for columnas in aportes.values():
+            for columna in columnas:
+                if columna not in existentes:
+                    conn.execute(f'ALTER TABLE {tabla} ADD COLUMN {columna} INTEGER NOT NULL DEFAULT 0')
+
+    def sumar(tabla, fila, signo):
+        cambios = ', '.join(f'{columna} = {columna} {signo} ({expresion.format(fila=fila)})'
+                            for columna, expresion in aportes[tabla].items())
+        return f'UPDATE tenant_usage SET {cambios} WHERE user_id = {fila}.user_id;'
+
+    for tabla in aportes:
+        for evento in ('ins', 'del', 'upd'):
+            conn.execute(f'DROP TRIGGER IF EXISTS tenant_usage_{tabla}_{evento}')
+        conn.execute(f'''
+            CREATE TRIGGER tenant_usage_{tabla}_ins AFTER INSERT ON {tabla}
+            BEGIN
+                INSERT OR IGNORE INTO tenant_usage (user_id) VALUES (NEW.user_id);
+                {sumar(tabla, 'NEW', '+')}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER tenant_usage_{tabla}_del AFTER DELETE ON {tabla}
+            BEGIN
+                {sumar(tabla, 'OLD', '-')}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER tenant_usage_{tabla}_upd AFTER UPDATE OF {origen[tabla]} ON {tabla}
+            BEGIN
+                INSERT OR IGNORE INTO tenant_usage (user_id) VALUES (NEW.user_id);
+                {sumar(tabla, 'OLD', '-')}
+                {sumar(tabla, 'NEW', '+')}
+            END
+        ''')
+
+    # Carga inicial de las columnas nuevas a partir de los datos existentes
+    for tabla, columnas in aportes.items():
+        select = ', '.join(f'SUM({expresion.format(fila=tabla)})' for expresion in columnas.values())
+        conn.execute(f'''
+            INSERT INTO tenant_usage (user_id, {', '.join(columnas)})
+            SELECT user_id, {select} FROM {tabla} WHERE true GROUP BY user_id
+            ON CONFLICT (user_id) DO UPDATE SET
+                {', '.join(f'{columna} = excluded.{columna}' for columna in columnas)}
+        ''')
+
+
+@migracion(12, 'Control de superposición contra todos los contratos de la propiedad')
+def _contratos_solapamiento_completo(conn):
+    # Reemplazados por los de la migración 13. Los triggers de la migración 7
+    # comparaban solo con el último contrato que empieza antes del nuevo: una
+    # superposición heredada podía ocultar otra.
+    solapado = '''
+        SELECT RAISE(ABORT, 'contrato_solapado') WHERE EXISTS (
+            SELECT 1 FROM contratos
+            WHERE propiedad_id = NEW.propiedad_id AND fecha_inicio <= NEW.fecha_fin
+              AND fecha_fin >= NEW.fecha_inicio
+              AND estado IS NOT 'cancelado' AND id IS NOT NEW.id
+        );
+    '''
+    conn.execute('DROP TRIGGER IF EXISTS contratos_solapamiento_ins')
+    conn.execute('DROP TRIGGER IF EXISTS contratos_solapamiento_upd')
+    conn.execute(f'''
+        CREATE TRIGGER contratos_solapamiento_ins BEFORE INSERT ON contratos
+        WHEN NEW.estado IS NOT 'cancelado'
+        BEGIN
+            {solapado}
+        END
+    ''')
+    # Como antes, solo las escrituras que cambian el período o reactivan un
+    # contrato cancelado: las superposiciones heredadas no bloquean el resto
+    conn.execute(f'''
+        CREATE TRIGGER contratos_solapamiento_upd
+        BEFORE UPDATE OF propiedad_id, fecha_inicio, fecha_fin, estado ON contratos
+        WHEN NEW.estado IS NOT 'cancelado' AND (
+            NEW.propiedad_id IS NOT OLD.propiedad_id OR NEW.fecha_inicio IS NOT OLD.fecha_inicio
+            OR NEW.fecha_fin IS NOT OLD.fecha_fin OR OLD.estado IS 'cancelado'
+        )
+        BEGIN
+            {solapado}
+        END
+    ''')
+
+
+@migracion(13, 'Superposición con dos búsquedas en un índice de los contratos no cancelados')
+def _contratos_solapamiento_indice(conn):
+    # La condición de la migración 12 recorre todos los contratos anteriores
+    # de la propiedad y lee la tabla para ver el estado. Como los contratos no
+    # cancelados de una propiedad no se superponen (las superposiciones
+    # heredadas las lista flask auditar-contratos), ordenados por inicio
+    # también quedan ordenados por fin: alcanza con el inmediato anterior y el
+    # inmediato siguiente al inicio nuevo, dos búsquedas en el índice parcial
+    # (con el estado, así no se lee la tabla). Misma condición que
+    # solapamientos.SOLAPADO_SQL.
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_contratos_propiedad_vigentes
+        ON contratos (propiedad_id, fecha_inicio, fecha_fin, estado)
+        WHERE estado IS NOT 'cancelado'
+    ''')
+    solapado = '''
+        SELECT RAISE(ABORT, 'contrato_solapado') WHERE EXISTS (
+            SELECT 1 FROM (
+                SELECT fecha_fin FROM contratos
+                WHERE propiedad_id = NEW.propiedad_id AND fecha_inicio <= NEW.fecha_inicio
+                  AND estado IS NOT 'cancelado' AND id IS NOT NEW.id
+                ORDER BY fecha_inicio DESC
+                LIMIT 1
+            ) WHERE fecha_fin >= NEW.fecha_inicio
+        ) OR EXISTS (
+            SELECT 1 FROM (
+                SELECT fecha_inicio FROM contratos
+                WHERE propiedad_id = NEW.propiedad_id AND fecha_inicio > NEW.fecha_inicio
+                  AND estado IS NOT 'cancelado' AND id IS NOT NEW.id
+                ORDER BY fecha_inicio
+                LIMIT 1
+            ) WHERE fecha_inicio <= NEW.fecha_fin
+        );
+    '''
+    conn.execute('DROP TRIGGER IF EXISTS contratos_solapamiento_ins')
+    conn.execute('DROP TRIGGER IF EXISTS contratos_solapamiento_upd')
+    conn.execute(f'''
+        CREATE TRIGGER contratos_solapamiento_ins BEFORE INSERT ON contratos
+        WHEN NEW.estado IS NOT 'cancelado'
+        BEGIN
+            {solapado}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER contratos_solapamiento_upd
+        BEFORE UPDATE OF propiedad_id, fecha_inicio, fecha_fin, estado ON contratos
+        WHEN NEW.estado IS NOT 'cancelado' AND (
+            NEW.propiedad_id IS NOT OLD.propiedad_id OR NEW.fecha_inicio IS NOT OLD.fecha_inicio
+            OR NEW.fecha_fin IS NOT OLD.fecha_fin OR OLD.estado IS 'cancelado'
+        )
+        BEGIN
+            {solapado}
+        END
+    ''')
+
+
+@migracion(14, 'Uso del paquete como columna indexada de tenant_usage y uso_shards')
+def _uso_indexado(conn):
+    # La consola ordena por la fracción del límite más usado del paquete: como
+    # expresión sobre un join había que calcularla y ordenarla para todos los
+    # usuarios en cada página. Pasa a ser una columna que mantienen los
+    # triggers, con un índice (uso, user_id) para las páginas por cursor. Cada
+    # usuario tiene su fila en las dos tablas, así la consola las recorre con
+    # un join común. Es la fórmula descrita junto a consola.USO_SQL.
+    uso = '''COALESCE((
+        SELECT MAX(
+            {tabla}.propiedades * 1.0 / MAX(COALESCE(p.max_propiedades, 0), 1),
+            {tabla}.inquilinos * 1.0 / MAX(COALESCE(p.max_inquilinos, 0), 1),
+            {tabla}.contratos * 1.0 / MAX(COALESCE(p.max_contratos, 0), 1)
+        )
+        FROM usuarios u LEFT JOIN paquetes p ON p.id = u.paquete_id
+        WHERE u.id = {tabla}.user_id
+    ), 0)'''
+    for tabla in ('tenant_usage', 'uso_shards'):
+        if 'uso' not in _columnas(conn, tabla):
+            conn.execute(f'ALTER TABLE {tabla} ADD COLUMN uso REAL NOT NULL DEFAULT 0')
+        calcular = f'UPDATE {tabla} SET uso = {uso.format(tabla=tabla)}'
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {tabla}_uso_ins AFTER INSERT ON {tabla}
+            BEGIN
+                {calcular} WHERE user_id = NEW.user_id;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {tabla}_uso_upd AFTER UPDATE OF propiedades, inquilinos, contratos ON {tabla}
+            BEGIN
+                {calcular} WHERE user_id = NEW.user_id;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {tabla}_uso_usuarios AFTER UPDATE OF paquete_id ON usuarios
+            BEGIN
+                {calcular} WHERE user_id = NEW.id;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {tabla}_uso_paquetes
+            AFTER UPDATE OF max_propiedades, max_inquilinos, max_contratos ON paquetes
+            BEGIN
+                {calcular} WHERE user_id IN (SELECT id FROM usuarios WHERE paquete_id = NEW.id);
+            END
+        ''')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabla}_uso ON {tabla} (uso, user_id)')
+        conn.execute(f'INSERT OR IGNORE INTO {tabla} (user_id) SELECT id FROM usuarios')
+        conn.execute(calcular)
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS usuarios_uso_ins AFTER INSERT ON usuarios
+        BEGIN
+            INSERT OR IGNORE INTO tenant_usage (user_id) VALUES (NEW.id);
+            INSERT OR IGNORE INTO uso_shards (user_id) VALUES (NEW.id);
+        END
+    ''')
+
+
+@migracion(15, 'Versión de cada usuario para la caché de cuentas')
+def _usuarios_version(conn):
+    # La caché de cuentas es de cada worker: invalidar en uno no avisa a los
+    # demás. version sube con cada cambio de las columnas que guarda la caché
+    # (las de cuentas.COLUMNAS_USUARIO), así cada request compara la copia con
+    # una búsqueda por clave primaria y un usuario desactivado o con otro
+    # paquete se relee enseguida en todos los workers.
+    if 'version' not in _columnas(conn, 'usuarios'):
+        conn.execute('ALTER TABLE usuarios ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS usuarios_version
+        AFTER UPDATE OF username, email, nombre, apellido, paquete_id, es_admin, activo ON usuarios
+        BEGIN
+            UPDATE usuarios SET version = version + 1 WHERE id = NEW.id;
+        END
+    ''')
+
+
+def schema_version(conn):
+    """Versión del esquema aplicada en la base"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def pending(conn):
+    """Migraciones que faltan aplicar"""
+    return MIGRACIONES[schema_version(conn):]
+
+
+def migrate(database):
+    """Aplicar las migraciones pendientes; devuelve la versión final del esquema"""
+    conn = sqlite3.connect(database, isolation_level=None)
+    try:
+        if not pending(conn):
+            return schema_version(conn)
+
+        # BEGIN IMMEDIATE serializa procesos que migren a la vez; dentro del
+        # lock se vuelve a leer la versión por si otro proceso ya migró.
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for numero, descripcion, func in pending(conn):
+                func(conn)
+                conn.execute(f'PRAGMA user_version = {numero}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return schema_version(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    database = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE', 'alquileres.db')
+    version = migrate(database)
+    print(f'Esquema de {database} en la versión {version}')
@@ -0,0 +1,321 @@
+"""
+Modo opcional con una base SQLite por usuario (shards).
+
+SQLite admite un solo escritor por archivo: con todos los usuarios en
+alquileres.db, cada alta o baja espera a las de todos los demás. Con
+SHARDS_DIR definido, las propiedades, inquilinos y contratos de cada usuario
+(con sus tenant_usage y busqueda) viven en SHARDS_DIR/usuario_<id>.db, y la
+base principal (DATABASE) queda como catálogo: usuarios, paquetes y
+tareas_ejecuciones. Así las escrituras de usuarios distintos no compiten por
+el mismo lock.
+
+Cada shard tiene el esquema completo de migrations.py, copiado de una
+plantilla ya migrada (sin usuarios, paquetes ni el admin) y con un trigger que
+solo admite filas de su usuario. Cada proceso mantiene pools de conexiones
+para los últimos SHARDS_ABIERTOS shards usados.
+
+dividir() reparte una base única existente en shards; conexiones() y
+agregar() recorren todos los shards para las tareas y vistas de administración.
+"""
+
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+import db
+import migrations
+
+# Valores por defecto, sobreescribibles por app.config o variables de entorno
+DEFAULT_CONFIG = {
+    'SHARDS_DIR': '',              # vacío = una sola base
+    'SHARDS_POOL_SIZE': 2,         # conexiones ociosas por shard
+    'SHARDS_ABIERTOS': 64,         # shards con pool abierto por proceso
+    'SHARDS_CACHE_SIZE': -2000,    # negativo = KiB por conexión
+}
+
+TABLAS = ('propiedades', 'inquilinos', 'contratos')
+PLANTILLA = '_plantilla.db'
+_ARCHIVO = re.compile(r'^usuario_(\d+)\.db$')
+
+
+def _config_value(app, key):
+    """Variable de entorno, si existe; si no, app.config"""
+    return os.environ.get(key, app.config.get(key, DEFAULT_CONFIG[key]))
+
+
+def directorio(app=None):
+    """Directorio de los shards, o '' si el modo está desactivado"""
+    return _config_value(app or current_app, 'SHARDS_DIR')
+
+
+def ruta(carpeta, user_id):
+    return os.path.join(carpeta, f'usuario_{int(user_id)}.db')
+
+
+def _version(archivo):
+    conn = sqlite3.connect(archivo)
+    try:
+        return migrations.schema_version(conn)
+    finally:
+        conn.close()
+
+
+def _plantilla(carpeta):
+    """Base vacía con el esquema actual, de la que se copian los shards nuevos"""
+    plantilla = os.path.join(carpeta, PLANTILLA)
+    if os.path.exists(plantilla) and _version(plantilla) == len(migrations.MIGRACIONES):
+        return plantilla
+
+    temporal = f'{plantilla}.{os.getpid()}.{threading.get_ident()}.tmp'
+    migrations.migrate(temporal)
+    conn = sqlite3.connect(temporal)
+    try:
+        # El catálogo es la base principal; los shards no validan contra usuarios
+        for tabla in TABLAS:
+            conn.execute(f'DROP TRIGGER IF EXISTS fk_{tabla}_user_id')
+        conn.execute('DELETE FROM usuarios')
+        conn.execute('DELETE FROM paquetes')
+        # Filas de uso que la migración 14 crea para cada usuario (el admin)
+        conn.execute('DELETE FROM tenant_usage')
+        conn.execute('DELETE FROM uso_shards')
+        conn.commit()
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    # Dos procesos pueden armarla a la vez: las dos copias son equivalentes
+    os.replace(temporal, plantilla)
+    return plantilla
+
+
+def crear(carpeta, user_id):
+    """Ruta del shard del usuario, creándolo o migrándolo si hace falta"""
+    archivo = ruta(carpeta, user_id)
+    if not os.path.exists(archivo):
+        os.makedirs(carpeta, exist_ok=True)
+        temporal = f'{archivo}.{os.getpid()}.{threading.get_ident()}.tmp'
+        shutil.copyfile(_plantilla(carpeta), temporal)
+        try:
+            conn = sqlite3.connect(temporal)
+            try:
+                for tabla in TABLAS:
+                    conn.execute(f'''
+                        CREATE TRIGGER shard_{tabla}_user_id BEFORE INSERT ON {tabla}
+                        WHEN NEW.user_id IS NOT {int(user_id)}
+                        BEGIN
+                            SELECT RAISE(ABORT, 'Fila de otro usuario');
+                        END
+                    ''')
+                conn.commit()
+            finally:
+                conn.close()
+            # os.link no pisa un shard que otro proceso haya creado mientras tanto
+            try:
+                os.link(temporal, archivo)
+            except FileExistsError:
+                pass
+        finally:
+            os.remove(temporal)
+    migrations.migrate(archivo)
+    return archivo
+
+
+def listar(carpeta):
+    """(user_id, ruta) de todos los shards, ordenados por usuario"""
+    if not carpeta or not os.path.isdir(carpeta):
+        return []
+    shards = []
+    for nombre in os.listdir(carpeta):
+        coincide = _ARCHIVO.match(nombre)
+        if coincide:
+            shards.append((int(coincide.group(1)), os.path.join(carpeta, nombre)))
+    return sorted(shards)
+
+
+class Router:
+    """Pools de conexiones de los shards usados más recientemente en el proceso"""
+
+    def __init__(self, carpeta, pool_size=2, abiertos=64, **pragmas):
+        self.carpeta = carpeta
+        self.pool_size = int(pool_size)
+        self.abiertos = int(abiertos)
+        self.pragmas = pragmas
+        self.cerrados = 0
+        self._pools = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pool(self, user_id):
+        """Pool del shard del usuario (lo crea si todavía no existe)"""
+        with self._lock:
+            pool = self._pools.get(user_id)
+            if pool is not None:
+                self._pools.move_to_end(user_id)
+                return pool
+
+        nuevo = db.ConnectionPool(crear(self.carpeta, user_id), size=self.pool_size, **self.pragmas)
+        with self._lock:
+            pool = self._pools.setdefault(user_id, nuevo)
+            self._pools.move_to_end(user_id)
+            while len(self._pools) > self.abiertos:
+                _, viejo = self._pools.popitem(last=False)
+                viejo.close_all()
+                self.cerrados += 1
+        return pool
+
+    def close_all(self):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), OrderedDict()
+        for pool in pools:
+            pool.close_all()
+
+    def stats(self):
+        with self._lock:
+            pools = list(self._pools.values())
+            cerrados = self.cerrados
+        hits = sum(pool.hits for pool in pools)
+        misses = sum(pool.misses for pool in pools)
+        return {
+            'directorio': self.carpeta,
+            'shards': len(listar(self.carpeta)),
+            'abiertos': len(pools),
+            'max_abiertos': self.abiertos,
+            'cerrados': cerrados,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        }
+
+
+def get_router(app=None):
+    """Router del proceso actual, o None si el modo shards está desactivado"""
+    app = app or current_app
+    carpeta = directorio(app)
+    if not carpeta:
+        return None
+    router = app.extensions.get('sqlite_shards')
+    if router is None or router.carpeta != carpeta:
+        if router is not None:
+            router.close_all()
+        router = Router(
+            carpeta,
+            pool_size=_config_value(app, 'SHARDS_POOL_SIZE'),
+            abiertos=_config_value(app, 'SHARDS_ABIERTOS'),
+            synchronous=db._config_value(app, 'SQLITE_SYNCHRONOUS'),
+            cache_size=_config_value(app, 'SHARDS_CACHE_SIZE'),
+            mmap_size=db._config_value(app, 'SQLITE_MMAP_SIZE'),
+            busy_timeout=db._config_value(app, 'SQLITE_BUSY_TIMEOUT'),
+        )
+        app.extensions['sqlite_shards'] = router
+    return router
+
+
+def reset_router(app=None):
+    """Cerrar los pools de shards del proceso"""
+    app = app or current_app
+    router = app.extensions.pop('sqlite_shards', None)
+    if router is not None:
+        router.close_all()
+
+
+def conexiones(carpeta):
+    """(user_id, conexión) de cada shard, abriendo y cerrando una a la vez.
+
+    Las conexiones son aparte de los pools del Router, para que recorrer todos
+    los shards no desplace a los que están atendiendo requests.
+    """
+    for user_id, archivo in listar(carpeta):
+        conn = db.ConnectionPool(archivo, size=0).connect()
+        try:
+            yield user_id, conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.close()
+
+
+def agregar(carpeta, sql, params=()):
+    """Filas de la misma consulta en todos los shards, como diccionarios"""
+    filas = []
+    for _, conn in conexiones(carpeta):
+        filas.extend(dict(row) for row in conn.execute(sql, params))
+    return filas
+
+
+def _copiar(conn, tabla, user_id):
+    columnas = [row[1] for row in conn.execute(f'PRAGMA main.table_info({tabla})')]
+    origen = {row[1] for row in conn.execute(f'PRAGMA origen.table_info({tabla})')}
+    lista = ', '.join(f'"{columna}"' for columna in columnas if columna in origen)
+    return conn.execute(f'''
+        INSERT INTO main.{tabla} ({lista})
+        SELECT {lista} FROM origen.{tabla} WHERE user_id = ? ORDER BY id
+    ''', (user_id,)).rowcount
+
+
+def dividir(database, carpeta, limpiar=False):
+    """Copiar los datos de cada usuario de una base única a su shard.
+
+    Los shards que ya tienen datos se saltean, así se puede volver a correr
+    tras un error. Con `limpiar`, los datos copiados se borran de la base
+    principal. Devuelve las filas copiadas por tabla y los shards salteados.
+    """
+    migrations.migrate(database)
+    catalogo = sqlite3.connect(database)
+    try:
+        usuarios = [row[0] for row in catalogo.execute('SELECT id FROM usuarios ORDER BY id')]
+    finally:
+        catalogo.close()
+
+    totales = dict.fromkeys(TABLAS, 0)
+    totales.update(shards=0, salteados=[])
+    copiados = []
+    for user_id in usuarios:
+        conn = sqlite3.connect(crear(carpeta, user_id))
+        try:
+            if any(conn.execute(f'SELECT 1 FROM {tabla} LIMIT 1').fetchone() for tabla in TABLAS):
+                totales['salteados'].append(user_id)
+                continue
+            conn.execute('ATTACH DATABASE ? AS origen', (database,))
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Las superposiciones heredadas se copian igual (ver auditar-contratos)
+                triggers = conn.execute('''
+                    SELECT name, sql FROM main.sqlite_master
+                    WHERE type = 'trigger' AND name LIKE 'contratos_solapamiento_%'
+                ''').fetchall()
+                for nombre, _ in triggers:
+                    conn.execute(f'DROP TRIGGER main.{nombre}')
+                for tabla in TABLAS:
+                    totales[tabla] += _copiar(conn, tabla, user_id)
+                for _, sql in triggers:
+                    conn.execute(sql)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            conn.execute('DETACH DATABASE origen')
+            totales['shards'] += 1
+            copiados.append(user_id)
+        finally:
+            conn.close()
+
+    if limpiar and copiados:
+        catalogo = sqlite3.connect(database)
+        try:
+            with catalogo:
+                for desde in range(0, len(copiados), 500):
+                    lote = copiados[desde:desde + 500]
+                    for tabla in reversed(TABLAS):
+                        catalogo.execute(f"DELETE FROM {tabla} WHERE user_id IN ({', '.join('?' * len(lote))})", lote)
+        finally:
+            catalogo.close()
+    return totales
+
+
+def init_app(app):
+    """Registrar la configuración de shards en la aplicación"""
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
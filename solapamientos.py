@@ -0,0 +1,76 @@
+"""
+Contratos superpuestos sobre una misma propiedad.
+
+Los contratos no cancelados de una propiedad no pueden superponerse (las
+fechas son inclusivas). Como se cumple para todos, ordenados por fecha de
+inicio también quedan ordenados por fecha de fin, y un período nuevo solo
+puede chocar con dos: el que empieza inmediatamente antes (o el mismo día),
+si termina después de que empiece el nuevo, y el que empieza inmediatamente
+después, si empieza antes de que termine el nuevo. Son dos búsquedas con
+LIMIT 1 en el índice parcial idx_contratos_propiedad_vigentes
+(propiedad_id, fecha_inicio, fecha_fin, estado) WHERE estado IS NOT
+'cancelado', que cubre las condiciones sin leer la tabla: el costo no depende
+de cuántos contratos tenga la propiedad. buscar_solapado() lee además la
+fila encontrada, por su id.
+
+Una superposición heredada (de antes de la regla) rompe ese orden y puede
+ocultar un choque; auditar() recorre la base ordenada una vez para
+encontrarlas (`flask --app app auditar-contratos`).
+
+Los triggers de la migración 13 aplican la misma condición a toda escritura.
+"""
+
+# Contrato no cancelado de la propiedad (sin contar :excluir) que se superpone
+# con el período [:inicio, :fin]: el anterior más cercano o el siguiente
+SOLAPADO_SQL = '''
+    SELECT id, fecha_inicio, fecha_fin FROM contratos
+    WHERE id = (
+        SELECT id FROM contratos
+        WHERE propiedad_id = :propiedad_id AND fecha_inicio <= :inicio
+          AND estado IS NOT 'cancelado' AND id IS NOT :excluir
+        ORDER BY fecha_inicio DESC
+        LIMIT 1
+    ) AND fecha_fin >= :inicio
+    UNION ALL
+    SELECT id, fecha_inicio, fecha_fin FROM contratos
+    WHERE id = (
+        SELECT id FROM contratos
+        WHERE propiedad_id = :propiedad_id AND fecha_inicio > :inicio
+          AND estado IS NOT 'cancelado' AND id IS NOT :excluir
+        ORDER BY fecha_inicio
+        LIMIT 1
+    ) AND fecha_inicio <= :fin
+'''
+
+
+def buscar_solapado(conn, propiedad_id, fecha_inicio, fecha_fin, excluir_id=None):
+    """Contrato que se superpone con el período dado, o None"""
+    return conn.execute(SOLAPADO_SQL, {
+        'propiedad_id': propiedad_id, 'inicio': fecha_inicio, 'fin': fecha_fin, 'excluir': excluir_id,
+    }).fetchone()
+
+
+def auditar(conn):
+    """Pares (anterior, siguiente) de contratos superpuestos en toda la base.
+
+    Un solo recorrido ordenado por (propiedad_id, fecha_inicio): para cada
+    propiedad se recuerda el contrato que termina más tarde hasta el momento,
+    y cualquier contrato que empiece antes de ese fin se superpone con él.
+    """
+    cursor = conn.execute('''
+        SELECT c.id, c.user_id, c.propiedad_id, c.fecha_inicio, c.fecha_fin, c.estado
+        FROM contratos c
+        WHERE c.estado IS NOT 'cancelado' AND c.fecha_inicio IS NOT NULL AND c.fecha_fin IS NOT NULL
+        ORDER BY c.propiedad_id, c.fecha_inicio, c.fecha_fin
+    ''')
+    propiedad_actual = None
+    mas_largo = None
+    for contrato in cursor:
+        if contrato['propiedad_id'] != propiedad_actual:
+            propiedad_actual = contrato['propiedad_id']
+            mas_largo = contrato
+            continue
+        if contrato['fecha_inicio'] <= mas_largo['fecha_fin']:
+            yield mas_largo, contrato
+        if contrato['fecha_fin'] > mas_largo['fecha_fin']:
+            mas_largo = contrato
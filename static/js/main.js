@@ -1,92 +1,24 @@
 // Custom JavaScript for Alquileres Pro
 
+// Local date formatting (YYYY-MM-DD and DD/MM/YYYY HH:mm) without moment.js
+function pad2(n) {
+    return String(n).padStart(2, '0');
+}
+
+function isoDate(date) {
+    return `${date.getFullYear()}-${pad2(date.getMonth() + 1)}-${pad2(date.getDate())}`;
+}
+
+function displayDateTime(date) {
+    return `${pad2(date.getDate())}/${pad2(date.getMonth() + 1)}/${date.getFullYear()} ${pad2(date.getHours())}:${pad2(date.getMinutes())}`;
+}
+
 document.addEventListener('DOMContentLoaded', function() {
     
     // Set current date and time for last update
     const lastUpdateElement = document.getElementById('last-update');
     if (lastUpdateElement) {
-        moment.locale('es');
-        lastUpdateElement.textContent = moment().format('DD/MM/YYYY HH:mm');
-    }
-    
-    // Calculate remaining days for contracts
-    const diasRestantesElements = document.querySelectorAll('.dias-restantes');
-    diasRestantesElements.forEach(element => {
-        const fechaFin = element.getAttribute('data-fecha-fin');
-        if (fechaFin) {
-            const fechaFinMoment = moment(fechaFin);
-            const hoy = moment();
-            const diasRestantes = fechaFinMoment.diff(hoy, 'days');
-            
-            const badge = element.querySelector('.badge');
-            if (diasRestantes > 30) {
-                badge.className = 'badge bg-success';
-                badge.textContent = `${diasRestantes} días`;
-            } else if (diasRestantes > 7) {
-                badge.className = 'badge bg-warning';
-                badge.textContent = `${diasRestantes} días`;
-            } else if (diasRestantes > 0) {
-                badge.className = 'badge bg-danger';
-                badge.textContent = `${diasRestantes} días`;
-            } else {
-                badge.className = 'badge bg-secondary';
-                badge.textContent = 'Vencido';
-            }
-        }
-    });
-    
-    // Load contracts about to expire
-    const contratosPorVencerContainer = document.getElementById('contratos-por-vencer');
-    if (contratosPorVencerContainer) {
-        const contratosActivos = document.querySelectorAll('tbody tr');
-        let contratosPorVencerHTML = '';
-        
-        contratosActivos.forEach(row => {
-            const estado = row.querySelector('.status-badge')?.textContent.trim();
-            if (estado && estado.toLowerCase().includes('activo')) {
-                const fechaFinElement = row.querySelector('.dias-restantes');
-                if (fechaFinElement) {
-                    const fechaFin = fechaFinElement.getAttribute('data-fecha-fin');
-                    const fechaFinMoment = moment(fechaFin);
-                    const hoy = moment();
-                    const diasRestantes = fechaFinMoment.diff(hoy, 'days');
-                    
-                    if (diasRestantes <= 30 && diasRestantes > 0) {
-                        const id = row.querySelector('td:first-child')?.textContent.trim();
-                        const direccion = row.querySelector('td:nth-child(2)')?.textContent.trim();
-                        const inquilino = row.querySelector('td:nth-child(3)')?.textContent.trim();
-                        
-                        const alertClass = diasRestantes <= 7 ? 'danger' : 'warning';
-                        
-                        contratosPorVencerHTML += `
-                            <div class="col-md-6 mb-3">
-                                <div class="alert alert-${alertClass} d-flex align-items-center">
-                                    <i class="bi bi-exclamation-triangle me-2"></i>
-                                    <div>
-                                        <strong>Contrato #${id}</strong><br>
-                                        <small>${direccion} - ${inquilino}</small><br>
-                                        <small>Vence en ${diasRestantes} días (${fechaFin})</small>
-                                    </div>
-                                </div>
-                            </div>
-                        `;
-                    }
-                }
-            }
-        });
-        
-        if (contratosPorVencerHTML) {
-            contratosPorVencerContainer.innerHTML = contratosPorVencerHTML;
-        } else {
-            contratosPorVencerContainer.innerHTML = `
-                <div class="col-12">
-                    <div class="text-center text-muted py-3">
-                        <i class="bi bi-check-circle display-4"></i>
-                        <p class="mt-2">No hay contratos próximos a vencer</p>
-                    </div>
-                </div>
-            `;
-        }
+        lastUpdateElement.textContent = displayDateTime(new Date());
     }
     
     // Initialize tooltips
@@ -162,7 +94,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const endDateInputs = document.querySelectorAll('.end-date');
     
     // Set minimum date to today for start date inputs
-    const today = moment().format('YYYY-MM-DD');
+    const today = isoDate(new Date());
     startDateInputs.forEach(input => {
         input.min = today;
     });
@@ -176,23 +108,108 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
-    // Search functionality for tables
+    // Search functionality (server-side full-text search)
+    function fetchSearch(url, term) {
+        const separator = url.includes('?') ? '&' : '?';
+        return fetch(`${url}${separator}${new URLSearchParams({ q: term })}`, {
+            headers: { 'Accept': 'application/json' }
+        }).then(response => response.json()).then(data => data.resultados || []);
+    }
+
     const searchInputs = document.querySelectorAll('.table-search');
     searchInputs.forEach(input => {
-        input.addEventListener('keyup', function() {
-            const searchTerm = this.value.toLowerCase();
-            const table = this.closest('.card').querySelector('table');
-            const rows = table.querySelectorAll('tbody tr');
-            
-            rows.forEach(row => {
-                const text = row.textContent.toLowerCase();
-                if (text.includes(searchTerm)) {
-                    row.style.display = '';
-                } else {
-                    row.style.display = 'none';
+        const container = input.parentElement;
+        container.classList.add('position-relative');
+        const results = document.createElement('div');
+        results.className = 'list-group position-absolute w-100 shadow-sm search-results';
+        results.style.cssText = 'top: 100%; left: 0; z-index: 1050;';
+        container.appendChild(results);
+
+        let timer;
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            const term = this.value.trim();
+            if (!term) {
+                results.innerHTML = '';
+                return;
+            }
+            timer = setTimeout(() => {
+                let url = input.dataset.searchUrl;
+                if (input.dataset.entidad) {
+                    url += `?tipo=${encodeURIComponent(input.dataset.entidad)}`;
                 }
+                fetchSearch(url, term).then(items => {
+                    results.innerHTML = '';
+                    if (!items.length) {
+                        const empty = document.createElement('div');
+                        empty.className = 'list-group-item text-muted';
+                        empty.textContent = 'Sin resultados';
+                        results.appendChild(empty);
+                        return;
+                    }
+                    items.forEach(item => {
+                        const link = document.createElement('a');
+                        link.className = 'list-group-item list-group-item-action';
+                        link.href = item.url;
+                        const title = document.createElement('strong');
+                        title.textContent = item.titulo;
+                        const detail = document.createElement('small');
+                        detail.className = 'text-muted ms-2';
+                        detail.textContent = item.detalle;
+                        link.append(title, detail);
+                        results.appendChild(link);
+                    });
+                });
+            }, 200);
+        });
+
+        // Enter opens the first result instead of submitting the filters form
+        input.addEventListener('keydown', function(e) {
+            if (e.key === 'Enter') {
+                e.preventDefault();
+                const first = results.querySelector('a');
+                if (first) {
+                    window.location.href = first.href;
+                }
+            }
+        });
+    });
+
+    // Searchable selects (options are loaded from the search endpoint)
+    const selectSearchInputs = document.querySelectorAll('.select-search');
+    selectSearchInputs.forEach(input => {
+        const select = document.getElementById(input.dataset.target);
+        if (!select) {
+            return;
+        }
+        const placeholder = select.options[0];
+
+        function loadOptions(term) {
+            fetchSearch(input.dataset.searchUrl, term).then(items => {
+                const selected = select.value;
+                select.innerHTML = '';
+                select.appendChild(placeholder);
+                items.forEach(item => {
+                    const option = document.createElement('option');
+                    option.value = item.id;
+                    option.textContent = item.precio !== null
+                        ? `${item.titulo} - ${item.detalle} ($${Number(item.precio).toFixed(2)})`
+                        : `${item.titulo} (${item.detalle})`;
+                    if (item.precio !== null) {
+                        option.setAttribute('data-precio', item.precio);
+                    }
+                    select.appendChild(option);
+                });
+                select.value = selected;
             });
+        }
+
+        let timer;
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            timer = setTimeout(() => loadOptions(this.value.trim()), 200);
         });
+        loadOptions('');
     });
 
     // Status badge updates
@@ -298,14 +315,6 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
-    // Export functionality (placeholder)
-    const exportButtons = document.querySelectorAll('.btn-export');
-    exportButtons.forEach(button => {
-        button.addEventListener('click', function() {
-            alert('Función de exportación en desarrollo');
-        });
-    });
-
     // Dark mode toggle (if implemented)
     const darkModeToggle = document.querySelector('#darkModeToggle');
     if (darkModeToggle) {
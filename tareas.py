@@ -0,0 +1,184 @@
+"""
+Tareas periódicas sobre los datos de todos los usuarios.
+
+vencer_contratos() marca como vencidos los contratos activos cuya fecha de fin
+ya pasó y deja disponibles sus propiedades. Trabaja en lotes acotados, cada
+uno en su propia transacción corta, con una pausa entre lotes para que los
+requests web puedan tomar el lock de escritura. Cada ejecución queda
+registrada en tareas_ejecuciones.
+
+Se puede correr desde cron con `flask vencer-contratos`, o dentro de la app
+con TAREAS_INTERVALO > 0: cada worker arranca un thread, y la tabla de
+ejecuciones evita que dos workers corran la tarea en el mismo intervalo.
+"""
+
+import logging
+import threading
+import time
+from datetime import date
+
+VENCER_CONTRATOS = 'vencer_contratos'
+TAMANO_LOTE = 200
+PAUSA = 0.05          # segundos entre lotes
+
+# Próximo lote de contratos activos ya vencidos, los más viejos primero
+VENCIDOS_SQL = '''
+    SELECT id, propiedad_id FROM contratos
+    WHERE estado = 'activo' AND fecha_fin < ?
+    ORDER BY fecha_fin
+    LIMIT ?
+'''
+
+logger = logging.getLogger(__name__)
+
+
+def vencer_contratos(conn, hoy=None, tamano_lote=TAMANO_LOTE, pausa=PAUSA):
+    """Vencer los contratos activos con fecha_fin anterior a hoy.
+
+    Devuelve las estadísticas de la ejecución: lotes, contratos vencidos,
+    propiedades liberadas y el tiempo máximo que se retuvo el lock (ms).
+    """
+    hoy = (hoy or date.today()).isoformat()
+    stats = {'lotes': 0, 'contratos': 0, 'propiedades': 0, 'lock_max_ms': 0.0}
+
+    while True:
+        inicio = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(VENCIDOS_SQL, (hoy, tamano_lote)).fetchall()
+            if not rows:
+                conn.rollback()
+                break
+
+            contratos = [row[0] for row in rows]
+            propiedades = sorted({row[1] for row in rows})
+            conn.execute(f'''
+                UPDATE contratos SET estado = 'vencido'
+                WHERE id IN ({', '.join('?' * len(contratos))})
+            ''', contratos)
+            # Una propiedad con otro contrato activo (una renovación) sigue alquilada
+            liberadas = conn.execute(f'''
+                UPDATE propiedades SET estado = 'disponible'
+                WHERE id IN ({', '.join('?' * len(propiedades))}) AND estado = 'alquilada'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM contratos c
+                      WHERE c.propiedad_id = propiedades.id AND c.estado = 'activo'
+                  )
+            ''', propiedades).rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        stats['lotes'] += 1
+        stats['contratos'] += len(contratos)
+        stats['propiedades'] += liberadas
+        stats['lock_max_ms'] = max(stats['lock_max_ms'], round((time.perf_counter() - inicio) * 1000, 3))
+        if len(rows) < tamano_lote:
+            break
+        time.sleep(pausa)
+
+    return stats
+
+
+def reclamar(conn, tarea, intervalo=None):
+    """Registrar el inicio de una ejecución y devolver su id.
+
+    Con intervalo (segundos), devuelve None si otra ejecución de la tarea
+    empezó dentro de ese plazo; así varios workers no la repiten.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if intervalo:
+            reciente = conn.execute('''
+                SELECT 1 FROM tareas_ejecuciones
+                WHERE tarea = ? AND inicio > datetime('now', ?)
+            ''', (tarea, f'-{int(intervalo)} seconds')).fetchone()
+            if reciente:
+                conn.rollback()
+                return None
+        ejecucion_id = conn.execute(
+            "INSERT INTO tareas_ejecuciones (tarea, inicio) VALUES (?, datetime('now'))", (tarea,)
+        ).lastrowid
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return ejecucion_id
+
+
+def ejecutar_vencimientos(conn, intervalo=None, tamano_lote=TAMANO_LOTE, pausa=PAUSA, hoy=None, bases=None):
+    """Correr vencer_contratos() y registrar la ejecución en conn.
+
+    `bases` son las conexiones donde vencer contratos; por defecto la misma
+    conn (en modo shards, una por usuario). Devuelve las estadísticas, o None
+    si la tarea ya corrió dentro del intervalo.
+    """
+    ejecucion_id = reclamar(conn, VENCER_CONTRATOS, intervalo)
+    if ejecucion_id is None:
+        return None
+
+    inicio = time.perf_counter()
+    stats, error = {}, None
+    try:
+        stats = {'lotes': 0, 'contratos': 0, 'propiedades': 0, 'lock_max_ms': 0.0}
+        for base in (bases if bases is not None else [conn]):
+            parcial = vencer_contratos(base, hoy=hoy, tamano_lote=tamano_lote, pausa=pausa)
+            for clave in ('lotes', 'contratos', 'propiedades'):
+                stats[clave] += parcial[clave]
+            stats['lock_max_ms'] = max(stats['lock_max_ms'], parcial['lock_max_ms'])
+        return stats
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        conn.execute('''
+            UPDATE tareas_ejecuciones
+            SET fin = datetime('now'), segundos = ?, lotes = ?, contratos = ?, propiedades = ?,
+                lock_max_ms = ?, error = ?
+            WHERE id = ?
+        ''', (round(time.perf_counter() - inicio, 3), stats.get('lotes', 0), stats.get('contratos', 0),
+              stats.get('propiedades', 0), stats.get('lock_max_ms'), error, ejecucion_id))
+        conn.commit()
+
+
+def ultimas(conn, tarea=VENCER_CONTRATOS, limite=20):
+    """Últimas ejecuciones registradas de una tarea"""
+    return conn.execute('''
+        SELECT * FROM tareas_ejecuciones WHERE tarea = ?
+        ORDER BY inicio DESC, id DESC LIMIT ?
+    ''', (tarea, limite)).fetchall()
+
+
+class Programador(threading.Thread):
+    """Thread que corre ejecutar_vencimientos() cada `intervalo` segundos.
+
+    `bases`, si se indica, es una función que devuelve las conexiones donde
+    vencer contratos en cada ejecución (modo shards). `despues`, si se indica,
+    recibe las estadísticas de cada ejecución que corrió en este proceso.
+    """
+
+    def __init__(self, pool, intervalo, tamano_lote=TAMANO_LOTE, bases=None, despues=None):
+        super().__init__(name='tareas', daemon=True)
+        self.pool = pool
+        self.intervalo = intervalo
+        self.tamano_lote = tamano_lote
+        self.bases = bases
+        self.despues = despues
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            conn = self.pool.acquire()
+            try:
+                stats = ejecutar_vencimientos(conn, intervalo=self.intervalo, tamano_lote=self.tamano_lote,
+                                              bases=self.bases() if self.bases else None)
+                if stats is not None and self.despues is not None:
+                    self.despues(stats)
+            except Exception:
+                logger.exception('Error en la tarea %s', VENCER_CONTRATOS)
+            finally:
+                self.pool.release(conn)
+
+    def detener(self):
+        self._parar.set()
@@ -5,60 +5,1513 @@ Script de prueba simple para verificar que la aplicación funciona correctamente
 
 import sqlite3
 import os
+import pathlib
+import tempfile
+
+import pytest
+
+
+@pytest.fixture
+def app_temporal(tmp_path):
+    """Aplicación apuntando a una base de datos temporal"""
+    import db
+    import fragmentos
+    from app import app, init_db
+
+    original = app.config['DATABASE']
+    app.config['DATABASE'] = str(tmp_path / 'alquileres_test.db')
+    app.config['TESTING'] = True
+    db.reset_pool(app)
+    fragmentos.reset_cache(app)
+    init_db()
+    yield app
+    db.reset_pool(app)
+    fragmentos.reset_cache(app)
+    app.config['DATABASE'] = original
 
 def test_database():
     """Probar la conexión a la base de datos"""
+    # Solo lectura: la base no se modifica ni se crea vacía si falta
+    conn = sqlite3.connect('file:alquileres.db?mode=ro', uri=True)
     try:
-        conn = sqlite3.connect('alquileres.db')
         cursor = conn.cursor()
-        
+
         # Verificar que las tablas existen
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        print(f"Tablas encontradas: {[table[0] for table in tables]}")
-        
+        tables = [table[0] for table in cursor.fetchall()]
+        print(f"Tablas encontradas: {tables}")
+        assert {'usuarios', 'paquetes', 'propiedades', 'inquilinos', 'contratos'} <= set(tables)
+
         # Verificar usuarios
         cursor.execute("SELECT COUNT(*) FROM usuarios")
         user_count = cursor.fetchone()[0]
         print(f"Usuarios en la base de datos: {user_count}")
-        
-        # Verificar propiedades
-        cursor.execute("SELECT COUNT(*) FROM propiedades")
-        prop_count = cursor.fetchone()[0]
-        print(f"Propiedades en la base de datos: {prop_count}")
-        
-        # Verificar inquilinos
-        cursor.execute("SELECT COUNT(*) FROM inquilinos")
-        inquilino_count = cursor.fetchone()[0]
-        print(f"Inquilinos en la base de datos: {inquilino_count}")
-        
-        # Verificar contratos
-        cursor.execute("SELECT COUNT(*) FROM contratos")
-        contrato_count = cursor.fetchone()[0]
-        print(f"Contratos en la base de datos: {contrato_count}")
-        
+        assert user_count > 0
+
+        # Verificar propiedades, inquilinos y contratos
+        for tabla in ('propiedades', 'inquilinos', 'contratos'):
+            cursor.execute(f"SELECT COUNT(*) FROM {tabla}")
+            print(f"{tabla.capitalize()} en la base de datos: {cursor.fetchone()[0]}")
+    finally:
         conn.close()
-        print("✅ Conexión a la base de datos exitosa")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Error en la base de datos: {e}")
-        return False
+    print("✅ Conexión a la base de datos exitosa")
 
-def test_flask_app():
+def test_flask_app(tmp_path):
     """Probar que Flask puede importarse y crear la aplicación"""
+    import db
+    import migrations
+    from app import app, init_db
+
+    # Inicializar una base de datos temporal: la de alquileres.db no se toca
+    original = app.config['DATABASE']
+    app.config['DATABASE'] = str(tmp_path / 'alquileres_test.db')
+    try:
+        assert init_db() == len(migrations.MIGRACIONES)
+    finally:
+        db.reset_pool(app)
+        app.config['DATABASE'] = original
+    print("✅ Aplicación Flask creada correctamente")
+    print("✅ Base de datos inicializada")
+
+def test_pool_conexiones(app_temporal):
+    """El pool reutiliza una conexión por request y abre la base en modo WAL"""
+    import db
+
+    # init_db abre la primera conexión; los requests la reutilizan
+    client = app_temporal.test_client()
+    for _ in range(3):
+        assert client.post('/login', data={'username': 'nadie', 'password': 'x'}).status_code == 200
+
+    stats = db.get_pool(app_temporal).stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 3
+    assert stats['idle'] == 1
+
+    with app_temporal.app_context():
+        conn = db.get_db()
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+
+def test_migraciones(tmp_path, monkeypatch):
+    """Las migraciones se aplican una vez y actualizan bases sin versionar"""
+    import migrations
+
+    # Base heredada: tablas sin user_id y sin versión de esquema
+    database = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(database)
+    conn.execute('''
+        CREATE TABLE propiedades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            direccion TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            estado TEXT DEFAULT 'disponible',
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("INSERT INTO propiedades (direccion, tipo) VALUES ('Calle 1', 'casa')")
+    conn.commit()
+    conn.close()
+
+    assert migrations.migrate(database) == len(migrations.MIGRACIONES)
+
+    conn = sqlite3.connect(database)
+    assert conn.execute('SELECT user_id FROM propiedades').fetchone()[0] == 1
+    assert conn.execute('SELECT es_admin FROM usuarios WHERE id = 1').fetchone()[0] == 1
+    assert conn.execute('SELECT COUNT(*) FROM paquetes').fetchone()[0] == 3
+    conn.close()
+
+    # Arranque en caliente: no se vuelve a ejecutar ninguna migración
+    def no_llamar(*args, **kwargs):
+        raise AssertionError('No debería recalcular el hash del admin')
+    monkeypatch.setattr(migrations, 'generate_password_hash', no_llamar)
+    assert migrations.migrate(database) == len(migrations.MIGRACIONES)
+
+# Consultas de las rutas que filtran por usuario: ninguna debe recorrer la tabla
+# completa ni ordenar con un B-tree temporal. Se arman con el mismo SQL que
+# ejecuta el código, así un cambio en una consulta queda cubierto.
+def _consultas_rutas():
+    import consola
+    import listados
+    import solapamientos
+    import tareas
+    import usage
+    import vencimientos
+
+    return {
+        'uso_contadores': (usage.CONTADORES_SQL, (1,)),
+        'index_propiedades_recientes': (listados.PROPIEDADES_RECIENTES_SQL, (1, 5)),
+        'index_contratos_recientes': (listados.CONTRATOS_RECIENTES_SQL, (1, 5)),
+        'contratos_por_vencer': (vencimientos.POR_VENCER_SQL, {
+            'user_id': 1, 'hoy': '2024-01-01', 'hasta': '2024-01-31', 'limite': 50,
+        }),
+        'tareas_vencer_contratos': (tareas.VENCIDOS_SQL, ('2024-01-01', 200)),
+        'contratos_solapado': (solapamientos.SOLAPADO_SQL, {
+            'propiedad_id': 1, 'inicio': '2024-01-01', 'fin': '2024-12-31', 'excluir': 1,
+        }),
+        **{
+            f'consola_{nombre}': consola._consulta_pagina(
+                filtros, 'uso', True, 50, consola.encode_cursor({'orden_valor': 0.5, 'id': 1}), None, con_shards)[:2]
+            for nombre, filtros, con_shards in (
+                ('uso', {}, False), ('uso_activos', {'estado': 'activos'}, False),
+                ('uso_min', {'uso_min': 80}, False), ('uso_shards', {}, True),
+            )
+        },
+    }
+
+CONSULTAS_RUTAS = _consultas_rutas()
+
+def _consultas_listados():
+    """Consultas paginadas de los listados, con y sin filtros"""
+    import listados
+
+    casos = {
+        'propiedades': (listados.consulta_propiedades, {}, ''),
+        'propiedades_estado': (listados.consulta_propiedades, {'estado': 'disponible'}, ''),
+        'propiedades_tipo': (listados.consulta_propiedades, {'tipo': 'casa'}, ''),
+        'inquilinos': (listados.consulta_inquilinos, {}, ''),
+        'contratos': (listados.consulta_contratos, {}, 'c'),
+        'contratos_estado': (listados.consulta_contratos, {'estado': 'activo'}, 'c'),
+        'contratos_desde': (listados.consulta_contratos, {'desde': '2024-01-01'}, 'c'),
+    }
+    despues = listados.encode_cursor({'fecha_creacion': '2024-01-01', 'id': 1})
+    for nombre, (consulta, filtros, alias) in casos.items():
+        sql, params = consulta(1, filtros)
+        sql, params, _, _ = listados._consulta_pagina(sql, params, 25, despues, None, alias)
+        CONSULTAS_RUTAS[f'listado_{nombre}'] = (sql, params)
+
+_consultas_listados()
+
+@pytest.fixture(scope='module')
+def base_migrada(tmp_path_factory):
+    """Base vacía con todas las migraciones aplicadas"""
+    import migrations
+
+    database = str(tmp_path_factory.mktemp('plan') / 'plan.db')
+    migrations.migrate(database)
+    return database
+
+@pytest.mark.parametrize('nombre', sorted(CONSULTAS_RUTAS))
+def test_plan_consultas_rutas(base_migrada, nombre):
+    """Las consultas de las rutas usan los índices compuestos"""
+    conn = sqlite3.connect(base_migrada)
+    sql, params = CONSULTAS_RUTAS[nombre]
+    plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+    conn.close()
+
+    for detalle in plan:
+        assert not detalle.startswith('SCAN'), f'{nombre}: {plan}'
+        assert 'TEMP B-TREE' not in detalle, f'{nombre}: {plan}'
+
+def _crear_usuario(app, paquete_id=1):
+    """Crear un usuario de prueba sin pasar por el hash de contraseña"""
+    import db
+
+    with app.app_context():
+        conn = db.get_db()
+        cursor = conn.execute('''
+            INSERT INTO usuarios (username, email, password_hash, nombre, apellido, paquete_id)
+            VALUES ('prueba', 'prueba@example.com', 'x', 'Prueba', 'Test', ?)
+        ''', (paquete_id,))
+        conn.commit()
+        return cursor.lastrowid
+
+def _cliente(app, user_id):
+    """Cliente de prueba con la sesión ya iniciada"""
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['username'] = 'prueba'
+        sess['nombre'] = 'Prueba'
+        sess['es_admin'] = 0
+    return client
+
+def test_contadores_uso(app_temporal):
+    """tenant_usage sigue las altas/bajas y limita según el paquete"""
+    import db
+    import listados
+    import usage
+
+    user_id = _crear_usuario(app_temporal, paquete_id=1)
+    client = _cliente(app_temporal, user_id)
+    datos = {'direccion': 'Calle 1', 'tipo': 'casa', 'habitaciones': '2', 'baños': '1', 'precio': '100'}
+    for _ in range(6):
+        client.post('/propiedades/nueva', data=datos)
+
+    with app_temporal.app_context():
+        conn = db.get_db()
+        assert conn.execute('SELECT COUNT(*) FROM propiedades WHERE user_id = ?', (user_id,)).fetchone()[0] == 5
+        uso = usage.get_usage(conn, user_id)
+        assert uso['propiedades'] == 5
+        assert uso['propiedades_disponibles'] == 5
+
+        propiedad_id = conn.execute('SELECT id FROM propiedades WHERE user_id = ?', (user_id,)).fetchone()[0]
+        conn.execute('UPDATE propiedades SET estado = "alquilada" WHERE id = ?', (propiedad_id,))
+        conn.execute('DELETE FROM propiedades WHERE id != ? AND user_id = ?', (propiedad_id, user_id))
+        conn.commit()
+        assert usage.get_usage(conn, user_id)['propiedades'] == 1
+        assert usage.get_usage(conn, user_id)['propiedades_disponibles'] == 0
+        assert usage.verify(conn) == []
+
+        # Las tarjetas de resumen salen de los mismos contadores
+        conn.execute('UPDATE propiedades SET precio = 250.5 WHERE id = ?', (propiedad_id,))
+        conn.execute('''
+            INSERT INTO inquilinos (user_id, nombre, apellido, email, telefono, dni)
+            VALUES (?, 'Ana', 'Paz', 'ana@example.com', '', '123'), (?, 'Luis', 'Sosa', NULL, '555', NULL)
+        ''', (user_id, user_id))
+        conn.execute('''
+            INSERT INTO contratos (user_id, propiedad_id, inquilino_id, fecha_inicio, fecha_fin, precio_mensual, estado)
+            VALUES (?, ?, NULL, '2020-01-01', '2020-12-31', 99.99, 'vencido')
+        ''', (user_id, propiedad_id))
+        conn.execute("UPDATE inquilinos SET email = '' WHERE nombre = 'Ana' AND user_id = ?", (user_id,))
+        conn.commit()
+        assert listados.resumen_propiedades(conn, user_id) == {
+            'total': 1, 'disponibles': 0, 'alquiladas': 1, 'valor_total': 250.5}
+        assert listados.resumen_inquilinos(conn, user_id) == {
+            'total': 2, 'con_email': 0, 'con_telefono': 1, 'con_dni': 1}
+        assert listados.resumen_contratos(conn, user_id) == {
+            'total': 1, 'activos': 0, 'vencidos': 1, 'ingresos_mensuales': 99.99}
+        assert usage.verify(conn) == []
+
+        # Una diferencia introducida a mano se detecta y se repara
+        conn.execute('UPDATE tenant_usage SET inquilinos = 7 WHERE user_id = ?', (user_id,))
+        conn.commit()
+        assert usage.verify(conn) == [(user_id, 'inquilinos', 7, 2)]
+        usage.rebuild(conn)
+        conn.commit()
+        assert usage.verify(conn) == []
+
+def test_paginacion_keyset(app_temporal):
+    """Los listados se recorren por páginas sin repetir ni saltear filas"""
+    import db
+    import listados
+
+    user_id = _crear_usuario(app_temporal, paquete_id=2)
+    with app_temporal.app_context():
+        conn = db.get_db()
+        for n in range(7):
+            conn.execute('''
+                INSERT INTO propiedades (user_id, direccion, tipo, precio, estado, fecha_creacion)
+                VALUES (?, ?, 'casa', 100, ?, '2024-01-01 10:00:00')
+            ''', (user_id, f'Calle {n}', 'disponible' if n % 2 else 'alquilada'))
+        conn.commit()
+
+        sql, params = listados.consulta_propiedades(user_id, {})
+        vistos = []
+        pagina = listados.paginar(conn, sql, params, 3)
+        while True:
+            vistos.extend(row['id'] for row in pagina)
+            if not pagina.siguiente:
+                break
+            pagina = listados.paginar(conn, sql, params, 3, despues=pagina.siguiente)
+        assert vistos == sorted(vistos, reverse=True)
+        assert len(set(vistos)) == 7
+
+        anterior = listados.paginar(conn, sql, params, 3, antes=pagina.anterior)
+        assert [row['id'] for row in anterior] == vistos[3:6]
+
+        sql, params = listados.consulta_propiedades(user_id, {'estado': 'disponible'})
+        assert len(listados.paginar(conn, sql, params, 10)) == 3
+
+    client = _cliente(app_temporal, user_id)
+    respuesta = client.get('/propiedades?por_pagina=3&estado=alquilada')
+    assert respuesta.status_code == 200
+    assert b'despues=' in respuesta.data
+
+def test_busqueda_fts(app_temporal):
+    """El índice FTS sigue los cambios y solo devuelve datos del usuario"""
+    import db
+
+    user_id = _crear_usuario(app_temporal, paquete_id=2)
+    with app_temporal.app_context():
+        conn = db.get_db()
+        conn.execute("INSERT INTO propiedades (user_id, direccion, tipo, precio) VALUES (?, 'Avenida Córdoba 1200', 'departamento', 500)", (user_id,))
+        conn.execute("INSERT INTO propiedades (user_id, direccion, tipo, precio) VALUES (1, 'Avenida Córdoba 900', 'casa', 800)")
+        conn.execute("INSERT INTO inquilinos (user_id, nombre, apellido, dni) VALUES (?, 'María', 'Gómez', '30111222')", (user_id,))
+        propiedad_id = conn.execute('SELECT id FROM propiedades WHERE user_id = ?', (user_id,)).fetchone()[0]
+        inquilino_id = conn.execute('SELECT id FROM inquilinos WHERE user_id = ?', (user_id,)).fetchone()[0]
+        conn.execute('''
+            INSERT INTO contratos (user_id, propiedad_id, inquilino_id, fecha_inicio, fecha_fin, precio_mensual)
+            VALUES (?, ?, ?, '2024-01-01', '2025-01-01', 500)
+        ''', (user_id, propiedad_id, inquilino_id))
+        conn.commit()
+
+    client = _cliente(app_temporal, user_id)
+
+    resultados = client.get('/buscar?q=cordo').get_json()['resultados']
+    assert {(r['entidad'], r['titulo']) for r in resultados} == {
+        ('propiedad', 'Avenida Córdoba 1200'),
+        ('contrato', 'Avenida Córdoba 1200'),
+    }
+
+    resultados = client.get('/buscar?q=gomez&tipo=inquilino').get_json()['resultados']
+    assert [r['id'] for r in resultados] == [inquilino_id]
+
+    # Editar el inquilino actualiza también el documento del contrato
+    client.post(f'/inquilinos/{inquilino_id}/editar', data={
+        'nombre': 'María', 'apellido': 'Pérez', 'email': '', 'telefono': '', 'dni': '30111222'})
+    resultados = client.get('/buscar?q=perez&tipo=contrato').get_json()['resultados']
+    assert len(resultados) == 1
+    assert client.get('/buscar?q=gomez').get_json()['resultados'] == []
+
+    # Selector del formulario: sin texto devuelve las propiedades disponibles
+    resultados = client.get('/buscar?tipo=propiedad&disponibles=1').get_json()['resultados']
+    assert [r['id'] for r in resultados] == [propiedad_id]
+
+def test_exportacion(app_temporal):
+    """Las exportaciones respetan los filtros y generan CSV y XLSX válidos"""
+    import io
+    import zipfile
+    import db
+
+    user_id = _crear_usuario(app_temporal, paquete_id=2)
+    with app_temporal.app_context():
+        conn = db.get_db()
+        for n, estado in enumerate(['disponible', 'alquilada', 'disponible']):
+            conn.execute('''
+                INSERT INTO propiedades (user_id, direccion, tipo, precio, estado)
+                VALUES (?, ?, 'casa', 100.5, ?)
+            ''', (user_id, f'Calle <{n}>', estado))
+        conn.commit()
+
+    client = _cliente(app_temporal, user_id)
+
+    respuesta = client.get('/propiedades/exportar?formato=csv&estado=disponible')
+    assert respuesta.status_code == 200
+    assert respuesta.is_streamed
+    lineas = respuesta.data.decode('utf-8-sig').splitlines()
+    assert lineas[0].startswith('ID,Dirección,Tipo')
+    assert len(lineas) == 3
+
+    respuesta = client.get('/propiedades/exportar?formato=xlsx')
+    libro = zipfile.ZipFile(io.BytesIO(respuesta.data))
+    hoja = libro.read('xl/worksheets/sheet1.xml').decode('utf-8')
+    assert hoja.count('<row>') == 4
+    assert 'Calle &lt;2&gt;' in hoja
+
+def test_importacion(app_temporal):
+    """La importación informa errores por fila, respeta UNIQUE y el límite del paquete"""
+    import io
+    import db
+    import usage
+
+    user_id = _crear_usuario(app_temporal, paquete_id=1)
+    client = _cliente(app_temporal, user_id)
+
+    csv_inquilinos = (
+        'Nombre,Apellido,Email,Teléfono,DNI\n'
+        'Ana,Pérez,ana@example.com,,111\n'
+        'Luis,Gómez,,,222\n'
+        'Repetido,DNI,otro@example.com,,111\n'
+        'Sin,Documento,,,\n'
+        'Eva,Ruiz,ana@example.com,,333\n'
+    )
+    respuesta = client.post('/inquilinos/importar', data={
+        'archivo': (io.BytesIO(csv_inquilinos.encode('utf-8-sig')), 'inquilinos.csv'),
+    }, content_type='multipart/form-data')
+    assert respuesta.status_code == 200
+    texto = respuesta.data.decode('utf-8')
+    assert '2 de 5 filas importadas' in texto
+    assert 'DNI ya registrado: 111' in texto
+    assert 'Email ya registrado: ana@example.com' in texto
+
+    # El paquete Básico admite 5 propiedades: un archivo con 6 no importa nada
+    csv_propiedades = 'direccion,tipo,precio\n' + ''.join(f'Calle {n},casa,100\n' for n in range(6))
+    respuesta = client.post('/propiedades/importar', data={
+        'archivo': (io.BytesIO(csv_propiedades.encode('utf-8')), 'propiedades.csv'),
+    }, content_type='multipart/form-data')
+    assert 'supera el límite' in respuesta.data.decode('utf-8')
+
+    with app_temporal.app_context():
+        conn = db.get_db()
+        assert conn.execute('SELECT COUNT(*) FROM propiedades WHERE user_id = ?', (user_id,)).fetchone()[0] == 0
+        assert conn.execute('SELECT email FROM inquilinos WHERE dni = ?', ('222',)).fetchone()[0] is None
+        assert usage.get_usage(conn, user_id)['inquilinos'] == 2
+
+def test_cache_cuentas(app_temporal):
+    """El usuario y su paquete salen de la caché mientras su versión no cambie en la base"""
+    import cuentas
+    import db
+
+    user_id = _crear_usuario(app_temporal, paquete_id=1)
+    client = _cliente(app_temporal, user_id)
+    assert client.get('/').status_code == 200
+
+    # Con el usuario en caché, otra página solo lee su versión, no la fila ni los paquetes
+    consultas = []
+    pool = db.get_pool_lectura(app_temporal)
+    conn = pool.acquire()
+    conn.set_trace_callback(consultas.append)
+    pool.release(conn)
+    assert client.get('/propiedades').status_code == 200
+    conn.set_trace_callback(None)
+    leidas = [sql for sql in consultas if 'usuarios' in sql or 'paquetes' in sql]
+    assert consultas and leidas == [cuentas.VERSION_SQL.replace('?', str(user_id))]
+
+    # Un cambio hecho por otro proceso (sin invalidar esta caché) se ve enseguida
+    otra = sqlite3.connect(app_temporal.config['DATABASE'])
+    otra.execute('UPDATE usuarios SET paquete_id = 3 WHERE id = ?', (user_id,))
+    otra.commit()
+    with app_temporal.app_context():
+        assert cuentas.get_usuario(db.get_db, user_id)['max_propiedades'] == 100
+    assert cuentas.stats()['size'] == 1
+
+    # Una cuenta desactivada en otro proceso pierde la sesión en el request siguiente
+    otra.execute('UPDATE usuarios SET activo = 0 WHERE id = ?', (user_id,))
+    otra.commit()
+    otra.close()
+    assert client.get('/').status_code == 302
+    with client.session_transaction() as sess:
+        assert 'user_id' not in sess
+
+def test_hash_contrasenas(app_temporal):
+    """El hash corre en el pool de procesos, respeta la cola y se recalcula al iniciar sesión"""
+    import claves
+    import db
+
+    hasher = claves.Hasher(iteraciones=1000, workers=1)
+    try:
+        password_hash = hasher.generar('secreta')
+    finally:
+        hasher.close()
+    assert password_hash.startswith('pbkdf2:sha256:1000$')
+
+    hasher = claves.Hasher(iteraciones=2000, workers=0, max_cola=1)
+    assert hasher.verificar(password_hash, 'otra') == (False, None)
+    valida, nuevo = hasher.verificar(password_hash, 'secreta')
+    assert valida and nuevo.startswith('pbkdf2:sha256:2000$')
+    hasher._cola.acquire()
+    with pytest.raises(claves.ColaLlena):
+        hasher.generar('secreta')
+    assert hasher.stats()['rechazadas'] == 1
+    assert hasher.stats()['operaciones'] == 2
+
+    # El admin se creó con los parámetros por defecto: al entrar se recalcula
+    app_temporal.config.update(PASSWORD_HASH_ITERATIONS=1000, PASSWORD_HASH_WORKERS=0)
+    claves.reset_hasher(app_temporal)
+    try:
+        client = app_temporal.test_client()
+        respuesta = client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+        assert respuesta.status_code == 302
+        with app_temporal.app_context():
+            guardado = db.get_db().execute('SELECT password_hash FROM usuarios WHERE id = 1').fetchone()[0]
+        assert guardado.startswith('pbkdf2:sha256:1000$')
+        assert claves.get_hasher(app_temporal).stats()['rehash'] == 1
+    finally:
+        app_temporal.config.update(PASSWORD_HASH_ITERATIONS=claves.DEFAULT_CONFIG['PASSWORD_HASH_ITERATIONS'],
+                                   PASSWORD_HASH_WORKERS=claves.DEFAULT_CONFIG['PASSWORD_HASH_WORKERS'])
+        claves.reset_hasher(app_temporal)
+
+def test_contratos_por_vencer(app_temporal):
+    """Solo los contratos activos dentro del plazo, con los días restantes"""
+    from datetime import date, timedelta
+    import db
+
+    user_id = _crear_usuario(app_temporal, paquete_id=2)
+    hoy = date.today()
+    with app_temporal.app_context():
+        conn = db.get_db()
+        propiedad_id = conn.execute(
+            "INSERT INTO propiedades (user_id, direccion, tipo, precio) VALUES (?, 'Calle 1', 'casa', 100)",
+            (user_id,)).lastrowid
+        inquilino_id = conn.execute(
+            "INSERT INTO inquilinos (user_id, nombre, apellido, dni) VALUES (?, 'Ana', 'Pérez', '1')",
+            (user_id,)).lastrowid
+        # Períodos cortos y consecutivos: una propiedad no admite contratos superpuestos
+        for dias, estado in [(5, 'activo'), (20, 'activo'), (60, 'activo'), (3, 'cancelado'), (-2, 'activo')]:
+            fin = hoy + timedelta(days=dias)
+            conn.execute('''
+                INSERT INTO contratos (user_id, propiedad_id, inquilino_id, fecha_inicio, fecha_fin, precio_mensual, estado)
+                VALUES (?, ?, ?, ?, ?, 100, ?)
+            ''', (user_id, propiedad_id, inquilino_id, (fin - timedelta(days=1)).isoformat(), fin.isoformat(), estado))
+        conn.commit()
+
+    client = _cliente(app_temporal, user_id)
+    datos = client.get('/contratos/por-vencer').get_json()
+    assert [c['dias_restantes'] for c in datos['contratos']] == [5, 20]
+    assert datos['contratos'][0]['inquilino'] == 'Ana Pérez'
+    datos = client.get('/contratos/por-vencer?dias=90').get_json()
+    assert [c['dias_restantes'] for c in datos['contratos']] == [5, 20, 60]
+
+    texto = client.get('/').data.decode('utf-8')
+    assert 'Vence en 5 días' in texto and 'Vence en 20 días' in texto
+    assert '>Vencido<' in client.get('/contratos').data.decode('utf-8')
+
+def test_vencer_contratos(app_temporal):
+    """La tarea vence contratos por lotes, libera propiedades y registra la ejecución"""
+    from datetime import date
+    import db
+    import tareas
+    import usage
+
+    user_id = _crear_usuario(app_temporal, paquete_id=2)
+    with app_temporal.app_context():
+        conn = db.get_db()
+        inquilino_id = conn.execute(
+            "INSERT INTO inquilinos (user_id, nombre, apellido, dni) VALUES (?, 'Ana', 'Pérez', '1')",
+            (user_id,)).lastrowid
+        # Tres propiedades con un contrato vencido; la última además tiene una renovación activa
+        periodos = [
+            [('2023-01-01', '2024-01-31')],
+            [('2023-01-01', '2024-02-29')],
+            [('2023-01-01', '2024-03-31'), ('2024-04-01', '2025-03-31')],
+        ]
+        for n, contratos in enumerate(periodos):
+            propiedad_id = conn.execute(
+                "INSERT INTO propiedades (user_id, direccion, tipo, precio, estado) VALUES (?, ?, 'casa', 100, 'alquilada')",
+                (user_id, f'Calle {n}')).lastrowid
+            for fecha_inicio, fecha_fin in contratos:
+                conn.execute('''
+                    INSERT INTO contratos (user_id, propiedad_id, inquilino_id, fecha_inicio, fecha_fin, precio_mensual)
+                    VALUES (?, ?, ?, ?, ?, 100)
+                ''', (user_id, propiedad_id, inquilino_id, fecha_inicio, fecha_fin))
+        conn.commit()
+
+        stats = tareas.ejecutar_vencimientos(conn, tamano_lote=2, pausa=0, hoy=date(2024, 6, 1))
+        assert stats['lotes'] == 2
+        assert stats['contratos'] == 3
+        assert stats['propiedades'] == 2
+
+        uso = usage.get_usage(conn, user_id)
+        assert uso['contratos_activos'] == 1
+        assert uso['propiedades_disponibles'] == 2
+        assert usage.verify(conn) == []
+
+        # Otra ejecución dentro del intervalo no corre
+        assert tareas.ejecutar_vencimientos(conn, intervalo=3600, hoy=date(2024, 6, 1)) is None
+        ejecucion = tareas.ultimas(conn)[0]
+        assert ejecucion['contratos'] == 3 and ejecucion['error'] is None
+
+def test_contratos_solapados(app_temporal):
+    """No se pueden superponer contratos de una propiedad; la auditoría encuentra los heredados"""
+    import cuentas
+    import db
+    import migrations
+    import solapamientos
+
+    user_id = _crear_usuario(app_temporal, paquete_id=2)
+    with app_temporal.app_context():
+        conn = db.get_db()
+        propiedad_id = conn.execute(
+            "INSERT INTO propiedades (user_id, direccion, tipo, precio) VALUES (?, 'Calle 1', 'casa', 100)",
+            (user_id,)).lastrowid
+        inquilino_id = conn.execute(
+            "INSERT INTO inquilinos (user_id, nombre, apellido, dni) VALUES (?, 'Ana', 'Pérez', '1')",
+            (user_id,)).lastrowid
+        conn.commit()
+
+    client = _cliente(app_temporal, user_id)
+
+    def crear(inicio, fin):
+        return client.post('/contratos/nuevo', data={
+            'propiedad_id': propiedad_id, 'inquilino_id': inquilino_id,
+            'fecha_inicio': inicio, 'fecha_fin': fin, 'precio_mensual': '100',
+        }, follow_redirects=True).data.decode('utf-8')
+
+    assert 'Contrato creado' in crear('2023-01-01', '2023-12-31')
+    assert 'Contrato creado' in crear('2024-01-01', '2024-12-31')
+    assert 'se superpone' in crear('2023-06-01', '2023-07-31')
+    assert 'se superpone' in crear('2024-12-31', '2025-06-30')
+
+    # Editar el segundo para que empiece antes de que termine el primero: el
+    # control corre dentro de la transacción de escritura, que se deshace
+    consultas = []
+
+    def observador(conn, sql, params, segundos):
+        consultas.append(' '.join(sql.split()))
+
+    db.agregar_observador(observador)
+    try:
+        respuesta = client.post('/contratos/2/editar', data={
+            'fecha_inicio': '2023-12-01', 'fecha_fin': '2024-12-31', 'precio_mensual': '100', 'estado': 'activo',
+        })
+    finally:
+        db.quitar_observador(observador)
+    # Antes de la transacción solo se compara la versión del usuario de la sesión
+    assert consultas[:2] == [cuentas.VERSION_SQL, 'BEGIN IMMEDIATE']
+    assert any(sql.startswith('SELECT propiedad_id FROM contratos') for sql in consultas[2:])
+    assert 'se superpone' in client.get(respuesta.headers['Location']).data.decode('utf-8')
+    assert 'Contrato creado' in crear('2025-01-01', '2025-06-30')
+
+    with app_temporal.app_context():
+        conn = db.get_db()
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute("UPDATE contratos SET fecha_fin = '2024-02-01' WHERE id = 1")
+        conn.rollback()
+        # Un contrato cancelado no ocupa la propiedad
+        conn.execute("UPDATE contratos SET estado = 'cancelado' WHERE id = 2")
+        conn.execute("UPDATE contratos SET fecha_fin = '2024-02-01' WHERE id = 1")
+        conn.commit()
+        assert list(solapamientos.auditar(conn)) == []
+
+        # Superposición heredada (anterior a los triggers)
+        conn.execute('DROP TRIGGER contratos_solapamiento_upd')
+        conn.execute("UPDATE contratos SET estado = 'activo' WHERE id = 2")
+        conn.commit()
+        pares = [(a['id'], b['id']) for a, b in solapamientos.auditar(conn)]
+        assert pares == [(1, 2)]
+
+        # Dos búsquedas en el índice parcial: el contrato anterior más cercano y el siguiente
+        migraciones = {numero: func for numero, _, func in migrations.MIGRACIONES}
+        migraciones[13](conn)
+        conn.execute('''
+            INSERT INTO contratos (user_id, propiedad_id, inquilino_id, fecha_inicio, fecha_fin, precio_mensual)
+            VALUES (?, ?, ?, '2025-09-01', '2025-12-31', 100)
+        ''', (user_id, propiedad_id, inquilino_id))
+        conn.commit()
+        assert solapamientos.buscar_solapado(conn, propiedad_id, '2025-07-01', '2025-08-31') is None
+        assert solapamientos.buscar_solapado(conn, propiedad_id, '2025-06-30', '2025-08-31')['id'] == 3
+        assert solapamientos.buscar_solapado(conn, propiedad_id, '2025-07-01', '2025-09-01')['id'] == 4
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute('''
+                INSERT INTO contratos (user_id, propiedad_id, inquilino_id, fecha_inicio, fecha_fin, precio_mensual)
+                VALUES (?, ?, ?, '2025-07-01', '2025-09-15', 100)
+            ''', (user_id, propiedad_id, inquilino_id))
+        conn.rollback()
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + solapamientos.SOLAPADO_SQL, {
+            'propiedad_id': propiedad_id, 'inicio': '2025-07-01', 'fin': '2025-09-15', 'excluir': None,
+        })]
+        assert sum('COVERING INDEX idx_contratos_propiedad_vigentes' in detalle for detalle in plan) == 2
+
+def test_metricas(app_temporal, monkeypatch):
+    """/metrics es solo para admin y cuenta requests, consultas SQL y check_limits"""
+    import metricas
+
+    user_id = _crear_usuario(app_temporal, paquete_id=2)
+    client = _cliente(app_temporal, user_id)
+    assert client.get('/metrics').status_code == 302
+
+    assert client.get('/contratos').status_code == 200
+    client.post('/propiedades/nueva', data={'direccion': 'Calle 1', 'tipo': 'casa', 'precio': '100'})
+    consultas = metricas.SQL_CONSULTAS._valores[('contratos',)]
+    assert consultas >= 1
+    assert metricas.SQL_SEGUNDOS._valores[('contratos',)] > 0
+    assert metricas.EN_CURSO._valores[()] == 0
+
+    admin = _cliente(app_temporal, 1)
+    texto = admin.get('/metrics').get_data(as_text=True)
+    assert 'http_requests_total{endpoint="contratos",method="GET",status="200"}' in texto
+    assert 'http_request_duration_seconds_bucket{endpoint="contratos",le="+Inf"}' in texto
+    assert f'sql_queries_total{{endpoint="contratos"}} {consultas}' in texto
+    assert 'function_duration_seconds_count{funcion="check_limits"}' in texto
+    assert 'sqlite_pool_hits_total' in texto
+
+    # Un scraper sin sesión entra con el token
+    monkeypatch.setenv('METRICS_TOKEN', 'secreto')
+    scraper = app_temporal.test_client()
+    assert scraper.get('/metrics', headers={'Authorization': 'Bearer otro'}).status_code == 302
+    respuesta = scraper.get('/metrics', headers={'Authorization': 'Bearer secreto'})
+    assert respuesta.status_code == 200
+    assert respuesta.mimetype == 'text/plain'
+
+def test_consultas_lentas(app_temporal, tmp_path):
+    """Las sentencias sobre el umbral se registran con su forma, tipos y plan"""
+    import json
+    import time
+    import consultas_lentas
+    import db
+
+    assert consultas_lentas.normalizar(
+        "SELECT * FROM t WHERE a = 'x' AND b IN (?, ?,?) AND c = :c LIMIT 10"
+    ) == 'SELECT * FROM t WHERE a = ? AND b IN (?...) AND c = ? LIMIT ?'
+    assert consultas_lentas.redactar(('secreto', 3, None)) == ['str', 'int', 'NULL']
+    # Sin ruta configurada no se escribe ningún log
+    assert consultas_lentas.umbral_ms(app_temporal) == 0
+    assert consultas_lentas.resumen(app_temporal) == []
+
+    log = tmp_path / 'lentas.log'
+    app_temporal.config.update(SLOW_QUERY_MS=0.000001, SLOW_QUERY_LOG=str(log))
+    consultas_lentas.configurar(app_temporal)
+    assert consultas_lentas.umbral_ms(app_temporal) == 0.000001
+    try:
+        user_id = _crear_usuario(app_temporal, paquete_id=2)
+        assert _cliente(app_temporal, user_id).get('/contratos').status_code == 200
+
+        # Cada proceso escribe su propio archivo; el resumen lee los de todos
+        archivo = tmp_path / f'lentas.log.{os.getpid()}'
+        registros = [json.loads(linea) for linea in archivo.read_text(encoding='utf-8').splitlines()]
+        assert not log.exists()
+        otro = dict(registros[0], sql='SELECT otro_worker', endpoint='otro')
+        (tmp_path / 'lentas.log.1.1').write_text(json.dumps(otro) + '\n', encoding='utf-8')
+        (tmp_path / 'lentas.log.viejo').write_text('{}\n', encoding='utf-8')
+        assert all('prueba' not in json.dumps(r['params']) for r in registros)
+        contratos = [r for r in registros if r['endpoint'] == 'contratos' and 'JOIN propiedades' in r['sql']]
+        assert contratos and contratos[0]['plan']
+
+        formas = consultas_lentas.resumen(app_temporal, orden='cantidad')
+        assert formas[0]['cantidad'] >= formas[-1]['cantidad']
+        assert any('contratos' in forma['endpoints'] for forma in formas)
+        assert any(forma['sql'] == 'SELECT otro_worker' for forma in consultas_lentas.resumen(app_temporal, limite=200))
+        antiguo = time.time() - (consultas_lentas.RETENER_DIAS + 1) * 86400
+        os.utime(tmp_path / 'lentas.log.1.1', (antiguo, antiguo))
+        consultas_lentas.podar(str(log))
+        assert not (tmp_path / 'lentas.log.1.1').exists() and archivo.exists()
+
+        # Un cursor recolectado sin leerse hasta el final informa el tiempo,
+        # pero no se pide el plan sobre su conexión
+        conexiones = []
+
+        def observador(conn, sql, params, segundos):
+            conexiones.append(conn)
+
+        db.agregar_observador(observador)
+        try:
+            with app_temporal.app_context():
+                cursor = db.get_db().execute('SELECT id FROM usuarios WHERE id > ?', (0,))
+                assert cursor.fetchone() is not None
+                del cursor
+        finally:
+            db.quitar_observador(observador)
+        assert conexiones == [None]
+        registros = [json.loads(linea) for linea in archivo.read_text(encoding='utf-8').splitlines()]
+        assert registros[-1]['sql'] == 'SELECT id FROM usuarios WHERE id > ?' and registros[-1]['plan'] is None
+
+        respuesta = _cliente(app_temporal, 1).get('/admin/consultas-lentas')
+        assert respuesta.status_code == 200
+        assert b'JOIN propiedades' in respuesta.data
+        assert _cliente(app_temporal, user_id).get('/admin/consultas-lentas').status_code == 302
+    finally:
+        app_temporal.config.update(SLOW_QUERY_MS=consultas_lentas.DEFAULT_CONFIG['SLOW_QUERY_MS'],
+                                   SLOW_QUERY_LOG=consultas_lentas.DEFAULT_CONFIG['SLOW_QUERY_LOG'])
+        consultas_lentas.configurar(app_temporal)
+
+def test_benchmark(app_temporal, tmp_path):
+    """El generador es reproducible y llena los paquetes; la carga recorre todas las rutas"""
+    import claves
+    from benchmark import carga, datos
+
+    metodo = 'pbkdf2:sha256:1000'
+    bases = [str(tmp_path / f'bench{n}.db') for n in range(2)]
+    for base in bases:
+        totales = datos.generar(base, usuarios=4, semilla=7, metodo=metodo)
+    contenidos = []
+    for base in bases:
+        conn = sqlite3.connect(base)
+        contenidos.append([conn.execute(f'SELECT * FROM {tabla} ORDER BY id').fetchall()
+                           for tabla in ('propiedades', 'inquilinos', 'contratos')])
+        llenos = conn.execute('''
+            SELECT COUNT(*) FROM usuarios u JOIN paquetes p ON p.id = u.paquete_id
+            JOIN tenant_usage t ON t.user_id = u.id
+            WHERE u.username LIKE 'bench%' AND t.propiedades = p.max_propiedades
+              AND t.inquilinos = p.max_inquilinos AND t.contratos = p.max_contratos
+        ''').fetchone()[0]
+        conn.close()
+        assert llenos == 4
+    assert contenidos[0] == contenidos[1] and len(contenidos[0][2]) == totales['contratos']
+
+    app_temporal.config.update(PASSWORD_HASH_ITERATIONS=1000, PASSWORD_HASH_WORKERS=0)
+    claves.reset_hasher(app_temporal)
+    try:
+        resumen = carga.ejecutar(bases[0], hilos=2, iteraciones=1)
+    finally:
+        app_temporal.config.update(PASSWORD_HASH_ITERATIONS=claves.DEFAULT_CONFIG['PASSWORD_HASH_ITERATIONS'],
+                                   PASSWORD_HASH_WORKERS=claves.DEFAULT_CONFIG['PASSWORD_HASH_WORKERS'])
+        claves.reset_hasher(app_temporal)
+
+    assert resumen['fallas'] == [] and resumen['errores'] == 0
+    assert resumen['rutas']['POST /contratos/nuevo']['requests'] == 2
+    assert resumen['rutas']['GET /contratos']['consultas_por_request'] >= 1
+    assert 0 < resumen['rutas']['GET /']['p50_ms'] <= resumen['rutas']['GET /']['p99_ms']
+    assert carga.comparar(resumen, resumen)[0]['cambio_p95_pct'] == 0.0
+
+def test_shards(app_temporal, tmp_path):
+    """Con SHARDS_DIR cada usuario escribe en su propia base; el admin ve la suma de todas"""
+    import db
+    import shards
+
+    user_id = _crear_usuario(app_temporal, paquete_id=2)
+    with app_temporal.app_context():
+        conn = db.get_db()
+        conn.execute(
+            "INSERT INTO propiedades (user_id, direccion, tipo, precio) VALUES (?, 'Calle 1', 'casa', 100)",
+            (user_id,))
+        conn.commit()
+
+    carpeta = str(tmp_path / 'shards')
+    totales = shards.dividir(app_temporal.config['DATABASE'], carpeta, limpiar=True)
+    assert totales['propiedades'] == 1 and totales['salteados'] == []
+    assert shards.dividir(app_temporal.config['DATABASE'], carpeta)['salteados'] == [user_id]
+
+    app_temporal.config['SHARDS_DIR'] = carpeta
+    try:
+        client = _cliente(app_temporal, user_id)
+        respuesta = client.post('/propiedades/nueva', data={
+            'direccion': 'Calle 2', 'tipo': 'casa', 'habitaciones': '1', 'baños': '1', 'precio': '200',
+        }, follow_redirects=True)
+        assert 'Calle 1' in respuesta.data.decode('utf-8')
+
+        shard = sqlite3.connect(shards.ruta(carpeta, user_id))
+        assert shard.execute('SELECT COUNT(*) FROM propiedades').fetchone()[0] == 2
+        assert shard.execute('SELECT propiedades FROM tenant_usage').fetchone()[0] == 2
+        with pytest.raises(sqlite3.IntegrityError):
+            shard.execute("INSERT INTO propiedades (user_id, direccion, tipo, precio) VALUES (999, 'X', 'casa', 1)")
+        shard.close()
+        catalogo = sqlite3.connect(app_temporal.config['DATABASE'])
+        assert catalogo.execute('SELECT COUNT(*) FROM propiedades').fetchone()[0] == 0
+        catalogo.close()
+
+        admin = app_temporal.test_client()
+        with admin.session_transaction() as sess:
+            sess.update(user_id=1, username='admin', nombre='Admin', es_admin=1)
+        uso = admin.get('/admin/uso').get_json()
+        assert uso['modo'] == 'shards' and uso['totales']['propiedades'] == 2
+        assert uso['por_usuario'][-1]['bytes'] > 0
+        assert admin.get('/admin/db/pool').get_json()['shards']['shards'] >= 2
+    finally:
+        app_temporal.config['SHARDS_DIR'] = ''
+        shards.reset_router(app_temporal)
+
+def test_lectura_escritura(app_temporal, tmp_path):
+    """Los GET leen de conexiones de solo lectura; tras escribir, el usuario lee su escritura"""
+    import db
+
+    user_id = _crear_usuario(app_temporal, paquete_id=2)
+    client = _cliente(app_temporal, user_id)
+    escritura, lectura = db.get_pool(app_temporal), db.get_pool_lectura(app_temporal)
+
+    def usos(pool):
+        return pool.hits + pool.misses
+
+    antes = usos(lectura), usos(escritura)
+    assert client.get('/propiedades').status_code == 200
+    assert (usos(lectura), usos(escritura)) == (antes[0] + 1, antes[1])
+
+    respuesta = client.post('/propiedades/nueva', data={
+        'direccion': 'Calle 1', 'tipo': 'casa', 'habitaciones': '1', 'baños': '1', 'precio': '100',
+    })
+    assert respuesta.status_code == 302
+    with client.session_transaction() as sess:
+        assert sess[db.LEER_ESCRITURAS]
+    # El GET de la redirección lee de la conexión de escritura, y solo ese
+    antes = usos(lectura), usos(escritura)
+    assert 'Calle 1' in client.get(respuesta.location).data.decode('utf-8')
+    assert (usos(lectura), usos(escritura)) == (antes[0], antes[1] + 1)
+    client.get('/propiedades?estado=disponible')
+    assert usos(lectura) == antes[0] + 1
+
+    with app_temporal.test_request_context('/propiedades'):
+        with pytest.raises(sqlite3.OperationalError):
+            db.get_db().execute("UPDATE usuarios SET nombre = 'X'")
+        db.close_db()
+
+    # Dentro del proceso, una segunda transacción de escritura espera al lock del pool
+    pool = db.ConnectionPool(str(tmp_path / 'lock.db'), busy_timeout=50)
+    primera, segunda = pool.connect(), pool.connect()
+    primera.execute('CREATE TABLE t (x)')
+    primera.execute('BEGIN IMMEDIATE')
+    primera.execute('INSERT INTO t VALUES (1)')
+    with pytest.raises(sqlite3.OperationalError, match='locked'):
+        segunda.execute('INSERT INTO t VALUES (2)')
+    assert segunda.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+    primera.commit()
+    segunda.execute('INSERT INTO t VALUES (2)')
+    segunda.rollback()
+    primera.execute('INSERT INTO t VALUES (3)')
+    primera.commit()
+    assert segunda.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 2
+    primera.close()
+    segunda.close()
+
+def test_asgi(app_temporal):
+    """El adaptador ASGI sirve las rutas de app.py; un cliente lento no ocupa threads"""
+    import asyncio
+    import asgi
+
+    user_id = _crear_usuario(app_temporal, paquete_id=2)
+    cookie = app_temporal.session_interface.get_signing_serializer(app_temporal).dumps(
+        {'user_id': user_id, 'username': 'prueba', 'nombre': 'Prueba', 'es_admin': 0})
+    adaptador = asgi.AdaptadorWSGI(app_temporal, hilos=2, max_body=1000)
+
+    async def pedir(metodo, path, body=b'', receive=None):
+        scope = {
+            'type': 'http', 'method': metodo, 'path': path, 'query_string': b'', 'http_version': '1.1',
+            'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+            'headers': [(b'cookie', f'session={cookie}'.encode()),
+                        (b'content-type', b'application/x-www-form-urlencoded')],
+        }
+
+        async def receive_completo():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        mensajes = []
+
+        async def send(mensaje):
+            mensajes.append(mensaje)
+
+        await adaptador(scope, receive or receive_completo, send)
+        return mensajes[0]['status'], b''.join(m.get('body', b'') for m in mensajes[1:]), len(mensajes)
+
+    async def probar():
+        status, _, _ = await pedir('POST', '/propiedades/nueva',
+                                   'direccion=Calle+1&tipo=casa&habitaciones=1&ba%C3%B1os=1&precio=100'.encode())
+        assert status == 302
+        status, contenido, _ = await pedir('GET', '/propiedades')
+        assert status == 200 and 'Calle 1' in contenido.decode('utf-8')
+
+        # La exportación se genera de a bloques, en threads del executor, con su contexto
+        status, contenido, mensajes = await pedir('GET', '/propiedades/exportar')
+        assert status == 200 and b'Calle 1' in contenido and mensajes > 2
+
+        assert (await pedir('POST', '/propiedades/nueva', b'x' * 2000))[0] == 413
+
+        # Más uploads colgados que threads: los GET se siguen atendiendo
+        liberar = asyncio.Event()
+
+        async def receive_lento():
+            await liberar.wait()
+            return {'type': 'http.request', 'body': b'q=a', 'more_body': False}
+
+        colgados = [asyncio.ensure_future(pedir('POST', '/propiedades/nueva', receive=receive_lento))
+                    for _ in range(5)]
+        rapidos = await asyncio.wait_for(asyncio.gather(*[pedir('GET', '/') for _ in range(10)]), 30)
+        assert [status for status, _, _ in rapidos] == [200] * 10
+        assert not any(tarea.done() for tarea in colgados)
+        liberar.set()
+        await asyncio.wait_for(asyncio.gather(*colgados), 30)
+
+        # Websockets: se rechazan después de recibir el connect; otro tipo es un error
+        recibidos, enviados = [{'type': 'websocket.connect'}], []
+
+        async def receive_ws():
+            return recibidos.pop(0)
+
+        async def send_ws(mensaje):
+            enviados.append(mensaje)
+
+        await adaptador({'type': 'websocket', 'path': '/'}, receive_ws, send_ws)
+        assert not recibidos and enviados == [{'type': 'websocket.close', 'code': 1000}]
+        with pytest.raises(ValueError):
+            await adaptador({'type': 'otro'}, receive_ws, send_ws)
+
+        # Si la app falla, el body del request se cierra igual
+        bodies = []
+
+        def falla(environ, start_response):
+            assert environ['wsgi.multiprocess'] is False
+            bodies.append(environ['wsgi.input'])
+            raise RuntimeError('falla')
+
+        async def receive_vacio():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        con_error = asgi.AdaptadorWSGI(falla, hilos=1)
+        try:
+            with pytest.raises(RuntimeError):
+                await con_error(
+                    {'type': 'http', 'method': 'GET', 'path': '/', 'headers': []}, receive_vacio, send_ws)
+        finally:
+            con_error.executor.shutdown()
+        assert bodies and bodies[0].closed
+
+    try:
+        asyncio.run(probar())
+    finally:
+        adaptador.executor.shutdown()
+
+def test_informes(app_temporal):
+    """renta_mensual sigue las altas, ediciones y bajas de contratos y coincide con rebuild()"""
+    import db
+    import informes
+
+    user_id = _crear_usuario(app_temporal, paquete_id=2)
+    with app_temporal.app_context():
+        conn = db.get_db()
+        propiedad_id = conn.execute(
+            "INSERT INTO propiedades (user_id, direccion, tipo, precio) VALUES (?, 'Calle 1', 'casa', 100)",
+            (user_id,)).lastrowid
+        conn.execute("INSERT INTO propiedades (user_id, direccion, tipo, precio) VALUES (?, 'Calle 2', 'casa', 100)",
+                     (user_id,))
+        inquilino_id = conn.execute(
+            "INSERT INTO inquilinos (user_id, nombre, apellido, dni) VALUES (?, 'Ana', 'Pérez', '1')",
+            (user_id,)).lastrowid
+        conn.commit()
+
+    client = _cliente(app_temporal, user_id)
+    client.post('/contratos/nuevo', data={
+        'propiedad_id': propiedad_id, 'inquilino_id': inquilino_id,
+        'fecha_inicio': '2024-01-15', 'fecha_fin': '2024-03-14', 'precio_mensual': '3100',
+    })
+
+    def meses():
+        datos = client.get('/informes/mensual?desde=2023-12&hasta=2024-04').get_json()
+        return {mes['mes']: mes for mes in datos['meses']}
+
+    por_mes = meses()
+    assert list(por_mes) == ['2023-12', '2024-01', '2024-02', '2024-03', '2024-04']
+    assert por_mes['2023-12']['contratos'] == 0
+    assert (por_mes['2024-01']['dias_ocupados'], por_mes['2024-01']['ingreso_esperado']) == (17, 1700.0)
+    assert por_mes['2024-02']['ingreso_esperado'] == 3100.0 and por_mes['2024-02']['ocupacion'] == 0.5
+    assert por_mes['2024-03']['ingreso_esperado'] == 1400.0 and por_mes['2024-03']['ingreso_que_vence'] == 3100.0
+
+    vacancia = client.get('/informes/vacancia?desde=2024-02&hasta=2024-02').get_json()
+    assert [(p['direccion'], p['dias_vacantes']) for p in vacancia['propiedades']] == [('Calle 2', 29), ('Calle 1', 0)]
+
+    client.post('/contratos/1/editar', data={
+        'fecha_inicio': '2024-01-15', 'fecha_fin': '2024-02-14', 'precio_mensual': '3100', 'estado': 'activo',
+    })
+    por_mes = meses()
+    assert por_mes['2024-02']['ingreso_que_vence'] == 3100.0 and por_mes['2024-03']['contratos'] == 0
+    assert 'Ingresos y Ocupación' in client.get('/').data.decode('utf-8')
+
+    with app_temporal.app_context():
+        conn = db.get_db()
+        assert informes.verify(conn) == []
+        conn.execute("UPDATE contratos SET estado = 'cancelado'")
+        conn.commit()
+        assert conn.execute('SELECT COUNT(*) FROM renta_mensual').fetchone()[0] == 0
+        conn.execute("UPDATE contratos SET estado = 'vencido'")
+        conn.execute('UPDATE renta_mensual SET ingreso = 0')
+        assert len(informes.verify(conn)) == 2
+        informes.rebuild(conn)
+        conn.commit()
+        assert informes.verify(conn) == []
+        conn.execute('DELETE FROM contratos')
+        conn.commit()
+        assert conn.execute('SELECT COUNT(*) FROM renta_mensual').fetchone()[0] == 0
+
+def test_fragmentos(app_temporal, tmp_path):
+    """Los bloques del dashboard y las tablas salen de la caché hasta que el usuario escribe"""
+    import condicional
+    import cuentas
+    import db
+    import fragmentos
+
+    user_id = _crear_usuario(app_temporal, paquete_id=2)
+    client, otra_sesion = _cliente(app_temporal, user_id), _cliente(app_temporal, user_id)
+    consultas = []
+
+    def observador(conn, sql, params, segundos):
+        consultas.append(sql)
+
+    db.agregar_observador(observador)
+    try:
+        assert 'No hay propiedades registradas' in client.get('/').data.decode('utf-8')
+        assert client.get('/propiedades').status_code == 200
+        assert consultas
+        # La segunda vez todos los bloques son aciertos: solo se leen la versión
+        # del usuario y la marca de tenant_usage, una vez por request (la marca
+        # la comparten la versión de los fragmentos y el ETag)
+        del consultas[:]
+        assert 'No hay propiedades registradas' in client.get('/').data.decode('utf-8')
+        assert client.get('/propiedades').status_code == 200
+        assert consultas == [cuentas.VERSION_SQL, condicional.MARCA_SQL] * 2
+        assert client.get('/propiedades?estado=alquilada').status_code == 200
+        assert consultas
+    finally:
+        db.quitar_observador(observador)
+
+    # Una escritura cambia la versión del usuario, también para sus otras sesiones
+    client.post('/propiedades/nueva', data={
+        'direccion': 'Calle 1', 'tipo': 'casa', 'habitaciones': '1', 'baños': '1', 'precio': '100',
+    })
+    assert 'Calle 1' in client.get('/').data.decode('utf-8')
+    assert 'Calle 1' in otra_sesion.get('/propiedades').data.decode('utf-8')
+
+    # Los cambios hechos fuera de un request (flask vencer-contratos, scripts)
+    # suben la marca de tenant_usage y se ven enseguida, en todas las sesiones
+    with app_temporal.app_context():
+        conn = db.get_db()
+        conn.execute("UPDATE propiedades SET direccion = 'Calle 2'")
+        conn.commit()
+    assert 'Calle 2' in client.get('/').data.decode('utf-8')
+    assert 'Calle 2' in otra_sesion.get('/propiedades').data.decode('utf-8')
+
+    # invalidar() renueva los bloques aunque los datos no hayan cambiado
+    fallos = fragmentos.stats(app_temporal)['fragmentos']['dashboard_estadisticas']['misses']
+    client.get('/')
+    assert fragmentos.stats(app_temporal)['fragmentos']['dashboard_estadisticas']['misses'] == fallos
+    fragmentos.invalidar(user_id, app_temporal)
+    client.get('/')
+    assert fragmentos.stats(app_temporal)['fragmentos']['dashboard_estadisticas']['misses'] == fallos + 1
+    stats = fragmentos.stats(app_temporal)
+    assert stats['fragmentos']['dashboard_estadisticas']['hits'] >= 2
+    assert 0 < stats['fragmentos']['tabla_propiedades']['hit_ratio'] < 1
+    assert stats['cache']['backend'] == 'memoria' and stats['cache']['entradas'] > 0
+
+    # La LRU en memoria respeta el tamaño máximo
+    memoria = fragmentos.Memoria(max_bytes=100, ttl=60)
+    for clave in 'abc':
+        memoria.set(clave, clave * 40)
+    assert memoria.get('a') is None and memoria.get('c') == 'c' * 40
+    assert memoria.stats()['bytes'] <= 100 and memoria.stats()['desalojos'] == 1
+
+    # Con archivos, los procesos comparten entradas y versiones
+    uno = fragmentos.Archivos(str(tmp_path / 'fragmentos'), max_bytes=100, ttl=60)
+    dos = fragmentos.Archivos(str(tmp_path / 'fragmentos'), max_bytes=100, ttl=60)
+    uno.set('clave', 'ñandú')
+    assert dos.get('clave') == 'ñandú' and dos.get('otra') is None
+    dos.incrementar(user_id)
+    assert uno.version(user_id) == dos.version(user_id) != '0'
+    for clave in 'abc':
+        uno.set(clave, clave * 40)
+    dos.podar()
+    assert dos.stats()['bytes'] <= 100
+
+    # La app con el backend de archivos
+    app_temporal.config.update(FRAGMENTOS_BACKEND='archivos', FRAGMENTOS_DIR=str(tmp_path / 'app'))
+    fragmentos.reset_cache(app_temporal)
+    try:
+        assert 'Calle 2' in client.get('/').data.decode('utf-8')
+        client.post('/propiedades/nueva', data={
+            'direccion': 'Calle 3', 'tipo': 'casa', 'habitaciones': '1', 'baños': '1', 'precio': '100',
+        })
+        assert 'Calle 3' in otra_sesion.get('/').data.decode('utf-8')
+        assert len(os.listdir(tmp_path / 'app' / 'f')) >= 6
+    finally:
+        app_temporal.config.update(FRAGMENTOS_BACKEND='memoria', FRAGMENTOS_DIR='')
+
+def test_get_condicional(app_temporal):
+    """Listados y API responden 304 con la marca de tenant_usage, sin leer filas"""
+    import condicional
+    import cuentas
+    import db
+    import usage
+
+    user_id = _crear_usuario(app_temporal, paquete_id=2)
+    client = _cliente(app_temporal, user_id)
+    client.post('/propiedades/nueva', data={
+        'direccion': 'Calle 1', 'tipo': 'casa', 'habitaciones': '1', 'baños': '1', 'precio': '100',
+    })
+    client.get('/propiedades')  # consume el mensaje flash del alta
+
+    respuesta = client.get('/propiedades')
+    etag = respuesta.headers['ETag']
+    assert respuesta.status_code == 200 and etag.startswith('W/')
+    assert 'private' in respuesta.headers['Cache-Control'] and respuesta.last_modified
+
+    consultas = []
+
+    def observador(conn, sql, params, segundos):
+        consultas.append(sql)
+
+    db.agregar_observador(observador)
+    try:
+        respuesta = client.get('/propiedades', headers={'If-None-Match': etag})
+    finally:
+        db.quitar_observador(observador)
+    assert respuesta.status_code == 304 and respuesta.data == b''
+    assert consultas == [cuentas.VERSION_SQL, condicional.MARCA_SQL]
+    assert client.get('/propiedades?estado=alquilada', headers={'If-None-Match': etag}).status_code == 200
+    ultima = client.get('/propiedades').headers['Last-Modified']
+    assert client.get('/propiedades', headers={'If-Modified-Since': ultima}).status_code == 304
+
+    # API: listado, detalle y 404
+    datos = client.get('/api/propiedades').get_json()
+    assert [fila['direccion'] for fila in datos['datos']] == ['Calle 1'] and datos['siguiente'] is None
+    propiedad_id = datos['datos'][0]['id']
+    respuesta = client.get(f'/api/propiedades/{propiedad_id}')
+    assert respuesta.get_json()['precio'] == 100
+    assert client.get(f'/api/propiedades/{propiedad_id}',
+                      headers={'If-None-Match': respuesta.headers['ETag']}).status_code == 304
+    assert client.get('/api/propiedades/999').status_code == 404
+    assert client.get('/api/contratos').get_json()['datos'] == []
+
+    # Una edición (también de otra tabla) cambia la marca
+    client.post('/inquilinos/nuevo', data={'nombre': 'Ana', 'apellido': 'Pérez', 'email': '', 'telefono': '', 'dni': '1'})
+    with client.session_transaction() as sess:
+        sess.pop('_flashes', None)
+    respuesta = client.get('/propiedades', headers={'If-None-Match': etag})
+    assert respuesta.status_code == 200 and respuesta.headers['ETag'] != etag
+    # Con mensajes flash pendientes no hay ETag
+    client.post(f'/propiedades/{propiedad_id}/eliminar')
+    respuesta = client.get('/propiedades')
+    assert 'ETag' not in respuesta.headers and 'Propiedad eliminada' in respuesta.data.decode('utf-8')
+
+    # rebuild() de los contadores conserva la marca
+    with app_temporal.app_context():
+        conn = db.get_db()
+        antes = conn.execute('SELECT cambios, modificado FROM tenant_usage WHERE user_id = ?', (user_id,)).fetchone()
+        assert antes['cambios'] == 3
+        usage.rebuild(conn)
+        conn.commit()
+        assert tuple(conn.execute('SELECT cambios, modificado FROM tenant_usage WHERE user_id = ?',
+                                  (user_id,)).fetchone()) == tuple(antes)
+        assert usage.get_usage(conn, user_id)['inquilinos'] == 1 and usage.verify(conn) == []
+
+def test_activos(app_temporal, tmp_path):
+    """Paquetes CSS/JS purgados, con hash, comprimidos y servidos con caché inmutable"""
+    import asyncio
+    import gzip
+    import json
+    import shutil
+
+    import activos
+    import asgi
+
+    static = tmp_path / 'static'
+    shutil.copytree(app_temporal.static_folder, static, ignore=shutil.ignore_patterns('dist', 'vendor'))
+    (static / 'vendor' / 'fonts').mkdir(parents=True)
+    (static / 'vendor' / 'bootstrap.min.css').write_text(
+        '/*! Bootstrap */:root{--bs-blue:#0d6efd}.btn{display:inline-block}.carousel{position:relative}'
+        '.show{opacity:1}a:not(.carousel){color:red}@media (min-width:768px){.col-md-3{flex:0 0 auto}'
+        '.offcanvas-md{position:fixed}}.text-success{color:green}.bg-nada{color:red}'
+        '.content::after{content:".carousel{"}')
+    (static / 'vendor' / 'bootstrap-icons.css').write_text(
+        '@charset "UTF-8";@font-face{font-family:"bootstrap-icons";'
+        'src:url("./fonts/bootstrap-icons.woff2?1") format("woff2")}.bi-house-door::before{content:"\\f425"}'
+        '.bi-nada::before{content:"\\f000"}')
+    (static / 'vendor' / 'fonts' / 'bootstrap-icons.woff2').write_bytes(b'woff2')
+    (static / 'vendor' / 'fonts' / 'bootstrap-icons.woff').write_bytes(b'woff')
+    (static / 'vendor' / 'bootstrap.bundle.min.js').write_text('el.classList.add("show");')
+    dist = tmp_path / 'dist'
+
+    fuentes = [os.path.join(app_temporal.root_path, 'templates', 'index.html')]
+    resumen = activos.construir(str(static), fuentes, destino=str(dist))
+    manifiesto = json.loads((dist / 'manifest.json').read_text())
+    assert set(manifiesto) == set(activos.PAQUETES)
+    nombre = manifiesto['app.css']
+    assert nombre.startswith('app.') and nombre == resumen['app.css']['archivo']
+    css = (dist / nombre).read_text()
+    assert '.btn{' in css and '.show{' in css and '.text-success' in css and '.col-md-3' in css
+    assert '.carousel{position' not in css and '.offcanvas-md' not in css and '.bg-nada' not in css
+    assert 'a:not(.carousel)' in css and 'content:".carousel{"' in css and '/*' not in css
+    assert '.bi-house-door' in css and '.bi-nada' not in css and '@charset' not in css
+    fuente = [archivo for archivo in os.listdir(dist) if archivo.endswith('.woff2')]
+    assert fuente and f'url("{fuente[0]}")' in css
+    assert gzip.decompress((dist / (nombre + '.gz')).read_bytes()).decode('utf-8') == css
+    js = (dist / manifiesto['app.js']).read_text()
+    assert js.startswith('el.classList.add("show");') and '// Initialize' not in js
+    assert resumen['app.js']['bytes'] < resumen['app.js']['original']
+
+    # Un build igual da los mismos nombres; --limpiar borra lo que no está en el manifiesto
+    (dist / 'app.viejo.css').write_text('x')
+    assert activos.construir(str(static), fuentes, destino=str(dist), limpiar=True) == resumen
+    assert not (dist / 'app.viejo.css').exists()
+
+    user_id = _crear_usuario(app_temporal)
+    client = _cliente(app_temporal, user_id)
+    # Sin build, las páginas usan los archivos sueltos
+    assert 'cdn.jsdelivr.net/npm/bootstrap@' in client.get('/login').data.decode('utf-8')
+
+    # En producción (sin debug ni tests), la falta del build es un error
+    app_temporal.config.update(TESTING=False, ACTIVOS_DIR=str(tmp_path / 'sin_build'))
     try:
-        from app import app, init_db
-        
-        # Inicializar la base de datos
-        init_db()
-        print("✅ Aplicación Flask creada correctamente")
-        print("✅ Base de datos inicializada")
-        return True
-        
+        with pytest.raises(RuntimeError, match='construir-activos'):
+            activos.verificar(app_temporal)
+        # El modo ASGI tampoco arranca: el lifespan informa el error
+        adaptador = asgi.crear(app_temporal)
+        mensajes = [{'type': 'lifespan.startup'}]
+        enviados = []
+
+        async def receive():
+            return mensajes.pop(0)
+
+        async def send(mensaje):
+            enviados.append(mensaje)
+
+        try:
+            asyncio.run(adaptador({'type': 'lifespan'}, receive, send))
+        finally:
+            adaptador.executor.shutdown()
+        assert enviados[0]['type'] == 'lifespan.startup.failed' and 'construir-activos' in enviados[0]['message']
+        app_temporal.config['ACTIVOS_CDN'] = 1
+        activos.verificar(app_temporal)
+        app_temporal.config.update(ACTIVOS_CDN=0, ACTIVOS_DIR=str(dist))
+        activos.verificar(app_temporal)
+    finally:
+        app_temporal.config.update(TESTING=True, ACTIVOS_CDN=0)
+        app_temporal.config.pop('ACTIVOS_DIR')
+        activos.reset(app_temporal)
+
+    app_temporal.config['ACTIVOS_DIR'] = str(dist)
+    try:
+        pagina = client.get('/').data.decode('utf-8')
+        assert f'/activos/{nombre}' in pagina and 'cdn.jsdelivr' not in pagina and 'moment' not in pagina
+
+        respuesta = client.get(f'/activos/{nombre}', headers={'Accept-Encoding': 'gzip, deflate'})
+        assert respuesta.status_code == 200 and respuesta.headers['Content-Encoding'] == 'gzip'
+        assert respuesta.mimetype == 'text/css' and gzip.decompress(respuesta.data).decode('utf-8') == css
+        assert 'immutable' in respuesta.headers['Cache-Control'] and 'public' in respuesta.headers['Cache-Control']
+        assert 'Accept-Encoding' in respuesta.headers['Vary']
+        respuesta = client.get(f'/activos/{nombre}')
+        assert 'Content-Encoding' not in respuesta.headers and respuesta.data.decode('utf-8') == css
+        assert client.get('/activos/app.000000000000.css').status_code == 404
+    finally:
+        app_temporal.config.pop('ACTIVOS_DIR')
+        activos.reset(app_temporal)
+
+def test_compresion_streaming(app_temporal):
+    """Respuestas gzip según Accept-Encoding y listados enviados con stream_template"""
+    import gzip
+    import zlib
+
+    import compresion
+    import db
+    import listados
+
+    user_id = _crear_usuario(app_temporal, paquete_id=2)
+    with app_temporal.app_context():
+        conn = db.get_db()
+        conn.executemany('''
+            INSERT INTO propiedades (user_id, direccion, tipo, habitaciones, baños, precio)
+            VALUES (?, ?, 'casa', 1, 1, 100)
+        ''', [(user_id, f'Calle {i}') for i in range(30)])
+        conn.commit()
+    client = _cliente(app_temporal, user_id)
+    compresion.CONTADORES.reset()
+
+    plano = client.get('/propiedades?por_pagina=10')
+    assert 'Content-Encoding' not in plano.headers and 'Accept-Encoding' in plano.headers['Vary']
+    respuesta = client.get('/propiedades?por_pagina=10', headers={'Accept-Encoding': 'gzip'})
+    assert respuesta.headers['Content-Encoding'] == 'gzip' and 'Content-Length' not in respuesta.headers
+    assert gzip.decompress(respuesta.data) == plano.data and len(respuesta.data) < len(plano.data) / 3
+    assert respuesta.headers['ETag'] == plano.headers['ETag']
+    assert compresion.stats()['gzip']['original'] == len(plano.data)
+    # gzip;q=0, respuestas chicas y tipos binarios no se comprimen
+    assert 'Content-Encoding' not in client.get('/propiedades', headers={'Accept-Encoding': 'gzip;q=0'}).headers
+    assert 'Content-Encoding' not in client.get('/api/propiedades/999', headers={'Accept-Encoding': 'gzip'}).headers
+    xlsx = client.get('/propiedades/exportar?formato=xlsx', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in xlsx.headers and xlsx.data[:2] == b'PK'
+    csv = client.get('/propiedades/exportar?formato=csv', headers={'Accept-Encoding': 'gzip'})
+    assert csv.headers['Content-Encoding'] == 'gzip' and 'Calle 29' in gzip.decompress(csv.data).decode('utf-8-sig')
+
+    app_temporal.config['LISTADO_STREAMING'] = True
+    try:
+        respuesta = client.get('/propiedades?por_pagina=10', buffered=False)
+        assert respuesta.is_streamed and 'Content-Length' not in respuesta.headers
+        trozos = list(respuesta.response)
+        respuesta.close()
+        assert len(trozos) > 1 and b''.join(trozos) == plano.data
+        # Las páginas siguientes y anteriores salen igual que sin streaming
+        pagina = client.get('/propiedades?por_pagina=10').data.decode('utf-8')
+        siguiente = pagina.split('despues=')[1].split('&')[0].split('"')[0]
+        assert 'Calle 29' in pagina and 'Calle 19' not in pagina
+        pagina = client.get(f'/propiedades?por_pagina=10&despues={siguiente}').data.decode('utf-8')
+        assert 'Calle 19' in pagina and 'Calle 10' in pagina and 'Calle 9<' not in pagina and 'antes=' in pagina
+        respuesta = client.get('/propiedades?por_pagina=10', headers={'Accept-Encoding': 'gzip'})
+        assert gzip.decompress(respuesta.data) == plano.data
+
+        # El encabezado sale comprimido antes de consultar la tabla (página fuera de la caché)
+        consultas = []
+
+        def observador(conn, sql, params, segundos):
+            consultas.append(sql)
+
+        db.agregar_observador(observador)
+        try:
+            respuesta = client.get('/propiedades?por_pagina=7', headers={'Accept-Encoding': 'gzip'},
+                                   buffered=False)
+            trozos = iter(respuesta.response)
+            descompresor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            primero = descompresor.decompress(next(trozos)).decode('utf-8')
+            assert '<nav' in primero and 'Calle' not in primero
+            assert not any('FROM propiedades' in sql for sql in consultas)
+            resto = descompresor.decompress(b''.join(trozos)).decode('utf-8')
+            respuesta.close()
+            assert 'Calle 29' in resto and any('FROM propiedades' in sql for sql in consultas)
+        finally:
+            db.quitar_observador(observador)
+    finally:
+        app_temporal.config['LISTADO_STREAMING'] = False
+
+    # La página sobre el cursor: filas a medida que se recorren y siguiente al final
+    with app_temporal.app_context():
+        sql, params = listados.consulta_propiedades(user_id, {})
+        pagina = listados.paginar_cursor(db.get_db(), sql, params, 25)
+        assert pagina and pagina.anterior is None
+        assert [row['direccion'] for row in pagina][:2] == ['Calle 29', 'Calle 28']
+        assert len(pagina) == 25 and pagina.siguiente is not None
+        with pytest.raises(RuntimeError):
+            list(pagina)
+        resto = listados.paginar_cursor(db.get_db(), sql, params, 25, despues=pagina.siguiente)
+        assert len(resto) == 5 and resto.siguiente is None and resto.anterior is not None
+
+def test_consola_usuarios(app_temporal):
+    """Consola de usuarios: orden y páginas sobre tenant_usage y acciones masivas en una transacción"""
+    import consola
+    import cuentas
+    import db
+
+    with app_temporal.app_context():
+        conn = db.get_db()
+        conn.executemany('''
+            INSERT INTO usuarios (username, email, password_hash, nombre, apellido, paquete_id, ultimo_acceso)
+            VALUES (?, ?, 'x', 'Nombre', ?, 1, ?)
+        ''', [(f'u{i:02d}', f'u{i:02d}@example.com', f'Apellido{i}', None if i % 2 else '2020-01-01 00:00:00')
+              for i in range(12)])
+        ids = {row['username']: row['id'] for row in conn.execute('SELECT id, username FROM usuarios')}
+        conn.executemany('UPDATE tenant_usage SET propiedades = ?, inquilinos = ?, contratos_activos = ? WHERE user_id = ?',
+                         [(6, 0, 2, ids['u03']), (1, 9, 0, ids['u07'])])
+        conn.commit()
+
+        # Orden por uso (el límite más usado del paquete) y páginas en los dos sentidos
+        pagina = consola.paginar(conn, {}, 'uso', True, 5)
+        assert [row['username'] for row in pagina][:2] == ['u03', 'u07'] and pagina.siguiente
+        assert pagina.items[0]['uso'] == 1.2 and pagina.anterior is None
+        pagina = consola.paginar(conn, {}, 'usuario', False, 5)
+        assert [row['username'] for row in pagina] == ['admin', 'u00', 'u01', 'u02', 'u03']
+        siguiente = consola.paginar(conn, {}, 'usuario', False, 5, despues=pagina.siguiente)
+        assert [row['username'] for row in siguiente] == ['u04', 'u05', 'u06', 'u07', 'u08']
+        anterior = consola.paginar(conn, {}, 'usuario', False, 5, antes=siguiente.anterior)
+        assert [row['username'] for row in anterior] == [row['username'] for row in pagina]
+        assert anterior.anterior is None and anterior.siguiente
+        assert [row['username'] for row in consola.paginar(conn, {'uso_min': 80}, 'uso', True, 50)] == ['u03', 'u07']
+        assert len(consola.paginar(conn, {'sin_acceso': 30, 'q': 'u'}, 'usuario', False, 50)) == 12
+        assert len(consola.paginar(conn, {'q': 'u1'}, 'usuario', False, 50)) == 2
+        assert consola.resumen(conn) == {'usuarios': 13, 'activos': 13, 'cerca_del_limite': 2, 'sin_acceso_90': 13}
+
+        # Con shards, la consola lee la copia de uso_shards
+        assert consola.sincronizar(conn, [(ids['u03'], conn), (ids['u07'], conn)]) == 2
+        fila = consola.paginar(conn, {}, 'contratos', True, 1, con_shards=True).items[0]
+        assert fila['username'] == 'u03' and fila['contratos_activos'] == 2 and fila['uso_actualizado']
+        assert consola.paginar(conn, {}, 'uso', True, 1, con_shards=True).items[0]['uso'] == 1.2
+        assert len(consola.paginar(conn, {}, 'usuario', False, 50, con_shards=True)) == 13
+
+        # El uso es una columna que los triggers siguen: cambios de datos, de
+        # paquete y de límites; los usuarios nuevos tienen su fila desde el alta
+        uso = 'SELECT uso FROM tenant_usage WHERE user_id = ?'
+        conn.execute("INSERT INTO inquilinos (user_id, nombre, apellido) VALUES (?, 'Ana', 'Pérez')", (ids['u07'],))
+        assert conn.execute(uso, (ids['u07'],)).fetchone()[0] == 1.0
+        conn.execute('UPDATE usuarios SET paquete_id = 2 WHERE id = ?', (ids['u07'],))
+        assert conn.execute(uso, (ids['u07'],)).fetchone()[0] == 0.2
+        conn.execute('UPDATE paquetes SET max_inquilinos = max_inquilinos * 2 WHERE id = 2')
+        assert conn.execute(uso, (ids['u07'],)).fetchone()[0] == 0.1
+        conn.rollback()
+        nuevo = conn.execute("INSERT INTO usuarios (username, email, password_hash, nombre, apellido) "
+                             "VALUES ('u99', 'u99@x', 'x', 'N', 'A')").lastrowid
+        assert conn.execute(uso, (nuevo,)).fetchone()[0] == 0
+        conn.rollback()
+
+    admin = _cliente(app_temporal, 1)
+    pagina = admin.get('/admin/usuarios?por_pagina=5').data.decode('utf-8')
+    assert pagina.index('u03') < pagina.index('u07') and 'u08' not in pagina and 'despues=' in pagina
+    assert 'u08' in admin.get('/admin/usuarios?orden=usuario&dir=desc').data.decode('utf-8')
+    usuario = _cliente(app_temporal, ids['u00'])
+    assert usuario.get('/admin/usuarios').status_code == 302
+    assert usuario.post('/admin/usuarios/acciones', data={'accion': 'desactivar', 'ids': [ids['u01']]}).status_code == 302
+
+    with app_temporal.app_context():
+        assert cuentas.get_usuario(db.get_db, ids['u03'])['max_propiedades'] == 5
+    respuesta = admin.post('/admin/usuarios/acciones', data={
+        'accion': 'paquete', 'paquete_id': 2, 'ids': [ids['u03'], ids['u07']], 'volver': '/admin/usuarios?orden=uso',
+    })
+    assert respuesta.status_code == 302 and respuesta.headers['Location'].endswith('/admin/usuarios?orden=uso')
+    with app_temporal.app_context():
+        # La caché de cuentas se invalidó: los nuevos límites rigen enseguida
+        assert cuentas.get_usuario(db.get_db, ids['u03'])['max_propiedades'] == 20
+    assert 'Paquete cambiado a 2 usuarios.' in admin.get('/admin/usuarios').data.decode('utf-8')
+    admin.post('/admin/usuarios/acciones', data={'accion': 'paquete', 'paquete_id': 1, 'ids': [ids['u03']]})
+    assert '1 usan más de lo que permite' in admin.get('/admin/usuarios').data.decode('utf-8')
+
+    # Un paquete inexistente no cambia nada; el admin no se desactiva a sí mismo
+    admin.post('/admin/usuarios/acciones', data={'accion': 'paquete', 'paquete_id': 99, 'ids': [ids['u00']]})
+    admin.post('/admin/usuarios/acciones', data={'accion': 'desactivar', 'ids': [1, ids['u00'], ids['u01']]})
+    assert '2 usuarios desactivados.' in admin.get('/admin/usuarios').data.decode('utf-8')
+    with app_temporal.app_context():
+        activos = dict(db.get_db().execute(
+            'SELECT username, activo FROM usuarios WHERE username IN (?, ?, ?)', ('admin', 'u00', 'u01')).fetchall())
+        paquete = db.get_db().execute('SELECT paquete_id FROM usuarios WHERE id = ?', (ids['u00'],)).fetchone()[0]
+    assert activos == {'admin': 1, 'u00': 0, 'u01': 0} and paquete == 1
+    # Un usuario desactivado pierde la sesión en su próximo request
+    assert usuario.get('/propiedades').status_code == 302
+
+def _ejecutar(prueba, *args):
+    """Correr una prueba fuera de pytest: True si pasa, False (con el error) si falla"""
+    try:
+        prueba(*args)
     except Exception as e:
-        print(f"❌ Error al crear la aplicación Flask: {e}")
+        print(f"❌ {prueba.__name__}: {e!r}")
         return False
+    return True
 
 def main():
     """Función principal de prueba"""
@@ -70,10 +1523,11 @@ def main():
         return
     
     print("1. Probando base de datos...")
-    db_ok = test_database()
+    db_ok = _ejecutar(test_database)
     
     print("\n2. Probando aplicación Flask...")
-    flask_ok = test_flask_app()
+    with tempfile.TemporaryDirectory() as directorio:
+        flask_ok = _ejecutar(test_flask_app, pathlib.Path(directorio))
     
     print("\n=== RESULTADOS ===")
     if db_ok and flask_ok:
@@ -88,4 +1542,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
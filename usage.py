@@ -0,0 +1,90 @@
+"""
+Contadores de uso por usuario (tabla tenant_usage).
+
+Los contadores los mantienen los triggers creados en la migración 3 (y
+ampliados en la 11), por lo que los límites del paquete, las estadísticas del
+dashboard y las tarjetas de resumen de los listados se leen con una sola
+búsqueda por clave primaria. verify() y rebuild() permiten detectar y
+reparar diferencias con los datos reales.
+"""
+
+CONTADORES = (
+    'propiedades', 'propiedades_disponibles', 'inquilinos', 'contratos', 'contratos_activos',
+    # Totales de las tarjetas de resumen de los listados (migración 11)
+    'propiedades_alquiladas', 'valor_propiedades',
+    'inquilinos_con_email', 'inquilinos_con_telefono', 'inquilinos_con_dni',
+    'contratos_vencidos', 'ingresos_mensuales',
+)
+
+# Contadores de un usuario (búsqueda por clave primaria)
+CONTADORES_SQL = 'SELECT * FROM tenant_usage WHERE user_id = ?'
+
+# Importe en centavos, como lo guardan los triggers
+_CENTAVOS = 'CAST(ROUND(COALESCE({columna}, 0) * 100) AS INTEGER)'
+
+# Recuento real a partir de las tablas de datos, en el orden de CONTADORES
+RECUENTO_SQL = f'''
+    SELECT user_id, {', '.join(f'SUM({nombre}) AS {nombre}' for nombre in CONTADORES)}
+    FROM (
+        SELECT user_id, 1 AS propiedades, estado IS 'disponible' AS propiedades_disponibles,
+               0 AS inquilinos, 0 AS contratos, 0 AS contratos_activos,
+               estado IS 'alquilada' AS propiedades_alquiladas,
+               {_CENTAVOS.format(columna='precio')} AS valor_propiedades,
+               0 AS inquilinos_con_email, 0 AS inquilinos_con_telefono, 0 AS inquilinos_con_dni,
+               0 AS contratos_vencidos, 0 AS ingresos_mensuales
+        FROM propiedades
+        UNION ALL
+        SELECT user_id, 0, 0, 1, 0, 0, 0, 0,
+               COALESCE(email, '') != '', COALESCE(telefono, '') != '', COALESCE(dni, '') != '', 0, 0
+        FROM inquilinos
+        UNION ALL
+        SELECT user_id, 0, 0, 0, 1, estado IS 'activo', 0, 0, 0, 0, 0,
+               estado IS 'vencido', {_CENTAVOS.format(columna='precio_mensual')}
+        FROM contratos
+    )
+    GROUP BY user_id
+'''
+
+
+def get_usage(conn, user_id):
+    """Contadores de un usuario (ceros si todavía no tiene datos)"""
+    row = conn.execute(CONTADORES_SQL, (user_id,)).fetchone()
+    if row is None:
+        return dict.fromkeys(CONTADORES, 0)
+    return {nombre: row[nombre] for nombre in CONTADORES}
+
+
+def verify(conn):
+    """Comparar tenant_usage con los datos reales.
+
+    Devuelve una lista de (user_id, contador, guardado, real) con cada diferencia.
+    """
+    reales = {row[0]: row[1:] for row in conn.execute(RECUENTO_SQL)}
+    guardados = {
+        row[0]: row[1:]
+        for row in conn.execute(f'SELECT user_id, {", ".join(CONTADORES)} FROM tenant_usage')
+    }
+
+    ceros = (0,) * len(CONTADORES)
+    diferencias = []
+    for user_id in sorted(set(reales) | set(guardados)):
+        real = tuple(reales.get(user_id, ceros))
+        guardado = tuple(guardados.get(user_id, ceros))
+        for nombre, valor_guardado, valor_real in zip(CONTADORES, guardado, real):
+            if valor_guardado != valor_real:
+                diferencias.append((user_id, nombre, valor_guardado, valor_real))
+    return diferencias
+
+
+def rebuild(conn):
+    """Recalcular los contadores de tenant_usage (la transacción la confirma quien llama).
+
+    Las filas se actualizan en lugar de borrarse para conservar la marca de
+    modificación (cambios, modificado) de la que salen los ETag.
+    """
+    conn.execute(f'UPDATE tenant_usage SET {", ".join(f"{nombre} = 0" for nombre in CONTADORES)}')
+    conn.execute(f'''
+        INSERT INTO tenant_usage (user_id, {", ".join(CONTADORES)})
+        {RECUENTO_SQL}
+        ON CONFLICT (user_id) DO UPDATE SET {", ".join(f"{nombre} = excluded.{nombre}" for nombre in CONTADORES)}
+    ''')
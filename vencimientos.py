@@ -0,0 +1,62 @@
+"""
+Contratos activos próximos a vencer.
+
+La consulta recorre solo el rango de fechas pedido en el índice
+idx_contratos_user_estado_fin (user_id, estado, fecha_fin) y calcula los días
+restantes en SQL, así el navegador no hace cuentas de fechas por fila.
+"""
+
+from datetime import date, timedelta
+
+DEFAULT_DIAS = 30
+MAX_DIAS = 365
+DEFAULT_LIMIT = 50
+
+# Días hasta el vencimiento, a partir de una fecha ISO
+DIAS_RESTANTES_SQL = "CAST(julianday({columna}) - julianday({hoy}) AS INTEGER)"
+
+# Contratos activos del usuario que vencen entre dos fechas, los más próximos primero
+POR_VENCER_SQL = f'''
+    SELECT c.id, c.fecha_fin, c.precio_mensual, p.direccion, i.nombre, i.apellido,
+           {DIAS_RESTANTES_SQL.format(columna='c.fecha_fin', hoy=':hoy')} AS dias_restantes
+    FROM contratos c
+    JOIN propiedades p ON c.propiedad_id = p.id
+    JOIN inquilinos i ON c.inquilino_id = i.id
+    WHERE c.user_id = :user_id AND c.estado = 'activo' AND c.fecha_fin BETWEEN :hoy AND :hasta
+    ORDER BY c.fecha_fin
+    LIMIT :limite
+'''
+
+
+def dias_param(valor, default=DEFAULT_DIAS):
+    """Días pedidos en la URL, acotados a [1, MAX_DIAS]"""
+    try:
+        dias = int(valor if valor is not None else default)
+    except (TypeError, ValueError):
+        dias = default
+    return max(1, min(dias, MAX_DIAS))
+
+
+def por_vencer(conn, user_id, dias=DEFAULT_DIAS, hoy=None, limite=DEFAULT_LIMIT):
+    """Contratos activos que vencen entre hoy y hoy + dias, los más próximos primero"""
+    hoy = hoy or date.today()
+    return conn.execute(POR_VENCER_SQL, {
+        'user_id': user_id, 'hoy': hoy.isoformat(),
+        'hasta': (hoy + timedelta(days=dias)).isoformat(), 'limite': limite,
+    }).fetchall()
+
+
+def serializar(rows, url_for):
+    """Resultados listos para jsonify"""
+    return [
+        {
+            'id': row['id'],
+            'direccion': row['direccion'],
+            'inquilino': f"{row['nombre']} {row['apellido']}",
+            'fecha_fin': row['fecha_fin'],
+            'dias_restantes': row['dias_restantes'],
+            'precio_mensual': row['precio_mensual'],
+            'url': url_for('editar_contrato', id=row['id']),
+        }
+        for row in rows
+    ]